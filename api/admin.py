@@ -0,0 +1,29 @@
+# api/admin.py
+from fastapi import APIRouter, Header, HTTPException
+import hmac
+import os
+
+from shared.config.reload import request_reload
+
+router = APIRouter()
+
+
+def _check_token(token: str) -> None:
+    # ADMIN_API_TOKEN не задан — служебные эндпоинты выключены
+    expected = os.getenv("ADMIN_API_TOKEN") or ""
+    if not expected or not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="forbidden")
+
+
+@router.post("/admin/config/reload")
+async def reload_config(x_admin_token: str = Header(default="")):
+    """
+    Перечитывает .env и YAML бота без перезапуска.
+    Остальные воркеры подхватывают изменения через shared state.
+    """
+    _check_token(x_admin_token)
+    try:
+        changed = await request_reload()
+    except Exception as exc:
+        return {"status": "error", "error": f"Config rejected: {exc}"}
+    return {"status": "reloaded", "changed": sorted(changed)}
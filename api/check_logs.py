@@ -1,6 +1,12 @@
 # api/check_logs.py
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 import os
+import re
+import time
+from typing import AsyncIterator, List, Optional, Tuple
 
 # Используем переменную окружения LOG_FILE_PATH или путь по умолчанию
 def _log_file_path() -> str:
@@ -8,21 +14,248 @@ def _log_file_path() -> str:
 
 router = APIRouter()
 
+# REGION AI: log tail & follow
+# Файл читается с конца блоками, весь лог в память не попадает; всё
+# файловое I/O — в asyncio.to_thread, чтобы не блокировать event loop.
+LOG_TAIL_MAX_LINES = 5000
+LOG_TAIL_BLOCK = 64 * 1024
+LOG_TAIL_MAX_SCAN = int(os.getenv("LOG_TAIL_MAX_SCAN", str(64 * 1024 * 1024)))  # байт за запрос с фильтром
+LOG_FOLLOW_POLL = float(os.getenv("LOG_FOLLOW_POLL", "0.5"))
+LOG_FOLLOW_HEARTBEAT = 15.0
+LOG_FOLLOW_CHUNK = 256 * 1024
+
+_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "WARN": 30, "ERROR": 40, "CRITICAL": 50, "FATAL": 50}
+# basicConfig по умолчанию: "LEVEL:logger:message"
+_COLON_RE = re.compile(r"^(DEBUG|INFO|WARNING|ERROR|CRITICAL):([^:\s]+):")
+
+
+def _parse(line: str) -> Tuple[Optional[int], Optional[str]]:
+    """(уровень, логгер) строки лога; ``None`` — если формат не распознан.
+
+    Понимает формат ``basicConfig``, текстовый формат ``shared.utils.logging``
+    (``time | bot_id | module | corr_id | LEVEL | message``) и JSON-строки
+    (``LOG_FORMAT=json``).
+    """
+    if line.startswith("{"):
+        try:
+            rec = json.loads(line)
+            return _LEVELS.get(str(rec.get("level", "")).upper()), rec.get("logger")
+        except (ValueError, AttributeError):
+            pass
+    m = _COLON_RE.match(line)
+    if m:
+        return _LEVELS[m.group(1)], m.group(2)
+    parts = line.split(" | ", 5)
+    if len(parts) >= 6 and parts[4].strip() in _LEVELS:
+        return _LEVELS[parts[4].strip()], parts[2].strip()
+    return None, None
+
+
+class _Filter:
+    def __init__(self, level: Optional[str], logger: Optional[str], contains: Optional[str]) -> None:
+        self.level = _LEVELS.get((level or "").upper()) if level else None
+        self.logger = logger or None
+        self.contains = contains or None
+
+    def __call__(self, line: str) -> bool:
+        if self.contains and self.contains not in line:
+            return False
+        if self.level is None and self.logger is None:
+            return True
+        lvl, name = _parse(line)
+        if self.level is not None and (lvl is None or lvl < self.level):
+            return False
+        if self.logger is not None and (name is None or not (name == self.logger or name.startswith(self.logger + "."))):
+            return False
+        return True
+
+
+def _tail(path: str, n: int, before: Optional[int], flt: _Filter) -> dict:
+    """Последние ``n`` подходящих строк, заканчивающихся до байта ``before``.
+
+    ``next_before`` — смещение начала самой ранней прочитанной строки:
+    передайте его как ``before``, чтобы получить предыдущую страницу
+    (``None`` — достигнуто начало файла).
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size if before is None else max(0, min(int(before), size))
+        pos = end
+        carry = b""
+        out: List[str] = []
+        scanned = 0
+        while pos > 0 and len(out) < n and scanned < LOG_TAIL_MAX_SCAN:
+            step = min(LOG_TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + carry
+            scanned += step
+            lines = chunk.split(b"\n")
+            # первая строка блока может быть неполной — доклеим к следующему блоку
+            carry = lines.pop(0) if pos > 0 else b""
+            line_end = pos + len(chunk)
+            for raw in reversed(lines):
+                line_start = line_end - len(raw)
+                line_end = line_start - 1  # минус "\n"
+                if not raw:
+                    continue
+                text = raw.decode("utf-8", errors="replace").rstrip("\r")
+                if flt(text):
+                    out.append(text)
+                    if len(out) >= n:
+                        pos = line_start
+                        carry = b""
+                        break
+        out.reverse()
+        # упёрлись в LOG_TAIL_MAX_SCAN — неразобранный хвост блока войдёт в следующую страницу
+        cursor = pos + len(carry)
+        return {
+            "logs": out,
+            "next_before": cursor if cursor > 0 else None,
+            "offset": size,
+        }
+
+
 @router.get("/logs")
-async def get_logs():
+async def get_logs(
+    n: int = Query(100, ge=1, le=LOG_TAIL_MAX_LINES),
+    level: Optional[str] = Query(None, description="минимальный уровень: DEBUG…CRITICAL"),
+    logger: Optional[str] = Query(None, description="имя логгера (с дочерними)"),
+    contains: Optional[str] = Query(None, description="подстрока"),
+    before: Optional[int] = Query(None, ge=0, description="байтовое смещение: строки до него"),
+):
     """
-    Возвращает последние 100 строк из лог-файла.
+    Возвращает последние ``n`` строк лог-файла (по умолчанию 100) с
+    необязательным фильтром по уровню, логгеру и подстроке.
     Если файл не найден, возвращает пустой список.
+
+    ``next_before`` из ответа — курсор на предыдущую страницу,
+    ``offset`` — конец файла (старт для ``/logs/follow``).
     """
     path = _log_file_path()
     if not os.path.exists(path):
         return {"logs": []}
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            lines = f.read().splitlines()[-100:]
+        return await asyncio.to_thread(_tail, path, n, before, _Filter(level, logger, contains))
     except Exception as exc:
         return {"error": f"Cannot read log file: {exc}"}
-    return {"logs": lines}
+
+
+def _file_id(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class _Follower:
+    """Читает дописанное в файл; переоткрывает его после ротации/усечения."""
+
+    def __init__(self, path: str, offset: Optional[int]) -> None:
+        self.path = path
+        self.f = None
+        self.ident: Optional[Tuple[int, int]] = None
+        self.pos = 0
+        self.buf = b""
+        self._open(offset)
+
+    def _open(self, offset: Optional[int]) -> None:
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            self.f, self.ident = None, None
+            return
+        st = os.fstat(f.fileno())
+        self.f, self.ident = f, (st.st_dev, st.st_ino)
+        self.pos = st.st_size if offset is None else max(0, min(int(offset), st.st_size))
+        self.buf = b""
+
+    def close(self) -> None:
+        if self.f:
+            self.f.close()
+            self.f = None
+
+    def read(self) -> List[Tuple[int, str]]:
+        """Новые полные строки как (смещение конца строки, текст)."""
+        out: List[Tuple[int, str]] = []
+        if self.f is None:
+            self._open(0)
+            if self.f is None:
+                return out
+        out += self._drain()
+        current = _file_id(self.path)
+        size = os.fstat(self.f.fileno()).st_size
+        if current != self.ident or size < self.pos:
+            # ротация (новый inode) или truncate: дочитали старый — начинаем новый с нуля
+            self.close()
+            self._open(0)
+            if self.f is not None:
+                out += self._drain()
+        return out
+
+    def _drain(self) -> List[Tuple[int, str]]:
+        out: List[Tuple[int, str]] = []
+        self.f.seek(self.pos)
+        while True:
+            data = self.f.read(LOG_FOLLOW_CHUNK)
+            if not data:
+                break
+            end = self.pos - len(self.buf)  # смещение начала незавершённой строки
+            self.pos += len(data)
+            *lines, self.buf = (self.buf + data).split(b"\n")
+            for raw in lines:
+                end += len(raw) + 1
+                if raw:
+                    out.append((end, raw.decode("utf-8", errors="replace").rstrip("\r")))
+        return out
+
+
+async def _follow(request: Request, path: str, offset: Optional[int], flt: _Filter) -> AsyncIterator[str]:
+    follower = await asyncio.to_thread(_Follower, path, offset)
+    last_beat = time.monotonic()
+    try:
+        yield "retry: 2000\n\n"
+        while not await request.is_disconnected():
+            lines = await asyncio.to_thread(follower.read)
+            sent = False
+            for end, line in lines:
+                if flt(line):
+                    yield f"id: {end}\ndata: {json.dumps(line, ensure_ascii=False)}\n\n"
+                    sent = True
+            if sent:
+                last_beat = time.monotonic()
+            elif time.monotonic() - last_beat >= LOG_FOLLOW_HEARTBEAT:
+                yield ": ping\n\n"  # держим соединение живым через прокси
+                last_beat = time.monotonic()
+            if not lines:
+                await asyncio.sleep(LOG_FOLLOW_POLL)
+    finally:
+        await asyncio.to_thread(follower.close)
+
+
+@router.get("/logs/follow")
+async def follow_logs(
+    request: Request,
+    level: Optional[str] = Query(None),
+    logger: Optional[str] = Query(None),
+    contains: Optional[str] = Query(None),
+    offset: Optional[int] = Query(None, ge=0, description="с какого байта (по умолчанию — с конца)"),
+):
+    """
+    Server-Sent Events: новые строки лога по мере записи (``tail -F``).
+    ``id`` события — смещение в файле; после переподключения браузер
+    пришлёт его в ``Last-Event-ID`` и поток продолжится с того же места.
+    """
+    last_id = request.headers.get("last-event-id", "")
+    if offset is None and last_id.isdigit():
+        offset = int(last_id)
+    return StreamingResponse(
+        _follow(request, _log_file_path(), offset, _Filter(level, logger, contains)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+# END REGION AI
 
 @router.post("/logs/clean")
 async def clean_logs():
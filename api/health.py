@@ -1,4 +1,4 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 import os
 
 try:
@@ -21,3 +21,14 @@ async def readyz():
 @router.get("/livez")
 async def livez():
     return {"alive": True}
+
+
+# REGION AI: prometheus metrics endpoint
+@router.get("/metrics")
+async def metrics():
+    try:
+        from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    except Exception:
+        return Response(status_code=404)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+# END REGION AI
@@ -3,6 +3,7 @@ from api.webhook import router as webhook_router
 from api.payments import router as payments_router
 from api.health import router as health_router
 from api.check_logs import router as logs_router
+from api.admin import router as admin_router
 
 app = FastAPI(title="JuicyFox API", version="1.0.0")
 
@@ -13,4 +14,5 @@ app.include_router(webhook_router)
 app.include_router(payments_router, prefix="/payments")
 app.include_router(health_router)
 app.include_router(logs_router)
+app.include_router(admin_router)
 
@@ -2,6 +2,8 @@
 from fastapi import APIRouter, Request
 from modules.payments import normalize_webhook
 from modules.access import process_payment_event
+from shared.db.repo import restore_pending_invoice, take_pending_invoice
+from contextlib import suppress
 import logging
 
 log = logging.getLogger("juicyfox.api.payments")
@@ -21,9 +23,49 @@ async def cryptobot_webhook(request: Request):
     norm = normalize_webhook(payload)
     log.info("payment webhook received: %s", norm)
 
-    # 3) обрабатываем событие (выдача инвайта при status=='paid')
-    result = await process_payment_event(norm)
-    log.info("payment processed: %s", result)
+    # REGION AI: tenant-aware payments
+    # счёт принадлежит боту из meta.bot_id: его БД (pending_invoices, ключи
+    # идемпотентности, сроки) и его Bot для инвайта/подтверждения
+    registry = _registry()
+    bot_id = str((norm.get("meta") or {}).get("bot_id") or "")
+    tenant = registry.get(bot_id) if bot_id else registry.primary
+    if tenant is None:
+        log.warning("payment webhook for unknown bot_id=%s: %s", bot_id, norm.get("invoice_id"))
+        return {"ok": True, "handled": False, "reason": "unknown bot"}
+    with registry.use(tenant):
+        result = await _process(norm, tenant.bot)
+    # END REGION AI
 
     # 4) всегда 200 OK для провайдера, подробности — в теле ответа/логах
     return {"ok": True, **result}
+
+
+# REGION AI: tenant-aware payments
+def _registry():
+    # ленивый импорт, чтобы не ловить циклические зависимости (как в api/webhook.py)
+    from apps.bot_core.main import tenants
+
+    return tenants
+
+
+async def _process(norm: dict, bot) -> dict:
+    """Закрыть счёт и выдать доступ в контексте бота-владельца счёта."""
+    # REGION AI: invoice reconciliation
+    # забираем счёт, чтобы сверка (modules/payments/reconcile.py) его не трогала
+    pending = None
+    if norm.get("status") in ("paid", "expired", "cancelled") and norm.get("invoice_id"):
+        with suppress(Exception):
+            pending = await take_pending_invoice(str(norm["invoice_id"]))
+    # END REGION AI
+
+    # 3) обрабатываем событие (выдача инвайта при status=='paid')
+    result = await process_payment_event(norm, bot=bot)
+    log.info("payment processed: %s", result)
+
+    # REGION AI: invoice reconciliation
+    if pending is not None and result.get("error"):
+        # выдача не удалась — вернём счёт, следующая сверка попробует снова
+        await restore_pending_invoice(pending)
+    # END REGION AI
+    return result
+# END REGION AI
@@ -6,21 +6,43 @@ Plan A — единый entrypoint:
 - Модули подключаются централизованно
 - Webhook ставится на старте
 """
+# REGION AI: startup timings
+import time
+_T0 = time.perf_counter()
+# END REGION AI
 from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import asyncio
 import logging
 from contextlib import suppress
+from typing import Dict, List, Optional
 
 from fastapi import FastAPI, Request
-from aiogram import Bot, Dispatcher
+from aiogram import Dispatcher
 from aiogram.types import Update
 
 from apps.bot_core.middleware import register_middlewares
 from apps.bot_core.routers import register as register_routers
-from api.main import logs_router
+# роутер логов берём напрямую: api.main тянет за собой всё API-приложение
+from api.check_logs import router as logs_router
+from shared.config.env import config
 from shared.db.repo import init_db
+# REGION AI: persistent FSM storage
+from shared.db.fsm_storage import SQLiteStorage
+# END REGION AI
+
+# REGION AI: startup timings
+# Время фаз старта (мс): импорт, создание ботов, роутеры, init_db, webhook…
+STARTUP_TIMINGS: Dict[str, float] = {"imports": (time.perf_counter() - _T0) * 1000}
+
+
+def _mark(phase: str, since: float) -> float:
+    now = time.perf_counter()
+    STARTUP_TIMINGS[phase] = (now - since) * 1000
+    return now
+# END REGION AI
 
 
 # ---------- Обязательные ENV ----------
@@ -33,14 +55,56 @@ if not TELEGRAM_TOKEN or not BOT_ID:
     raise RuntimeError("Missing required env: TELEGRAM_TOKEN or BOT_ID")
 
 # ---------- Логирование ----------
-logging.basicConfig(level=os.getenv("LOGLEVEL", "INFO"))
+# REGION AI: structured logging pipeline
+# Очередь + поток-писатель, LOG_FORMAT=json, ротация, LOG_SAMPLE (shared/utils/logging.py)
+from shared.utils.logging import setup_logging
+
+setup_logging()
+# END REGION AI
 log = logging.getLogger("juicyfox.app")
 
 # ---------- aiogram ----------
-bot = Bot(token=TELEGRAM_TOKEN)
-dp = Dispatcher()
+# REGION AI: multi-bot runtime
+# Основной бот + боты из BOT_IDS (apps/bot_core/tenants.py): одна сессия,
+# один Dispatcher и одно дерево роутеров на все токены.
+from apps.bot_core.tenants import TenantMiddleware, build_registry
+
+_t = time.perf_counter()
+tenants = build_registry(TELEGRAM_TOKEN, BOT_ID, config if config.bot_id == BOT_ID else None)
+bot = tenants.primary.bot
+_t = _mark("bots", _t)
+# END REGION AI
+# REGION AI: hot reload
+from shared.config.env import on_reload
+
+on_reload(tenants.reload_configs)
+# END REGION AI
+# REGION AI: persistent FSM storage
+# FSM_STORAGE=memory — вернуть in-memory хранилище aiogram (только один воркер!);
+# FSM_STORAGE=redis — RedisStorage aiogram на STATE_REDIS_URL (нужен пакет redis)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+if FSM_STORAGE == "memory":
+    dp = Dispatcher()
+elif FSM_STORAGE == "redis":
+    from aiogram.fsm.storage.redis import RedisStorage
+    from shared.db.state import STATE_REDIS_URL
+
+    dp = Dispatcher(storage=RedisStorage.from_url(STATE_REDIS_URL))
+else:
+    dp = Dispatcher(storage=SQLiteStorage())
+# END REGION AI
+dp.update.outer_middleware(TenantMiddleware(tenants))
 register_middlewares(dp)
-register_routers(dp, cfg=None)
+# REGION AI: lazy routers by feature flags
+# Импортируются только модули, включённые хотя бы у одного бота
+# (features.* в configs/bots/<bot_id>.yaml).
+_features = {
+    name: any(getattr(t.config.features, name) for t in tenants)
+    for name in ("posting_enabled", "chat_enabled", "history_enabled")
+}
+register_routers(dp, cfg={"features": _features}, timings=STARTUP_TIMINGS)
+_t = _mark("routers", _t)
+# END REGION AI
 
 # ---------- FastAPI ----------
 app = FastAPI(title="JuicyFox (Plan A)")
@@ -59,26 +123,198 @@ with suppress(Exception):
     from api.health import router as health_router
     app.include_router(health_router)
 
+# REGION AI: hot reload
+with suppress(Exception):
+    from api.admin import router as admin_router
+    app.include_router(admin_router)
+# END REGION AI
+
+_mark("api", _t)
+
 # ---------- Webhook (основной роут) ----------
 @app.post("/bot/{bot_id}/webhook")
 async def telegram_webhook(bot_id: str, request: Request):
     try:
         data = await request.json()
-        log.info("📩 Incoming update for %s: %s", bot_id, data)  # 👈 логируем апдейт
-        update = Update.model_validate(data, context={"bot": bot})
-        await dp.feed_webhook_update(bot, update)
+        # REGION AI: structured logging pipeline
+        # полный дамп апдейта — только на DEBUG: на INFO он сериализовался бы на каждом запросе
+        log.info("📩 Incoming update for %s: update_id=%s", bot_id, data.get("update_id"))
+        log.debug("📩 Update payload for %s: %s", bot_id, data)
+        # END REGION AI
+        tenant = tenants.get(bot_id)
+        if tenant is None:
+            log.warning("Webhook for unknown bot_id=%s", bot_id)
+            return {"ok": False}
+        update = Update.model_validate(data, context={"bot": tenant.bot})
+        await dp.feed_webhook_update(tenant.bot, update)
         return {"ok": True}
     except Exception as e:
         log.exception("❌ Webhook error: %s", e)
         return {"ok": False}
 
 # ---------- Webhook lifecycle ----------
+_background_tasks: List[asyncio.Task] = []
+# REGION AI: access expiry engine
+# Отзыв истёкших VIP/чат-доступов (modules/access/expiry.py)
+ACCESS_EXPIRY_ENABLED = os.getenv("ACCESS_EXPIRY_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+# END REGION AI
+# REGION AI: renewal reminders
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+# END REGION AI
+_config_watch_task: Optional[asyncio.Task] = None
+
+
+# REGION AI: idempotent webhook registration
+async def _ensure_webhook(tenant_bot, url: str, allowed_updates: List[str]) -> bool:
+    """set_webhook только если URL или allowed_updates отличаются от текущих."""
+    with suppress(Exception):
+        info = await tenant_bot.get_webhook_info()
+        if info.url == url and sorted(info.allowed_updates or []) == sorted(allowed_updates):
+            return False
+    await tenant_bot.set_webhook(url, allowed_updates=allowed_updates)
+    return True
+# END REGION AI
+
+
 @app.on_event("startup")
 async def on_startup():
-    await init_db()
-    url = WEBHOOK_URL or (f"{BASE_URL}/bot/{BOT_ID}/webhook" if BASE_URL else None)
-    if not url:
+    t = time.perf_counter()
+    # REGION AI: multi-bot runtime
+    for tenant in tenants:
+        with tenants.use(tenant):
+            await init_db()
+    # END REGION AI
+    t = _mark("init_db", t)
+    # REGION AI: warm media file_id cache
+    with suppress(Exception):
+        from shared.utils.media import preload as preload_media
+        await preload_media(bot.id)
+    # END REGION AI
+    t = _mark("media", t)
+    # REGION AI: message retention (hot → archive)
+    from shared.db.archive import RETENTION_DAYS, retention_loop
+    if RETENTION_DAYS > 0:
+        for tenant in tenants:
+            with tenants.use(tenant):  # задача наследует контекст (БД) бота
+                _background_tasks.append(asyncio.create_task(retention_loop()))
+    # END REGION AI
+    # REGION AI: relay message map
+    from shared.db.archive import RELAY_MAP_KEEP_DAYS, relay_map_loop
+    if RELAY_MAP_KEEP_DAYS > 0:
+        for tenant in tenants:
+            with tenants.use(tenant):
+                _background_tasks.append(asyncio.create_task(relay_map_loop()))
+    # END REGION AI
+    # REGION AI: access expiry engine
+    if ACCESS_EXPIRY_ENABLED:
+        from modules.access.expiry import expiry_loop
+        for tenant in tenants:
+            with tenants.use(tenant):
+                _background_tasks.append(asyncio.create_task(expiry_loop(tenant.bot)))
+    # END REGION AI
+    # REGION AI: renewal reminders
+    if REMINDERS_ENABLED:
+        from modules.access.reminders import reminder_loop
+        for tenant in tenants:
+            with tenants.use(tenant):
+                _background_tasks.append(asyncio.create_task(reminder_loop(tenant.bot)))
+    # END REGION AI
+    # REGION AI: invite-link pool
+    from modules.access import pool_chat_ids
+    from modules.access.invite_pool import INVITE_POOL_SIZE, pool_loop
+    if INVITE_POOL_SIZE > 0:
+        for tenant in tenants:
+            with tenants.use(tenant):
+                _background_tasks.append(asyncio.create_task(pool_loop(tenant.bot, pool_chat_ids())))
+    # END REGION AI
+    # REGION AI: invoice reconciliation
+    from modules.payments.reconcile import reconcile_loop
+    for tenant in tenants:
+        with tenants.use(tenant):
+            _background_tasks.append(asyncio.create_task(reconcile_loop(tenant.bot)))
+    # END REGION AI
+    # REGION AI: pending invoice TTL
+    from modules.payments.sweeper import sweep_loop
+    for tenant in tenants:
+        with tenants.use(tenant):
+            _background_tasks.append(asyncio.create_task(sweep_loop()))
+    # END REGION AI
+    # REGION AI: hot reload
+    global _config_watch_task
+    from shared.config.reload import install_sighup, watch_loop
+    if not install_sighup():
+        log.info("SIGHUP reload unavailable on this platform")
+    _config_watch_task = asyncio.create_task(watch_loop())
+    # END REGION AI
+    if not (WEBHOOK_URL or BASE_URL):
         log.warning("WEBHOOK_URL/BASE_URL not set; webhook skipped")
+        _report_startup()
         return
-    await bot.set_webhook(url)
-    log.info("Webhook set to %s", url)
+    # REGION AI: multi-bot runtime
+    allowed_updates = dp.resolve_used_update_types()
+
+    async def _setup(tenant) -> None:
+        if tenant is tenants.primary and WEBHOOK_URL:
+            url = WEBHOOK_URL
+        elif BASE_URL:
+            url = f"{BASE_URL}/bot/{tenant.bot_id}/webhook"
+        else:
+            log.warning("BASE_URL not set; webhook for %s skipped", tenant.bot_id)
+            return
+        try:
+            if await _ensure_webhook(tenant.bot, url, allowed_updates):
+                log.info("Webhook set to %s", url)
+            else:
+                log.info("Webhook already set to %s", url)
+        except Exception as e:
+            log.error("Webhook for %s failed: %s", tenant.bot_id, e)
+
+    await asyncio.gather(*(_setup(tenant) for tenant in tenants))
+    # END REGION AI
+    _mark("webhook", t)
+    _report_startup()
+
+
+# REGION AI: startup timings
+def _report_startup() -> None:
+    STARTUP_TIMINGS["total"] = (time.perf_counter() - _T0) * 1000
+    log.info(
+        "startup timings (ms): %s",
+        ", ".join(f"{phase}={ms:.0f}" for phase, ms in STARTUP_TIMINGS.items()),
+    )
+# END REGION AI
+
+
+# REGION AI: flush FSM storage on shutdown
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in [*_background_tasks, _config_watch_task]:
+        if task is None:
+            continue
+        task.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await task
+    with suppress(Exception):
+        await dp.storage.close()
+    with suppress(Exception):
+        from shared.db.state import get_state
+        await get_state().close()
+    # REGION AI: provider gateway
+    with suppress(Exception):
+        from modules.payments.providers import close_providers
+        await close_providers()
+    # END REGION AI
+    # REGION AI: database connection pools
+    with suppress(Exception):
+        from shared.db.router import close_all as close_db_pools
+        await close_db_pools()
+    # END REGION AI
+    # REGION AI: shared Telegram sessions
+    # сессия бота — одна из общих (tenants.build_registry), закрываем все разом
+    with suppress(Exception):
+        from shared.utils.telegram import close_sessions
+        await close_sessions()
+    # END REGION AI
+    with suppress(Exception):
+        await bot.session.close()
+# END REGION AI
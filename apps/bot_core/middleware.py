@@ -1,16 +1,251 @@
 """
-Middleware registry for aiogram (stub version).
+Middleware registry for aiogram.
 Here you can connect logging, rate limiting, error handlers, tracing, etc.
+
+Flood control (``FloodControlMiddleware``) is registered as an outer
+``update`` middleware, so abusive traffic is shed before routers, filters
+and handlers run — i.e. before any SQLite work.
 """
 
-from aiogram import Dispatcher
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Set
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from shared.config.env import on_reload
+from shared.utils.metrics import Counter, Gauge
+
+log = logging.getLogger("juicyfox.middleware")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+def _env_ids(*names: str) -> Set[int]:
+    """Собрать множество числовых id из нескольких ENV (через запятую)."""
+    out: Set[int] = set()
+    for name in names:
+        for part in (os.getenv(name) or "").replace(";", ",").split(","):
+            part = part.strip()
+            if part.lstrip("-").isdigit() and int(part) != 0:
+                out.add(int(part))
+    return out
+
+
+# REGION AI: flood control
+FLOOD_ENABLED = (os.getenv("FLOOD_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"})
+FLOOD_USER_RATE = _env_float("FLOOD_USER_RATE", 1.0)      # апдейтов в секунду на пользователя
+FLOOD_USER_BURST = _env_float("FLOOD_USER_BURST", 5.0)    # размер «пачки» на пользователя
+FLOOD_CHAT_RATE = _env_float("FLOOD_CHAT_RATE", 2.0)      # апдейтов в секунду на чат
+FLOOD_CHAT_BURST = _env_float("FLOOD_CHAT_BURST", 10.0)
+FLOOD_MAX_DELAY = _env_float("FLOOD_MAX_DELAY", 2.0)      # дольше — апдейт отбрасывается
+FLOOD_MAX_BUCKETS = int(_env_float("FLOOD_MAX_BUCKETS", 50000))
+# Рабочие группы операторов по умолчанию не лимитируются
+FLOOD_EXEMPT_GROUPS = (os.getenv("FLOOD_EXEMPT_GROUPS", "1").strip().lower() not in {"0", "false", "no", "off"})
+
+FLOOD_UPDATES = Counter(
+    "juicyfox_flood_updates_total",
+    "Updates seen by flood control, by scope and action",
+    ["scope", "action"],
+)
+FLOOD_BUCKETS = Gauge("juicyfox_flood_buckets", "Token buckets tracked by flood control", ["scope"])
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "ts")
+
+    def __init__(self, burst: float, now: float) -> None:
+        self.tokens = burst
+        self.ts = now
+
+    def refill(self, rate: float, burst: float, now: float) -> None:
+        self.tokens = min(burst, self.tokens + (now - self.ts) * rate)
+        self.ts = now
+
+    def wait_time(self, rate: float) -> float:
+        """Сколько секунд ждать до появления целого токена (0 — можно сейчас)."""
+        if self.tokens >= 1.0:
+            return 0.0
+        if rate <= 0:
+            return float("inf")
+        return (1.0 - self.tokens) / rate
+
+
+class _BucketTable:
+    """In-memory token buckets keyed by user/chat id with idle eviction."""
+
+    def __init__(self, scope: str, rate: float, burst: float, max_size: int) -> None:
+        self.scope = scope
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_size = max(1, max_size)
+        self._buckets: Dict[int, _TokenBucket] = {}
+
+    def resize(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+
+    def get(self, key: int, now: float) -> _TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_size:
+                self._prune(now)
+            bucket = self._buckets[key] = _TokenBucket(self.burst, now)
+            FLOOD_BUCKETS.labels(self.scope).set(len(self._buckets))
+        else:
+            bucket.refill(self.rate, self.burst, now)
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        # Полностью восстановившиеся корзины ничем не отличаются от новых
+        idle = [
+            k for k, b in self._buckets.items()
+            if b.tokens + (now - b.ts) * self.rate >= self.burst
+        ]
+        for k in idle:
+            del self._buckets[k]
+        if len(self._buckets) >= self.max_size:
+            # всё ещё переполнено — выкидываем самые давние
+            oldest = sorted(self._buckets, key=lambda k: self._buckets[k].ts)
+            for k in oldest[: len(self._buckets) - self.max_size + 1]:
+                del self._buckets[k]
+
+
+class FloodControlMiddleware(BaseMiddleware):
+    """
+    Token bucket per user and per chat.
+
+    Update passes immediately while both buckets have a token; if a token
+    becomes available within ``max_delay`` seconds the update is deferred
+    (slept), otherwise it is dropped before any handler runs.
+    """
+
+    def __init__(
+        self,
+        *,
+        user_rate: float = FLOOD_USER_RATE,
+        user_burst: float = FLOOD_USER_BURST,
+        chat_rate: float = FLOOD_CHAT_RATE,
+        chat_burst: float = FLOOD_CHAT_BURST,
+        max_delay: float = FLOOD_MAX_DELAY,
+        exempt_users: Iterable[int] = (),
+        exempt_chats: Iterable[int] = (),
+        exempt_groups: bool = FLOOD_EXEMPT_GROUPS,
+        max_buckets: int = FLOOD_MAX_BUCKETS,
+    ) -> None:
+        self.users = _BucketTable("user", user_rate, user_burst, max_buckets)
+        self.chats = _BucketTable("chat", chat_rate, chat_burst, max_buckets)
+        self.max_delay = max(0.0, max_delay)
+        self.exempt_users: Set[int] = set(exempt_users)
+        self.exempt_chats: Set[int] = set(exempt_chats)
+        self.exempt_groups = exempt_groups
+
+    # REGION AI: hot reload
+    def reconfigure(self, changed: FrozenSet[str] = frozenset()) -> None:
+        """Hook ``on_reload``: подстроить лимиты под новые FLOOD_* без рестарта.
+
+        Накопленные корзины сохраняются, меняются только rate/burst.
+        """
+        if changed and not any(k.startswith("FLOOD_") or k in _EXEMPT_ENV for k in changed):
+            return
+        self.users.resize(_env_float("FLOOD_USER_RATE", 1.0), _env_float("FLOOD_USER_BURST", 5.0))
+        self.chats.resize(_env_float("FLOOD_CHAT_RATE", 2.0), _env_float("FLOOD_CHAT_BURST", 10.0))
+        self.max_delay = max(0.0, _env_float("FLOOD_MAX_DELAY", 2.0))
+        self.exempt_users = _env_ids(*_EXEMPT_USER_ENV)
+        self.exempt_chats = _env_ids(*_EXEMPT_CHAT_ENV)
+        log.info(
+            "flood: limits reloaded user=%.2f/%.0f chat=%.2f/%.0f",
+            self.users.rate, self.users.burst, self.chats.rate, self.chats.burst,
+        )
+    # END REGION AI
+
+    def _is_exempt(self, user_id: Optional[int], chat: Any) -> bool:
+        if user_id is not None and user_id in self.exempt_users:
+            return True
+        if chat is None:
+            return False
+        if chat.id in self.exempt_chats:
+            return True
+        return self.exempt_groups and getattr(chat, "type", None) in {"group", "supergroup", "channel"}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        user_id = getattr(user, "id", None)
+        if (user_id is None and chat is None) or self._is_exempt(user_id, chat):
+            FLOOD_UPDATES.labels("any", "exempt").inc()
+            return await handler(event, data)
+
+        now = time.monotonic()
+        checks = []
+        if user_id is not None:
+            checks.append((self.users, self.users.get(user_id, now)))
+        if chat is not None and chat.id != user_id:
+            checks.append((self.chats, self.chats.get(chat.id, now)))
+
+        # лимитирующая корзина определяет и ожидание, и scope в метриках
+        wait, scope = max((bucket.wait_time(table.rate), table.scope) for table, bucket in checks)
+        if wait > self.max_delay:
+            FLOOD_UPDATES.labels(scope, "dropped").inc()
+            log.debug("flood: drop update user_id=%s chat_id=%s wait=%.2fs", user_id, getattr(chat, "id", None), wait)
+            return None
+
+        # Резервируем токен сразу (может уйти в минус), чтобы параллельные
+        # апдейты того же пользователя выстраивались в очередь, а не обгоняли.
+        for _, bucket in checks:
+            bucket.tokens -= 1.0
+        if wait > 0:
+            FLOOD_UPDATES.labels(scope, "deferred").inc()
+            await asyncio.sleep(wait)
+        else:
+            FLOOD_UPDATES.labels("any", "passed").inc()
+        return await handler(event, data)
+
+
+_EXEMPT_USER_ENV = ("FLOOD_EXEMPT_USER_IDS", "ADMIN_CHAT_ID")
+_EXEMPT_CHAT_ENV = (
+    "FLOOD_EXEMPT_CHAT_IDS",
+    "RELAY_GROUP_ID",
+    "CHAT_GROUP_ID",
+    "HISTORY_GROUP_ID",
+    "POST_PLAN_GROUP_ID",
+    "LOG_CHANNEL_ID",
+)
+_EXEMPT_ENV = frozenset(_EXEMPT_USER_ENV + _EXEMPT_CHAT_ENV)
+
+
+def build_flood_control() -> FloodControlMiddleware:
+    """Собрать middleware из ENV: операторы и админ-группы исключаются."""
+    middleware = FloodControlMiddleware(
+        exempt_users=_env_ids(*_EXEMPT_USER_ENV),
+        exempt_chats=_env_ids(*_EXEMPT_CHAT_ENV),
+    )
+    on_reload(middleware.reconfigure)
+    return middleware
+# END REGION AI
 
 
 def register_middlewares(dp: Dispatcher) -> None:
     """
     Register global middlewares for the bot.
-    Currently stub — extend later if needed.
     """
     # Example: dp.message.middleware(my_logging_middleware)
-    # Example: dp.update.middleware(my_rate_limit_middleware)
-    pass
+    # REGION AI: flood control registration
+    if FLOOD_ENABLED:
+        dp.update.outer_middleware(build_flood_control())
+    # END REGION AI
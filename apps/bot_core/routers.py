@@ -6,8 +6,10 @@
     register_routers(dp, cfg)   # cfg может быть dataclass, dict, Namespace или None
 """
 
+import importlib
+import time
 from contextlib import suppress
-from typing import Any
+from typing import Any, Dict, Optional
 
 from aiogram import Router
 
@@ -40,37 +42,37 @@ def _get_feature(cfg: Any, name: str, default: bool) -> bool:
     return default
 
 
-def register(dp, cfg: Any = None) -> None:
+def register(dp, cfg: Any = None, timings: Optional[Dict[str, float]] = None) -> None:
     """
     Подключает модульные роутеры.
     Всегда: ui_membership.
     По флагам (по умолчанию True/True/False): posting/chat_relay/history.
+    Модули выключенных фич не импортируются вовсе.
+    ``timings`` (если передан) получает время импорта каждого модуля, мс.
     """
     dp.include_router(router)
 
     # UI / меню / донаты / VIP / чат — базовый модуль
-    with suppress(Exception):
-        from modules.ui_membership import router as ui_router
-        dp.include_router(ui_router)
-
-    with suppress(Exception):
-        from modules.payments.handlers import router as payments_router
-        dp.include_router(payments_router)
+    _include(dp, "modules.ui_membership", timings)
+    _include(dp, "modules.payments.handlers", timings)
 
     # Планирование и постинг
     if _get_feature(cfg, "posting_enabled", True):
-        with suppress(Exception):
-            from modules.posting.handlers import router as posting_router
-            dp.include_router(posting_router)
+        _include(dp, "modules.posting.handlers", timings)
 
     # Пересылка в чат/из чата
     if _get_feature(cfg, "chat_enabled", True):
-        with suppress(Exception):
-            from modules.chat_relay.handlers import router as chat_router
-            dp.include_router(chat_router)
+        _include(dp, "modules.chat_relay.handlers", timings)
 
     # История/архив (опционально, обычно выключено)
     if _get_feature(cfg, "history_enabled", False):
-        with suppress(Exception):
-            from modules.history.handlers import router as history_router
-            dp.include_router(history_router)
+        _include(dp, "modules.history.handlers", timings)
+
+
+def _include(dp, module: str, timings: Optional[Dict[str, float]]) -> None:
+    """Импортировать ``module`` и подключить его ``router`` (ошибки не роняют старт)."""
+    t = time.perf_counter()
+    with suppress(Exception):
+        dp.include_router(importlib.import_module(module).router)
+    if timings is not None:
+        timings[f"router:{module.split('.')[1]}"] = (time.perf_counter() - t) * 1000
@@ -0,0 +1,216 @@
+# apps/bot_core/tenants.py
+"""
+Multi-bot runtime: несколько BOT_ID в одном процессе.
+
+Основной бот по-прежнему задаётся TELEGRAM_TOKEN/BOT_ID.  Дополнительные
+боты перечисляются в ``BOT_IDS`` (через запятую, ``*`` — все
+``configs/bots/*.yaml``).  Для каждого:
+
+- токен — ``TELEGRAM_TOKEN_<BOT_ID>`` или ``telegram_token`` из YAML;
+- БД — ``DB_PATH_<BOT_ID>``, ``db_path`` из YAML или ``<dir DB_PATH>/<bot_id>.sqlite``.
+
+Все ``Bot`` делят одну HTTP-сессию, один ``Dispatcher`` и одно дерево
+роутеров, поэтому лишний бот стоит лишь объекта ``Bot`` и ``Config``.
+``TenantMiddleware`` на время обработки апдейта связывает с контекстом
+конфиг (``shared.config.env.current_config``) и файл БД
+(``shared.db.repo.current_db_path``) бота, получившего апдейт.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterator, List, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject
+
+from shared.config import env as env_config
+from shared.config.env import Config, load_config, reset_current_config, set_current_config
+from shared.db import repo
+from shared.utils.logging import bind_corr_id, reset_corr_id
+from shared.utils.telegram import shared_session
+
+try:
+    import yaml  # type: ignore
+except ImportError:  # pragma: no cover
+    yaml = None
+
+log = logging.getLogger("juicyfox.tenants")
+
+CONFIGS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "configs", "bots"
+)
+
+
+@dataclass
+class Tenant:
+    bot_id: str
+    bot: Bot
+    config: Config
+    db_path: str
+
+
+def _env_key(bot_id: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in bot_id).upper()
+
+
+def _yaml_bot_ids() -> List[str]:
+    """bot_id всех YAML-конфигов (поле ``bot_id`` или имя файла)."""
+    out: List[str] = []
+    if not os.path.isdir(CONFIGS_DIR):
+        return out
+    for name in sorted(os.listdir(CONFIGS_DIR)):
+        if not name.endswith((".yaml", ".yml")):
+            continue
+        bot_id = os.path.splitext(name)[0]
+        if yaml:
+            try:
+                with open(os.path.join(CONFIGS_DIR, name), "r", encoding="utf-8") as f:
+                    bot_id = str((yaml.safe_load(f) or {}).get("bot_id") or bot_id)
+            except Exception as e:
+                log.warning("tenants: cannot read %s: %s", name, e)
+        out.append(bot_id)
+    return out
+
+
+def configured_bot_ids() -> List[str]:
+    raw = (os.getenv("BOT_IDS") or "").strip()
+    if raw == "*":
+        return _yaml_bot_ids()
+    return [part.strip() for part in raw.split(",") if part.strip()]
+
+
+class TenantRegistry:
+    """bot_id → Tenant; все боты используют общую aiohttp-сессию."""
+
+    def __init__(self, primary: Tenant) -> None:
+        self.primary = primary
+        self.session = primary.bot.session
+        self._by_id: Dict[str, Tenant] = {primary.bot_id: primary}
+        self._by_tg_id: Dict[int, Tenant] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(list(self._by_id.values()))
+
+    @property
+    def multi(self) -> bool:
+        return len(self._by_id) > 1
+
+    def add(self, bot_id: str) -> Optional[Tenant]:
+        if bot_id in self._by_id:
+            return self._by_id[bot_id]
+        try:
+            cfg = self._load_config(bot_id)
+        except RuntimeError as e:
+            log.warning("tenants: skip bot %s: %s", bot_id, e)
+            return None
+        tenant = Tenant(bot_id, Bot(token=cfg.telegram_token, session=self.session), cfg, cfg.db_path)
+        self._by_id[bot_id] = tenant
+        log.info("tenants: bot %s registered (db=%s)", bot_id, cfg.db_path)
+        return tenant
+
+    @staticmethod
+    def _load_config(bot_id: str) -> Config:
+        key = _env_key(bot_id)
+        # конфиг бота собираем без токена/БД/ID основного бота
+        env = {k: v for k, v in os.environ.items() if k not in {"TELEGRAM_TOKEN", "DB_PATH", "BOT_ID"}}
+        for name in ("TELEGRAM_TOKEN", "DB_PATH"):
+            value = os.getenv(f"{name}_{key}")
+            if value:
+                env[name] = value
+        cfg = load_config(bot_id, env=env)
+        if cfg.db_path in {repo.DB_PATH, Config.db_path}:
+            # БД по умолчанию у каждого бота своя
+            cfg.db_path = os.path.join(os.path.dirname(repo.DB_PATH), f"{bot_id}.sqlite")
+        return cfg
+
+    # REGION AI: hot reload
+    def reload_configs(self, changed: FrozenSet[str] = frozenset()) -> None:
+        """Hook для ``shared.config.env.on_reload``: подменить конфиги ботов.
+
+        Токен и файл БД живого бота не меняются — для этого нужен рестарт.
+        """
+        for tenant in self:
+            try:
+                if tenant is self.primary:
+                    cfg = env_config.config if env_config.config.bot_id == tenant.bot_id else load_config(tenant.bot_id)
+                else:
+                    cfg = self._load_config(tenant.bot_id)
+            except RuntimeError as e:
+                log.warning("tenants: keep old config of %s: %s", tenant.bot_id, e)
+                continue
+            if cfg.telegram_token != tenant.config.telegram_token or cfg.db_path != tenant.db_path:
+                log.warning("tenants: token/db_path change for %s needs a restart", tenant.bot_id)
+            cfg.telegram_token, cfg.db_path = tenant.config.telegram_token, tenant.db_path
+            tenant.config = cfg
+    # END REGION AI
+
+    def get(self, bot_id: str) -> Optional[Tenant]:
+        tenant = self._by_id.get(bot_id)
+        if tenant is None and not self.multi:
+            return self.primary  # одиночный режим: bot_id в URL не проверяем (как раньше)
+        return tenant
+
+    def for_bot(self, bot: Any) -> Tenant:
+        tg_id = getattr(bot, "id", None)
+        tenant = self._by_tg_id.get(tg_id) if tg_id is not None else None
+        if tenant is None:
+            tenant = next((t for t in self._by_id.values() if t.bot is bot or t.bot.id == tg_id), self.primary)
+            if tg_id is not None:
+                self._by_tg_id[tg_id] = tenant
+        return tenant
+
+    @contextmanager
+    def use(self, tenant: Tenant) -> Iterator[Tenant]:
+        """Связать конфиг и БД ``tenant`` с текущим контекстом."""
+        cfg_token = set_current_config(tenant.config)
+        db_token = repo.set_db_path(tenant.db_path)
+        try:
+            yield tenant
+        finally:
+            repo.reset_db_path(db_token)
+            reset_current_config(cfg_token)
+
+
+def build_registry(token: str, bot_id: str, config: Optional[Config] = None) -> TenantRegistry:
+    """Основной бот + все боты из ``BOT_IDS``."""
+    primary_cfg = config or load_config(bot_id)
+    # REGION AI: bot/session factory
+    # настроенная сессия с кулдаунами и общим бюджетом; общая для всех ботов реестра
+    session = shared_session()
+    # END REGION AI
+    primary = Tenant(bot_id, Bot(token=token, session=session), primary_cfg, repo.DB_PATH)
+    registry = TenantRegistry(primary)
+    for extra in configured_bot_ids():
+        if extra != bot_id:
+            registry.add(extra)
+    return registry
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Outer update middleware: контекст бота, получившего апдейт, + ``data['cfg']``."""
+
+    def __init__(self, registry: TenantRegistry) -> None:
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tenant = self.registry.for_bot(data.get("bot"))
+        data["cfg"] = tenant.config
+        data["tenant"] = tenant
+        # corr_id в логах = update_id (shared/utils/logging.py)
+        corr_token = bind_corr_id(str(getattr(event, "update_id", "") or "") or None)
+        try:
+            with self.registry.use(tenant):
+                return await handler(event, data)
+        finally:
+            reset_corr_id(corr_token)
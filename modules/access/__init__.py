@@ -4,7 +4,7 @@ from __future__ import annotations
 import os
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from aiogram import Bot
 
@@ -16,7 +16,9 @@ from shared.db.repo import (
     log_access_grant,
 )
 # END REGION AI
+from modules.access.invite_pool import claim_invite
 from shared.utils.idempotency import provider_key
+from shared.utils.outbound import TRANSACTIONAL, in_lane
 from shared.utils.telegram import send_with_retry
 
 log = logging.getLogger("juicyfox.access")
@@ -49,15 +51,34 @@ def _chat_id_for_plan(plan_code: str) -> int:
         raise
 
 
-async def grant(user_id: int, plan_code: str, *, bot: Optional[Bot] = None) -> Dict[str, Any]:
+# REGION AI: invite-link pool
+def pool_chat_ids() -> List[int]:
+    """Каналы планов с invite-ссылками — их пул держит modules/access/invite_pool.py."""
+    ids = set()
+    for plan_code in PLAN_MAP:
+        if plan_code.startswith("chat_"):
+            continue
+        try:
+            ids.add(_chat_id_for_plan(plan_code))
+        except (AccessError, ValueError):
+            continue
+    return sorted(ids)
+# END REGION AI
+
+
+@in_lane(TRANSACTIONAL)  # ссылка/подтверждение оплаты не ждут рассылок
+async def grant(user_id: int, plan_code: str, *, bot: Optional[Bot] = None, lang: Optional[str] = None) -> Dict[str, Any]:
     """
     Выдать доступ пользователю.
 
     Для чат-планов (``chat_*``) продлеваем доступ без invite-link, логируем срок,
     отправляем подтверждение пользователю и возвращаем ``{"plan_code", "days", "until"}``.
 
-    Для остальных планов создаём invite-link на 1 использование, возвращаем
+    Для остальных планов берём одноразовый invite-link из пула (или создаём
+    его, если пул пуст), возвращаем
     ``{"invite_link", "until"}`` и (опц.) отправляем ссылку пользователю.
+
+    ``lang`` запоминается для напоминаний о продлении (modules/access/reminders.py).
     """
     cfg = PLAN_MAP.get(plan_code)
     if not cfg:
@@ -91,6 +112,7 @@ async def grant(user_id: int, plan_code: str, *, bot: Optional[Bot] = None) -> D
             plan_code=plan_code,
             invite_link=None,
             until_ts=int(until.timestamp()),
+            lang=lang,
         )
 
         result = {"plan_code": plan_code, "days": days, "until": until.isoformat()}
@@ -115,16 +137,33 @@ async def grant(user_id: int, plan_code: str, *, bot: Optional[Bot] = None) -> D
     chat_id = _chat_id_for_plan(plan_code)
     until = datetime.now(timezone.utc) + timedelta(days=days)
 
-    # создаём персональную ссылку
-    link = await bot.create_chat_invite_link(
-        chat_id=chat_id,
-        name=f"{plan_code}:{user_id}",
-        expire_date=until,
-        member_limit=1,
-        creates_join_request=False,
+    # REGION AI: invite-link pool
+    # сначала — готовая ссылка из пула (modules/access/invite_pool.py)
+    invite_link = await claim_invite(chat_id, user_id)
+    if invite_link is None:
+        # создаём персональную ссылку
+        link = await bot.create_chat_invite_link(
+            chat_id=chat_id,
+            name=f"{plan_code}:{user_id}",
+            expire_date=until,
+            member_limit=1,
+            creates_join_request=False,
+        )
+        invite_link = link.invite_link
+    # END REGION AI
+
+    # REGION AI: access expiry
+    # срок VIP тоже нужен движку истечения и напоминаниям
+    await log_access_grant(
+        user_id=user_id,
+        plan_code=plan_code,
+        invite_link=invite_link,
+        until_ts=int(until.timestamp()),
+        lang=lang,
     )
+    # END REGION AI
 
-    result = {"invite_link": link.invite_link, "until": until.isoformat()}
+    result = {"invite_link": invite_link, "until": until.isoformat()}
     log.info("access.grant: plan=%s user=%s chat=%s until=%s",
              plan_code, user_id, chat_id, result["until"])
 
@@ -133,7 +172,7 @@ async def grant(user_id: int, plan_code: str, *, bot: Optional[Bot] = None) -> D
         await send_with_retry(
             bot.send_message,
             user_id,
-            f"✅ Доступ по плану **{plan_code}**. Срок до {until.date()}\nСсылка: {link.invite_link}",
+            f"✅ Доступ по плану **{plan_code}**. Срок до {until.date()}\nСсылка: {invite_link}",
             parse_mode="Markdown",
             logger=log,
         )
@@ -143,11 +182,12 @@ async def grant(user_id: int, plan_code: str, *, bot: Optional[Bot] = None) -> D
     return result
 
 
-async def process_payment_event(event: Dict[str, Any]) -> Dict[str, Any]:
+async def process_payment_event(event: Dict[str, Any], *, bot: Optional[Bot] = None) -> Dict[str, Any]:
     """
     Обработать нормализованный вебхук платежа (см. modules.payments.service.normalize_webhook):
     ожидает поля: provider, status, meta{user_id, plan_code, bot_id}
-    Выполняет grant() при status == 'paid'.
+    Выполняет grant() при status == 'paid' через ``bot`` — бота, которому принадлежит
+    счёт (вызывающий связывает его БД с контекстом, см. tenants.use).
     Возвращает {'handled': bool, 'duplicate': bool, ...}
     """
     status = (event.get("status") or "").lower()
@@ -172,7 +212,7 @@ async def process_payment_event(event: Dict[str, Any]) -> Dict[str, Any]:
             log.info("duplicate payment skipped: %s", idem_key)
             return {"handled": False, "duplicate": duplicate}
 
-        granted = await grant(user_id=user_id, plan_code=plan_code)
+        granted = await grant(user_id=user_id, plan_code=plan_code, bot=bot, lang=meta.get("lang"))
 
         await claim_idempotency_key(idem_key, ttl_seconds=86400)
 
@@ -0,0 +1,143 @@
+# modules/access/expiry.py
+"""Access-expiry engine.
+
+``grant()`` пишет срок доступа в ``access_grants``; ``log_access_grant``
+параллельно ведёт таблицу ``access_expiry`` — одна строка на
+(пользователь, scope) с индексом по ``until_ts`` неотозванных строк.
+
+:func:`expiry_loop` спит до ближайшего ``until_ts`` (но не дольше
+``EXPIRY_MAX_SLEEP``, чтобы подхватить новые более короткие доступы), затем
+пачками по ``EXPIRY_BATCH`` отзывает истёкшие:
+
+* ``vip`` — ban + unban в ``VIP_CHANNEL_ID`` (исключение без вечного бана,
+  по новой ссылке можно вернуться);
+* ``chat`` — чат-план работает через бота, достаточно отметки;
+
+и помечает ``users.status='expired'``, если живых доступов не осталось.
+Вызовы Telegram идут не чаще ``EXPIRY_RATE`` в секунду.
+
+Идемпотентность: строка помечается ``revoked_at`` только после успешного
+отзыва и только если ``until_ts`` не изменился (доступ не продлили), так
+что после рестарта работа продолжается с того же места.
+
+Ошибки разбираются по строкам: ошибка чата (у бота нет прав, канал не
+найден) прерывает проход, и строки ждут следующего; ошибка конкретного
+пользователя (администратор или владелец канала) — в лог, строка
+помечается отозванной, чтобы не держать очередь.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from shared.config.env import current_config
+from shared.db.repo import due_access_expiries, mark_access_revoked, next_access_expiry
+from shared.utils.outbound import BULK, in_lane
+from shared.utils.telegram import Pacer
+
+log = logging.getLogger("juicyfox.access.expiry")
+
+EXPIRY_BATCH = int(os.getenv("EXPIRY_BATCH", "25"))
+EXPIRY_RATE = float(os.getenv("EXPIRY_RATE", "5"))            # вызовов Telegram в секунду
+EXPIRY_MAX_SLEEP = int(os.getenv("EXPIRY_MAX_SLEEP", "300"))
+EXPIRY_RETRY = int(os.getenv("EXPIRY_RETRY", "300"))          # пауза после ошибки Telegram/БД
+
+
+# ответы Telegram, означающие «пользователя в чате уже нет»
+_GONE_ERRORS = ("user_not_participant", "participant_id_invalid", "user not found", "member not found")
+
+
+# ошибки уровня чата: бот не может исключать никого — проход прерываем
+_CHAT_ERRORS = (
+    "not enough rights", "need administrator rights", "chat_admin_required",
+    "chat not found", "channel_private", "peer_id_invalid",
+)
+
+
+def _gone(err: TelegramBadRequest) -> bool:
+    text = (err.message or "").lower()
+    return any(marker in text for marker in _GONE_ERRORS)
+
+
+def _chat_level(err: TelegramBadRequest) -> bool:
+    text = (err.message or "").lower()
+    return any(marker in text for marker in _CHAT_ERRORS)
+
+
+async def _kick(bot: Bot, chat_id: int, user_id: int, pacer: Pacer) -> None:
+    """Исключить из канала без вечного бана. Повторный вызов безопасен."""
+    for call, kwargs in (
+        (bot.ban_chat_member, {}),
+        (bot.unban_chat_member, {"only_if_banned": True}),
+    ):
+        while True:
+            await pacer.wait()
+            try:
+                await call(chat_id=chat_id, user_id=user_id, **kwargs)
+                break
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if not _gone(e):
+                    raise  # разбирает run_expiry: ошибка чата или конкретного пользователя
+                # пользователя уже нет в канале / никогда не было — цель достигнута
+                log.info("expiry: %s user=%s chat=%s: %s", call.__name__, user_id, chat_id, e.message)
+                break
+
+
+@in_lane(BULK)
+async def run_expiry(bot: Bot, now: Optional[int] = None) -> int:
+    """Отозвать все истёкшие доступы. Возвращает число отозванных."""
+    pacer = Pacer(EXPIRY_RATE)
+    vip_chat_id = current_config().vip_channel_id
+    total = 0
+    while True:
+        now_ts = int(now if now is not None else time.time())
+        due = await due_access_expiries(now_ts, EXPIRY_BATCH)
+        if not due:
+            return total
+        for user_id, scope, until_ts in due:
+            if scope == "vip":
+                if not vip_chat_id:
+                    log.warning("expiry: VIP_CHANNEL_ID is not set, user=%s only marked", user_id)
+                else:
+                    try:
+                        await _kick(bot, vip_chat_id, user_id, pacer)
+                    except TelegramBadRequest as e:
+                        if _chat_level(e):
+                            # нет прав, чат не найден — строки остаются в очереди до следующего прохода
+                            raise
+                        # админ/владелец канала и т.п.: исключить нельзя никогда, повтор
+                        # бесполезен и держал бы очередь — отмечаем отзыв и идём дальше
+                        log.warning(
+                            "expiry: can't remove user=%s from chat=%s, marking revoked: %s",
+                            user_id, vip_chat_id, e.message,
+                        )
+            if await mark_access_revoked(user_id, scope, until_ts, now_ts):
+                total += 1
+                log.info("expiry: revoked %s access user=%s (until=%s)", scope, user_id, until_ts)
+        if len(due) < EXPIRY_BATCH:
+            return total
+
+
+async def expiry_loop(bot: Bot) -> None:
+    """Фоновая задача: спит до ближайшего истечения и отзывает доступы."""
+    while True:
+        try:
+            revoked = await run_expiry(bot)
+            if revoked:
+                log.info("expiry: %s access(es) revoked", revoked)
+            nxt = await next_access_expiry()
+            delay = EXPIRY_MAX_SLEEP if nxt is None else min(EXPIRY_MAX_SLEEP, max(1, nxt - int(time.time())))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("expiry: pass failed, retry in %ss: %s", EXPIRY_RETRY, e)
+            delay = EXPIRY_RETRY
+        await asyncio.sleep(delay)
@@ -0,0 +1,130 @@
+# modules/access/invite_pool.py
+"""Пул заранее созданных invite-ссылок для VIP-каналов.
+
+``create_chat_invite_link`` во время всплеска оплат упирается во
+flood-лимиты Telegram, и пользователь ждёт ссылку (или не получает её).
+Фоновая задача :func:`pool_loop` держит для каждого канала
+``INVITE_POOL_SIZE`` свободных одноразовых ссылок (``member_limit=1``,
+срок ``INVITE_POOL_TTL``), создавая не больше ``INVITE_POOL_RATE`` в
+секунду. ``grant()`` забирает ссылку одним UPDATE (:func:`claim_invite`);
+пул пуст — ссылка создаётся синхронно, как раньше, а пополнение
+запускается сразу.
+
+Выдаются только ссылки, которые проживут ещё ``INVITE_POOL_MIN_LEFT``
+секунд — у покупателя остаётся время войти; более старые удаляются.
+
+Метрики: ``juicyfox_invite_pool_free`` (свободных ссылок) и
+``juicyfox_invite_pool_claims_total{result=hit|miss}`` — доля hit и есть
+hit rate пула.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from shared.db.repo import add_pool_invite, claim_pool_invite, count_pool_invites, purge_pool_invites
+from shared.utils.metrics import Counter, Gauge
+from shared.utils.outbound import BULK, in_lane
+from shared.utils.telegram import Pacer
+
+log = logging.getLogger("juicyfox.access.invite_pool")
+
+INVITE_POOL_SIZE = int(os.getenv("INVITE_POOL_SIZE", "20"))          # 0 — пул выключен
+INVITE_POOL_RATE = float(os.getenv("INVITE_POOL_RATE", "1"))         # ссылок в секунду
+INVITE_POOL_TTL = int(os.getenv("INVITE_POOL_TTL", str(7 * 86400)))  # срок жизни ссылки
+INVITE_POOL_MIN_LEFT = int(os.getenv("INVITE_POOL_MIN_LEFT", "86400"))
+INVITE_POOL_INTERVAL = int(os.getenv("INVITE_POOL_INTERVAL", "60"))
+INVITE_POOL_KEEP_DAYS = 30                                           # хранить выданные ссылки
+
+POOL_FREE = Gauge("juicyfox_invite_pool_free", "Unclaimed pre-generated invite links", ["chat"])
+POOL_CLAIMS = Counter(
+    "juicyfox_invite_pool_claims_total",
+    "Invite link requests served from the pool (hit) or created inline (miss)",
+    ["result"],
+)
+
+_wake: Optional[asyncio.Event] = None
+
+
+def _event() -> asyncio.Event:
+    global _wake
+    if _wake is None:
+        _wake = asyncio.Event()
+    return _wake
+
+
+async def claim_invite(chat_id: int, user_id: int) -> Optional[str]:
+    """Забрать ссылку из пула; ``None`` — пул пуст (или выключен)."""
+    if INVITE_POOL_SIZE <= 0:
+        return None
+    try:
+        link = await claim_pool_invite(chat_id, user_id, int(time.time()) + INVITE_POOL_MIN_LEFT)
+    except Exception as e:
+        log.warning("invite pool: claim failed for chat=%s: %s", chat_id, e)
+        link = None
+    POOL_CLAIMS.labels(result="hit" if link else "miss").inc()
+    if not link:
+        log.info("invite pool empty for chat=%s, creating link inline", chat_id)
+    # ссылку забрали или её не было — пополнить пул, не дожидаясь интервала
+    _event().set()
+    return link
+
+
+@in_lane(BULK)
+async def refill(bot: Bot, chat_id: int, pacer: Pacer) -> int:
+    """Дополнить пул канала до ``INVITE_POOL_SIZE``. Возвращает число созданных ссылок."""
+    now = int(time.time())
+    free = await count_pool_invites(chat_id, now + INVITE_POOL_MIN_LEFT)
+    created = 0
+    while free < INVITE_POOL_SIZE:
+        await pacer.wait()
+        expire_at = int(time.time()) + INVITE_POOL_TTL
+        link = await bot.create_chat_invite_link(
+            chat_id=chat_id,
+            name="pool",
+            expire_date=expire_at,
+            member_limit=1,
+            creates_join_request=False,
+        )
+        await add_pool_invite(chat_id, link.invite_link, expire_at)
+        free += 1
+        created += 1
+        POOL_FREE.labels(chat=str(chat_id)).set(free)
+    POOL_FREE.labels(chat=str(chat_id)).set(free)
+    return created
+
+
+async def pool_loop(bot: Bot, chat_ids: List[int], interval: int = INVITE_POOL_INTERVAL) -> None:
+    """Фоновая задача: чистит устаревшие ссылки и пополняет пул каналов ``chat_ids``."""
+    if INVITE_POOL_SIZE <= 0 or not chat_ids:
+        return
+    pacer = Pacer(INVITE_POOL_RATE)
+    wake = _event()
+    while True:
+        wake.clear()
+        try:
+            now = int(time.time())
+            await purge_pool_invites(now + INVITE_POOL_MIN_LEFT, now - INVITE_POOL_KEEP_DAYS * 86400)
+            for chat_id in chat_ids:
+                created = await refill(bot, chat_id, pacer)
+                if created:
+                    log.info("invite pool: +%s link(s) for chat=%s", created, chat_id)
+        except asyncio.CancelledError:
+            raise
+        except TelegramRetryAfter as e:
+            # во время flood-лимита не просыпаемся по claim_invite — выдача идёт инлайн
+            log.warning("invite pool: flood limit, retry in %ss", e.retry_after)
+            await asyncio.sleep(e.retry_after)
+            continue
+        except Exception as e:
+            log.warning("invite pool: refill failed: %s", e)
+        try:
+            await asyncio.wait_for(wake.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
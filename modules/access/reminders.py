@@ -0,0 +1,140 @@
+# modules/access/reminders.py
+"""Напоминания о продлении доступа.
+
+Окна задаются ``REMINDER_WINDOWS`` (по умолчанию ``3d,1d``).  Для окна
+``w`` напоминание получает доступ, истекающий в ``(now + w_next, now + w]``,
+где ``w_next`` — следующее меньшее окно: если пользователь уже внутри
+суток, «за 3 дня» ему не шлём.  Выборка — диапазон по индексу
+``idx_access_expiry_due`` (см. ``shared.db.repo.due_access_reminders``).
+
+Окна «скользят» вместе со временем, а планировщик проходит их каждые
+``REMINDER_INTERVAL`` секунд: напоминания уходят по мере приближения
+сроков, а не пачкой раз в час.  Отправка — не чаще ``REMINDER_RATE`` в
+секунду.
+
+Ровно один раз: запись в ``access_reminders`` делается ДО отправки
+(``INSERT OR IGNORE`` по (user, scope, until_ts, окно)), поэтому несколько
+воркеров и рестарты не дублируют сообщения; при сетевой ошибке/RetryAfter
+запись снимается и напоминание уходит на следующем проходе.  Продление
+меняет ``until_ts`` — для нового срока напоминания придут заново.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from modules.common.i18n import tr
+from modules.ui_membership.keyboards import renewal_kb
+from shared.db.repo import (
+    claim_access_reminder,
+    due_access_reminders,
+    purge_access_reminders,
+    release_access_reminder,
+)
+from shared.utils.outbound import BULK, in_lane
+from shared.utils.telegram import Pacer
+
+log = logging.getLogger("juicyfox.access.reminders")
+
+REMINDER_BATCH = int(os.getenv("REMINDER_BATCH", "100"))
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", "10"))         # сообщений в секунду
+REMINDER_INTERVAL = int(os.getenv("REMINDER_INTERVAL", "60"))
+REMINDER_KEEP_DAYS = 30                                         # хранить журнал отправок после истечения
+
+
+def parse_windows(raw: Optional[str]) -> List[int]:
+    """``"3d,1d,12h"`` → ``[259200, 86400, 43200]`` (секунды, по убыванию)."""
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    out = set()
+    for part in (raw or "").replace(";", ",").split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        mult = units.get(part[-1])
+        num = part[:-1] if mult else part
+        try:
+            value = int(float(num) * (mult or 86400))  # без единицы — дни
+        except ValueError:
+            log.warning("reminders: bad window %r ignored", part)
+            continue
+        if value > 0:
+            out.add(value)
+    return sorted(out, reverse=True)
+
+
+REMINDER_WINDOWS = parse_windows(os.getenv("REMINDER_WINDOWS", "3d,1d"))
+
+
+def _left(lang: str, seconds: int) -> str:
+    if seconds >= 86400:
+        return tr(lang, "left_days", n=max(1, round(seconds / 86400)))
+    return tr(lang, "left_hours", n=max(1, round(seconds / 3600)))
+
+
+def render_reminder(lang: str, scope: str, until_ts: int, now: int) -> str:
+    key = "renew_reminder_chat" if scope == "chat" else "renew_reminder_vip"
+    return tr(lang, key, left=_left(lang, until_ts - now), date=time.strftime("%d.%m.%Y", time.localtime(until_ts)))
+
+
+@in_lane(BULK)
+async def run_reminders(bot: Bot, windows: Optional[List[int]] = None, now: Optional[int] = None) -> int:
+    """Один проход по всем окнам. Возвращает число отправленных напоминаний."""
+    windows = REMINDER_WINDOWS if windows is None else windows
+    pacer = Pacer(REMINDER_RATE)
+    sent = 0
+    for i, window in enumerate(windows):
+        floor = windows[i + 1] if i + 1 < len(windows) else 0
+        while True:
+            now_ts = int(now if now is not None else time.time())
+            due = await due_access_reminders(now_ts, window, floor, REMINDER_BATCH)
+            for user_id, scope, until_ts, lang in due:
+                if not await claim_access_reminder(user_id, scope, until_ts, window, now_ts):
+                    continue  # уже отправлено другим воркером
+                lang = lang or "en"
+                await pacer.wait()
+                try:
+                    await bot.send_message(
+                        user_id,
+                        render_reminder(lang, scope, until_ts, now_ts),
+                        reply_markup=renewal_kb(lang, scope),
+                    )
+                    sent += 1
+                except (TelegramRetryAfter, TelegramNetworkError, TelegramServerError) as e:
+                    # временно (429, сеть, 5xx): вернём в очередь и прервём проход
+                    await release_access_reminder(user_id, scope, until_ts, window)
+                    log.warning("reminders: send to %s postponed: %s", user_id, e)
+                    if isinstance(e, TelegramRetryAfter):
+                        await asyncio.sleep(e.retry_after)
+                    return sent
+                except Exception as e:
+                    # бот заблокирован, чат не найден — повторять бессмысленно
+                    log.info("reminders: user %s unreachable: %s", user_id, e)
+            if len(due) < REMINDER_BATCH:
+                break
+    return sent
+
+
+async def reminder_loop(bot: Bot, interval: int = REMINDER_INTERVAL) -> None:
+    """Фоновая задача: каждые ``interval`` секунд рассылает подошедшие напоминания."""
+    if not REMINDER_WINDOWS:
+        return
+    last_purge = 0.0
+    while True:
+        try:
+            sent = await run_reminders(bot)
+            if sent:
+                log.info("reminders: %s renewal reminder(s) sent", sent)
+            if time.monotonic() - last_purge > 86400:
+                await purge_access_reminders(int(time.time()) - REMINDER_KEEP_DAYS * 86400)
+                last_purge = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("reminders: pass failed: %s", e)
+        await asyncio.sleep(max(5, interval))
@@ -2,8 +2,12 @@
 from __future__ import annotations
 
 import os
+import html
+import json
 import logging
+import secrets
 import time
+from contextlib import suppress
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any, List
 
@@ -11,6 +15,7 @@ from typing import Optional, Dict, Any, List
 from modules.common.i18n import tr
 from shared.utils.lang import get_lang
 from shared.utils.telegram import send_with_retry
+from shared.utils.media import send_local_media
 from modules.ui_membership.keyboards import vip_currency_kb
 from modules.constants.paths import VIP_PHOTO
 try:
@@ -23,6 +28,9 @@ try:
         get_user_by_group,
         get_chat_number,
         get_user_profile,
+        save_relay_map,
+        get_relay_target,
+        get_relay_sources,
     )
 except Exception:  # pragma: no cover
     (
@@ -34,30 +42,60 @@ except Exception:  # pragma: no cover
         get_user_by_group,
         get_chat_number,
         get_user_profile,
-    ) = (None, None, None, None, None, None, None, None)  # type: ignore
+        save_relay_map,
+        get_relay_target,
+        get_relay_sources,
+    ) = (None, None, None, None, None, None, None, None, None, None, None)  # type: ignore
 try:
     from shared.config.env import config
 except Exception:  # pragma: no cover
     config = None  # type: ignore
+from shared.config.env import setting
+from shared.db.state import get_state
 # END REGION AI
 
 from aiogram import Router, F  # noqa: E402
+from aiogram.exceptions import TelegramBadRequest  # noqa: E402
 from aiogram.filters import Command, CommandObject  # noqa: E402
-from aiogram.types import Message, FSInputFile  # noqa: E402
+from aiogram.types import (  # noqa: E402
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Message,
+    ReplyParameters,
+)
 
 router = Router()
 log = logging.getLogger("juicyfox.chat_relay")
 
 # === Конфиг через ENV ===
-RELAY_GROUP_ID = int(os.getenv("RELAY_GROUP_ID") or os.getenv("CHAT_GROUP_ID") or "0")
-HISTORY_GROUP_ID = int(os.getenv("HISTORY_GROUP_ID") or "0")  # если задан — /history доступна только здесь
-MODEL_NAME = os.getenv("MODEL_NAME", "Juicy Fox")
-USER_STREAK_LIMIT = int(os.getenv("RELAY_STREAK_LIMIT", "3"))   # максимум входящих подряд без ответа
-HISTORY_DEFAULT_N = int(os.getenv("RELAY_HISTORY_DEFAULT", "20"))
+# REGION AI: hot reload
+# Значения читаются при каждом обращении и меняются без рестарта (shared.config.env.setting)
+def _relay_group_id() -> int:
+    return setting("RELAY_GROUP_ID", "CHAT_GROUP_ID", default=0, cast=int)
+
+
+def _history_group_id() -> int:  # если задан — /history доступна только здесь
+    return setting("HISTORY_GROUP_ID", default=0, cast=int)
+
+
+def _model_name() -> str:
+    return setting("MODEL_NAME", default="Juicy Fox")
+
+
+def _streak_limit() -> int:  # максимум входящих подряд без ответа
+    return setting("RELAY_STREAK_LIMIT", default=3, cast=int)
+
+
+def _history_default_n() -> int:
+    return setting("RELAY_HISTORY_DEFAULT", default=20, cast=int)
+# END REGION AI
 
 # === Асинхронный репозиторий (персистентный, если есть shared.db.repo; иначе — in-memory) ===
 class _Repo:
     def __init__(self) -> None:
+        # последний резерв на время недоступности БД: shared_state живёт в той же
+        # БД и тогда тоже недоступен, поэтому буфер остаётся в памяти процесса
         self._mem_messages: Dict[int, List[Dict[str, Any]]] = {}
         self._streak: Dict[int, int] = {}
         try:
@@ -75,6 +113,10 @@ class _Repo:
                 return int(await self._ext.inc_streak(user_id))  # type: ignore
             except Exception as e:
                 log.warning("repo.inc_streak failed, fallback: %s", e)
+        # REGION AI: shared streak fallback
+        with suppress(Exception):
+            return await get_state().incr(f"streak:{user_id}")
+        # END REGION AI
         self._streak[user_id] = self._streak.get(user_id, 0) + 1
         return self._streak[user_id]
 
@@ -85,6 +127,10 @@ class _Repo:
                 return
             except Exception as e:
                 log.warning("repo.reset_streak failed, fallback: %s", e)
+        # REGION AI: shared streak fallback
+        with suppress(Exception):
+            await get_state().set(f"streak:{user_id}", "0")
+        # END REGION AI
         self._streak[user_id] = 0
 
     async def get_streak(self, user_id: int) -> int:
@@ -93,6 +139,10 @@ class _Repo:
                 return int(await self._ext.get_streak(user_id))  # type: ignore
             except Exception as e:
                 log.warning("repo.get_streak failed, fallback: %s", e)
+        # REGION AI: shared streak fallback
+        with suppress(Exception):
+            return int(await get_state().get(f"streak:{user_id}") or 0)
+        # END REGION AI
         return self._streak.get(user_id, 0)
 
     # --- История сообщений ---
@@ -114,6 +164,31 @@ class _Repo:
                 log.warning("repo.get_history failed, fallback: %s", e)
         return list(self._mem_messages.get(user_id, []))[-limit:]
 
+    # REGION AI: keyset history pages
+    async def get_history_page(
+        self,
+        user_id: int,
+        before: Optional[tuple] = None,
+        limit: int = 20,
+        after: Optional[tuple] = None,
+    ) -> List[Dict[str, Any]]:
+        if self._ext:
+            try:
+                return list(await self._ext.get_history_page(user_id, before, limit, after))  # type: ignore
+            except Exception as e:
+                log.warning("repo.get_history_page failed, fallback: %s", e)
+        # in-memory: id — позиция в буфере
+        recs = [
+            r | {"id": i + 1, "ts": int(r.get("ts") or 0)}
+            for i, r in enumerate(self._mem_messages.get(user_id, []))
+        ]
+        if after is not None:
+            return [r for r in recs if (r["ts"], r["id"]) > tuple(after)][:limit]
+        if before is not None:
+            recs = [r for r in recs if (r["ts"], r["id"]) < tuple(before)]
+        return recs[-limit:] if limit > 0 else []
+    # END REGION AI
+
 
 _repo = _Repo()
 
@@ -226,96 +301,174 @@ async def _chat_subscription_active(user_id: int) -> bool:
     return expires_at >= datetime.now(timezone.utc)
 
 
+# REGION AI: relay message map
+def _reply_params(message_id: Optional[int]) -> Optional[ReplyParameters]:
+    if not message_id:
+        return None
+    return ReplyParameters(message_id=message_id, allow_sending_without_reply=True)
+
+
+async def _remember(
+    group_id: int, group_message_ids: List[int], user_id: int, user_message_id: Optional[int], direction: str
+) -> None:
+    """Записать связь в relay_map; сбой записи не должен ломать пересылку."""
+    if not save_relay_map or not group_message_ids:
+        return
+    try:
+        await save_relay_map(group_id, group_message_ids, user_id, user_message_id, direction)
+    except Exception as e:
+        log.warning("relay_map: save failed group_id=%s user_id=%s: %s", group_id, user_id, e)
+
+
+async def _relay_target_of(group_id: int, group_message_id: int) -> Optional[Dict[str, Any]]:
+    if not get_relay_target:
+        return None
+    try:
+        return await get_relay_target(group_id, group_message_id)
+    except Exception as e:
+        log.warning("relay_map: lookup failed group_id=%s: %s", group_id, e)
+        return None
+
+
+async def _relay_target(msg: Message) -> Optional[Dict[str, Any]]:
+    """Кому адресован ответ в группе: по relay_map для сообщения, на которое ответили."""
+    src = msg.reply_to_message
+    if not src:
+        return None
+    return await _relay_target_of(msg.chat.id, src.message_id)
+
+
+async def _group_reply_to(msg: Message, chat_id: int) -> Optional[int]:
+    """Пользователь ответил на сообщение в личке → связанное сообщение в группе ``chat_id``."""
+    src = msg.reply_to_message
+    if not src or not get_relay_sources:
+        return None
+    try:
+        rows = await get_relay_sources(msg.from_user.id, src.message_id)
+    except Exception as e:
+        log.warning("relay_map: lookup failed user_id=%s: %s", msg.from_user.id, e)
+        return None
+    for row in rows:
+        if row["group_id"] == chat_id:
+            return row["group_message_id"]
+    return None
+
+
+def _user_from_header(text: Optional[str]) -> Optional[int]:
+    """Сообщения, пересланные до relay_map: id из шапки ``from: <id> …`` или ``№N • <id> • …``."""
+    lines = (text or "").splitlines()
+    parts = [p for p in (lines[0] if lines else "").split() if p != "•"]
+    if len(parts) >= 2 and (parts[0] == "from:" or parts[0].startswith("№")) and parts[1].isdigit():
+        return int(parts[1])
+    return None
+# END REGION AI
+
+
 async def _send_record(msg: Message, chat_id: int, header: Optional[str] | None = None) -> None:
     header = header or _fmt_from(msg)
     text = (msg.text or msg.caption or "").strip()
     bot = msg.bot
     rec = {"type": msg.content_type, "ts": _now_ts()}
     media_id: Optional[str] = None
+    # REGION AI: relay message map
+    reply = _reply_params(await _group_reply_to(msg, chat_id))
+    sent: List[Message] = []
+    # END REGION AI
 
     if msg.text:
-        await send_with_retry(
+        sent.append(await send_with_retry(
             bot.send_message,
             chat_id,
             f"{header}\n\n{text}",
+            reply_parameters=reply,
             logger=log,
-        )
+        ))
         rec["text"] = text
     elif msg.photo:
         media_id = msg.photo[-1].file_id
         cap = f"{header}\n\n{text}" if text else header
-        await send_with_retry(
+        sent.append(await send_with_retry(
             bot.send_photo,
             chat_id,
             media_id,
             caption=cap,
+            reply_parameters=reply,
             logger=log,
-        )
+        ))
         rec.update({"file_id": media_id, "text": text or None})
     elif msg.video:
         media_id = msg.video.file_id
         cap = f"{header}\n\n{text}" if text else header
-        await send_with_retry(
+        sent.append(await send_with_retry(
             bot.send_video,
             chat_id,
             media_id,
             caption=cap,
+            reply_parameters=reply,
             logger=log,
-        )
+        ))
         rec.update({"file_id": media_id, "text": text or None})
     elif msg.voice:
         media_id = msg.voice.file_id
         cap = f"{header}\n\n{text}" if text else header
-        await send_with_retry(
+        sent.append(await send_with_retry(
             bot.send_voice,
             chat_id,
             media_id,
             caption=cap,
+            reply_parameters=reply,
             logger=log,
-        )
+        ))
         rec.update({"file_id": media_id, "text": text or None})
     elif msg.document:
         media_id = msg.document.file_id
         cap = f"{header}\n\n{text}" if text else header
-        await send_with_retry(
+        sent.append(await send_with_retry(
             bot.send_document,
             chat_id,
             media_id,
             caption=cap,
+            reply_parameters=reply,
             logger=log,
-        )
+        ))
         rec.update({"file_id": media_id, "text": text or None})
     elif msg.animation:
         media_id = msg.animation.file_id
         cap = f"{header}\n\n{text}" if text else header
-        await send_with_retry(
+        sent.append(await send_with_retry(
             bot.send_animation,
             chat_id,
             media_id,
             caption=cap,
+            reply_parameters=reply,
             logger=log,
-        )
+        ))
         rec.update({"file_id": media_id, "text": text or None})
     elif msg.sticker:
         media_id = msg.sticker.file_id
-        await send_with_retry(bot.send_message, chat_id, header, logger=log)
-        await send_with_retry(bot.send_sticker, chat_id, media_id, logger=log)
+        sent.append(await send_with_retry(bot.send_message, chat_id, header, reply_parameters=reply, logger=log))
+        sent.append(await send_with_retry(bot.send_sticker, chat_id, media_id, logger=log))
         rec.update({"file_id": media_id, "text": msg.sticker.emoji or None})
     elif msg.video_note:
         media_id = msg.video_note.file_id
-        await send_with_retry(bot.send_message, chat_id, header, logger=log)
-        await send_with_retry(bot.send_video_note, chat_id, media_id, logger=log)
+        sent.append(await send_with_retry(bot.send_message, chat_id, header, reply_parameters=reply, logger=log))
+        sent.append(await send_with_retry(bot.send_video_note, chat_id, media_id, logger=log))
         rec["file_id"] = media_id
     else:
-        await send_with_retry(
+        sent.append(await send_with_retry(
             bot.send_message,
             chat_id,
             f"{header}\n\n[unsupported content]",
+            reply_parameters=reply,
             logger=log,
-        )
+        ))
         rec["type"] = "unknown"
 
     await _repo.log_message(msg.from_user.id, "in", rec)
+    # REGION AI: relay message map
+    # шапка стикера/кружка и само медиа ведут к одному сообщению пользователя
+    await _remember(chat_id, [m.message_id for m in sent if m], msg.from_user.id, msg.message_id, "in")
+    # END REGION AI
 
 
 # END REGION AI
@@ -328,10 +481,10 @@ async def _send_record(msg: Message, chat_id: int, header: Optional[str] | None
 async def vip_club(msg: Message) -> None:
     lang = get_lang(msg.from_user)
     if VIP_PHOTO.exists():
-        photo = FSInputFile(VIP_PHOTO)
-        await send_with_retry(
+        await send_local_media(
+            msg.bot,
             msg.answer_photo,
-            photo,
+            VIP_PHOTO,
             caption=tr(lang, "vip_club_description"),
             reply_markup=vip_currency_kb(lang),
             parse_mode="HTML",
@@ -355,7 +508,7 @@ async def relay_incoming_to_group(msg: Message):
     Любое личное сообщение, КРОМЕ команд, уходит в рабочую группу.
     Команды (начинаются с '/') игнорируются.
     """
-    if not RELAY_GROUP_ID:
+    if not _relay_group_id():
         return
 
     # Игнорируем команды вида "/start", "/help", "/..."
@@ -411,20 +564,20 @@ async def relay_incoming_to_group(msg: Message):
         log.info("chat_relay: inactive chat subscription, skip relay for user_id=%s", uid)
         return
 
-    group_id = RELAY_GROUP_ID
+    group_id = _relay_group_id()
     if get_group_for_user:
         try:
-            group_id = int(await get_group_for_user(uid) or RELAY_GROUP_ID)
+            group_id = int(await get_group_for_user(uid) or group_id)
         except Exception:
-            group_id = RELAY_GROUP_ID
+            pass
 
     # 1) Лимит подряд входящих
     streak = await _repo.inc_streak(uid)
-    if streak > USER_STREAK_LIMIT:
+    if streak > _streak_limit():
         try:
             await send_with_retry(
                 msg.answer,
-                f"Пожалуйста, дождись моего ответа 😘\nТвоё сообщение получено.\n— {MODEL_NAME}",
+                f"Пожалуйста, дождись моего ответа 😘\nТвоё сообщение получено.\n— {_model_name()}",
                 logger=log,
             )
         except Exception:
@@ -454,8 +607,13 @@ async def _safe_edit_text(msg: Message, text: str, reply_markup: Any = None) ->
         return
     await msg.edit_text(text, reply_markup=reply_markup)
 # REGION AI: group replies
-async def _copy_and_log(msg: Message, user_id: int) -> None:
-    await msg.bot.copy_message(user_id, msg.chat.id, msg.message_id)
+async def _copy_and_log(msg: Message, user_id: int, reply_to: Optional[int] = None) -> None:
+    copied = await msg.bot.copy_message(
+        user_id, msg.chat.id, msg.message_id, reply_parameters=_reply_params(reply_to)
+    )
+    # REGION AI: relay message map
+    await _remember(msg.chat.id, [msg.message_id], user_id, copied.message_id, "out")
+    # END REGION AI
     log_rec = {"type": msg.content_type, "ts": _now_ts()}
     caption = msg.caption or msg.text or None
     if msg.photo:
@@ -482,6 +640,20 @@ async def _copy_and_log(msg: Message, user_id: int) -> None:
 async def relay_from_group(msg: Message) -> None:
     group_id = msg.chat.id
     user_id: Optional[int] = None
+    # REGION AI: relay message map
+    # ответ на пересланное сообщение: адресат и тред — по relay_map, без разбора шапки
+    target = await _relay_target(msg)
+    if target:
+        user_id = target["user_id"]
+        log.info("OUT: group_id=%s → user_id=%s (reply) type=%s", group_id, user_id, msg.content_type)
+        try:
+            await _copy_and_log(msg, user_id, reply_to=target["user_message_id"])
+        except Exception as e:
+            log.error("relay_from_group: failed to deliver user_id=%s error=%s", user_id, e)
+        finally:
+            await _repo.reset_streak(user_id)
+        return
+    # END REGION AI
     if get_user_by_group:
         try:
             user_id = await get_user_by_group(group_id)
@@ -501,11 +673,10 @@ async def relay_from_group(msg: Message) -> None:
     log.warning("relay_from_group: user not linked for group_id=%s", group_id)
     if not msg.reply_to_message or (msg.text and msg.text.startswith("/")):
         return
-    parts = (msg.reply_to_message.caption or msg.reply_to_message.text or "").split()
-    if len(parts) < 2 or parts[0] != "from:" or not parts[1].isdigit():
+    user_id = _user_from_header(msg.reply_to_message.caption or msg.reply_to_message.text)
+    if user_id is None:
         log.info("relay_from_group: cannot extract user_id, skipping.")
         return
-    user_id = int(parts[1])
     log.info("relay_from_group: extracted user_id=%s from reply.", user_id)
     if get_relay_user:
         user = await get_relay_user(user_id)
@@ -535,6 +706,65 @@ async def relay_from_group(msg: Message) -> None:
         log.error("relay_from_group: failed to deliver user_id=%s error=%s", user_id, e)
     finally:
         await _repo.reset_streak(user_id)
+
+
+# REGION AI: relay message map
+# Правки: пользователь → копия в группе, оператор → копия у пользователя
+@router.edited_message(F.chat.type == "private")
+async def relay_user_edit(msg: Message) -> None:
+    if not get_relay_sources or (msg.text and msg.text.startswith("/")):
+        return
+    try:
+        rows = [r for r in await get_relay_sources(msg.from_user.id, msg.message_id) if r["direction"] == "in"]
+    except Exception as e:
+        log.warning("relay_map: lookup failed user_id=%s: %s", msg.from_user.id, e)
+        return
+    if not rows:
+        return
+    header = _fmt_from(msg)
+    text = (msg.text or msg.caption or "").strip()
+    for row in rows:
+        try:
+            if msg.text:
+                await msg.bot.edit_message_text(
+                    text=f"{header}\n\n{text}", chat_id=row["group_id"], message_id=row["group_message_id"]
+                )
+            elif msg.caption is not None:
+                await msg.bot.edit_message_caption(
+                    chat_id=row["group_id"],
+                    message_id=row["group_message_id"],
+                    caption=f"{header}\n\n{text}" if text else header,
+                )
+        except TelegramBadRequest as e:
+            # шапка стикера, удалённое или не изменившееся сообщение
+            log.info("relay_map: edit skipped group_id=%s message_id=%s: %s", row["group_id"], row["group_message_id"], e)
+
+
+@router.edited_message(F.chat.type.in_({"group", "supergroup"}))
+async def relay_operator_edit(msg: Message) -> None:
+    if msg.text and msg.text.startswith("/"):
+        return
+    target = await _relay_target_of(msg.chat.id, msg.message_id)
+    if not target or target["direction"] != "out" or not target["user_message_id"]:
+        return
+    try:
+        if msg.text:
+            await msg.bot.edit_message_text(
+                text=msg.text,
+                chat_id=target["user_id"],
+                message_id=target["user_message_id"],
+                entities=msg.entities,
+            )
+        elif msg.caption is not None:
+            await msg.bot.edit_message_caption(
+                chat_id=target["user_id"],
+                message_id=target["user_message_id"],
+                caption=msg.caption,
+                caption_entities=msg.caption_entities,
+            )
+    except TelegramBadRequest as e:
+        log.info("relay_map: edit skipped user_id=%s: %s", target["user_id"], e)
+# END REGION AI
 # END REGION AI
 # END REGION AI
 # ========== Ответ из рабочей группы пользователю ==========
@@ -572,67 +802,262 @@ async def reply_from_group(cmd: Message, command: CommandObject):
 
     # Вариант 2: reply на системное сообщение + /r текст
     if reply_to and args:
-        lines = (reply_to.caption or reply_to.text or "").splitlines()
-        if lines and lines[0].startswith("from:"):
+        # REGION AI: relay message map
+        target = await _relay_target(cmd)
+        user_id = target["user_id"] if target else _user_from_header(reply_to.caption or reply_to.text)
+        if user_id:
             try:
-                user_id = int(lines[0].split()[1])
-                try:
-                    await send_with_retry(
-                        cmd.bot.send_message,
-                        user_id,
-                        args,
-                        logger=log,
-                    )
-                    await _repo.log_message(user_id, "out", {"type": "text", "text": args, "ts": _now_ts()})
-                    await cmd.reply("✅ Отправлено")
-                finally:
-                    await _repo.reset_streak(user_id)
+                sent = await send_with_retry(
+                    cmd.bot.send_message,
+                    user_id,
+                    args,
+                    reply_parameters=_reply_params(target["user_message_id"] if target else None),
+                    logger=log,
+                )
+                await _remember(cmd.chat.id, [cmd.message_id], user_id, sent.message_id, "out")
+                await _repo.log_message(user_id, "out", {"type": "text", "text": args, "ts": _now_ts()})
+                await cmd.reply("✅ Отправлено")
                 return
-            except Exception:
-                pass
+            except Exception as e:
+                log.warning("reply_from_group: failed to deliver user_id=%s error=%s", user_id, e)
+            finally:
+                await _repo.reset_streak(user_id)
+        # END REGION AI
 
     await cmd.reply("❓ Использование: /r <user_id> <текст>\nили ответьте на сообщение пользователя командой /r <текст>")
 
 
 # ========== История ==========
+# REGION AI: keyset history pages
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "40"))
+
+
+def _fmt_history_msg(rec: Dict[str, Any]) -> str:
+    # Формат: «dd.mm hh:mm in/out [type] текст/файл (усечён)»
+    t = time.strftime("%d.%m %H:%M", time.localtime(rec.get("ts", _now_ts())))
+    direction = rec.get("direction", "?")
+    typ = rec.get("type", "text")
+    text = (rec.get("text") or rec.get("file_id") or "").replace("\n", " ")
+    if len(text) > 64:
+        text = text[:60] + "…"
+    return f"{t} {direction:<3} [{typ}] {text}"
+
+
+async def _history_page(
+    user_id: int,
+    limit: int,
+    before: Optional[tuple] = None,
+    after: Optional[tuple] = None,
+) -> tuple[Optional[str], Optional[InlineKeyboardMarkup]]:
+    """Одна страница /history: ``limit + 1`` строк показывают, есть ли ещё."""
+    page = await _repo.get_history_page(user_id, before, limit + 1, after)
+    if after is not None:
+        has_newer = len(page) > limit
+        page = page[:limit]
+        has_older = True
+    else:
+        has_older = len(page) > limit
+        page = page[-limit:]
+        has_newer = before is not None
+    if not page:
+        return None, None
+
+    body = "\n".join(_fmt_history_msg(r) for r in page)
+    text = f"История {user_id} ({len(page)}):\n{body}"[:4096]
+
+    first, last = page[0], page[-1]
+    buttons = []
+    if has_older:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ старше", callback_data=f"hp:{user_id}:{limit}:o:{first['ts']}:{first['id']}"
+        ))
+    if has_newer:
+        buttons.append(InlineKeyboardButton(
+            text="новее ➡️", callback_data=f"hp:{user_id}:{limit}:n:{last['ts']}:{last['id']}"
+        ))
+    return text, (InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None)
+# END REGION AI
+
+
 @router.message(Command("history"))
 async def history_cmd(m: Message, command: CommandObject):
     """
     /history <user_id> [N]
+    /history <user_id> replay [N] — переотправить сообщения в группу (modules.history)
+    /history <user_id> export [jsonl|csv] — вся история gzip-файлом (modules.history)
     Если задан HISTORY_GROUP_ID — команда доступна только там.
+    Листание назад/вперёд — кнопками (курсор в callback_data).
     """
     if m.chat.type not in {"group", "supergroup"}:
         return
-    if HISTORY_GROUP_ID and m.chat.id != HISTORY_GROUP_ID:
+    history_group = _history_group_id()
+    if history_group and m.chat.id != history_group:
         return  # тихо игнорируем вне спец-группы
 
     args = (command.args or "").split()
     if not args or not args[0].isdigit():
-        await m.reply("Использование: /history <user_id> [N]")
+        await m.reply(
+            "Использование: /history <user_id> [N]\n"
+            "/history <user_id> replay [N]\n"
+            "/history <user_id> export [jsonl|csv]"
+        )
         return
     user_id = int(args[0])
+    # REGION AI: history export
+    # этот роутер подключается раньше modules.history и перекрывает его /history
+    if len(args) > 1 and args[1].lower() == "export":
+        fmt = args[2].lower() if len(args) > 2 else "jsonl"
+        if fmt not in {"jsonl", "csv"}:
+            await m.reply("Использование: /history <user_id> export [jsonl|csv]")
+            return
+        from modules.history.handlers import export_history
+
+        await export_history(m, user_id, fmt)
+        return
+    # END REGION AI
+    # REGION AI: history replay
+    # сами сообщения (альбомы, склеенный текст), а не текстовая страница
+    if len(args) > 1 and args[1].lower() == "replay":
+        try:
+            n = int(args[2]) if len(args) > 2 else _history_default_n()
+        except ValueError:
+            n = _history_default_n()
+        from modules.history.handlers import replay_history
+
+        await replay_history(m, user_id, max(1, n))
+        return
+    # END REGION AI
     try:
-        limit = int(args[1]) if len(args) > 1 else HISTORY_DEFAULT_N
+        limit = int(args[1]) if len(args) > 1 else _history_default_n()
     except Exception:
-        limit = HISTORY_DEFAULT_N
+        limit = _history_default_n()
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
 
-    messages = await _repo.get_history(user_id, limit)
-    if not messages:
+    text, kb = await _history_page(user_id, limit)
+    if not text:
         await m.reply("История пуста.")
         return
+    await m.reply(text, reply_markup=kb)
+
+
+# REGION AI: keyset history pages
+@router.callback_query(F.data.startswith("hp:"))
+async def history_page_cb(cq: CallbackQuery):
+    history_group = _history_group_id()
+    if history_group and cq.message and cq.message.chat.id != history_group:
+        await cq.answer()
+        return
+    try:
+        _, user_id, limit, direction, ts, msg_id = cq.data.split(":")
+        cursor = (int(ts), int(msg_id))
+        if direction == "o":
+            text, kb = await _history_page(int(user_id), int(limit), before=cursor)
+        else:
+            text, kb = await _history_page(int(user_id), int(limit), after=cursor)
+        if text:
+            await cq.message.edit_text(text, reply_markup=kb)
+        else:
+            await cq.answer("Больше сообщений нет")
+            return
+    except Exception as e:
+        log.warning("history paging failed: %s", e)
+    await cq.answer()
+# END REGION AI
+
+# REGION AI: full-text search
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+SEARCH_TOKEN_TTL = int(os.getenv("SEARCH_TOKEN_TTL", "86400"))
+# search:<token> -> [query, user_id] в общем хранилище: callback_data ограничена
+# 64 байтами, а кнопку может нажать любой воркер
+
+
+async def _search_query(token: str) -> Optional[tuple]:
+    raw = await get_state().get(f"search:{token}")
+    if raw is None:
+        return None
+    query, user_id = json.loads(raw)
+    return query, user_id
+
+
+def _search_allowed(chat_id: int) -> bool:
+    allowed = {cid for cid in (_history_group_id(), _relay_group_id()) if cid}
+    return not allowed or chat_id in allowed
+
+
+def _fmt_snippet(snippet: str) -> str:
+    from shared.db.repo import SNIPPET_CLOSE, SNIPPET_OPEN
+
+    text = html.escape((snippet or "").replace("\n", " "))
+    return text.replace(SNIPPET_OPEN, "<b>").replace(SNIPPET_CLOSE, "</b>")
+
+
+async def _search_page(
+    token: str, offset: int, query: str, user_id: Optional[int]
+) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    from shared.db.repo import search_messages
+
+    hits = await search_messages(query, user_id, limit=SEARCH_PAGE_SIZE + 1, offset=offset)
+    has_more = len(hits) > SEARCH_PAGE_SIZE
+    hits = hits[:SEARCH_PAGE_SIZE]
+    scope = f" у {user_id}" if user_id else ""
+    if not hits:
+        return f"🔎 «{html.escape(query)}»{scope}: ничего не найдено.", None
+
+    lines = [f"🔎 «{html.escape(query)}»{scope}, результаты {offset + 1}–{offset + len(hits)}:"]
+    for rec in hits:
+        t = time.strftime("%d.%m.%y %H:%M", time.localtime(rec["ts"]))
+        lines.append(f"\n<code>{rec['user_id']}</code> {t} {rec['direction']} [{rec['type']}]\n{_fmt_snippet(rec['snippet'])}")
+
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"fts:{token}:{max(0, offset - SEARCH_PAGE_SIZE)}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"fts:{token}:{offset + SEARCH_PAGE_SIZE}"))
+    return "\n".join(lines), (InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None)
 
-    # Формат: «hh:mm in/out [type] текст/файл (усечён)»
-    def _fmt_msg(rec: Dict[str, Any]) -> str:
-        t = time.strftime("%H:%M", time.localtime(rec.get("ts", _now_ts())))
-        direction = rec.get("direction", "?")
-        typ = rec.get("type", "text")
-        text = (rec.get("text") or rec.get("file_id") or "").replace("\n", " ")
-        if len(text) > 64:
-            text = text[:60] + "…"
-        return f"{t} {direction:<3} [{typ}] {text}"
-
-    chunk = "\n".join(_fmt_msg(r) for r in messages[-limit:])
-    await m.reply(f"История {user_id} (последние {limit}):\n{chunk}")
+
+@router.message(Command("search"))
+async def search_cmd(m: Message, command: CommandObject):
+    """
+    /search <запрос> [user_id]
+    Полнотекстовый поиск (FTS5) по истории переписки, с пагинацией.
+    """
+    if m.chat.type not in {"group", "supergroup"} or not _search_allowed(m.chat.id):
+        return
+    args = (command.args or "").split()
+    user_id: Optional[int] = None
+    if len(args) > 1 and args[-1].isdigit():
+        user_id = int(args.pop())
+    query = " ".join(args).strip()
+    if not query:
+        await m.reply("Использование: /search <запрос> [user_id]")
+        return
+
+    token = secrets.token_urlsafe(6)
+    try:
+        await get_state().set(f"search:{token}", json.dumps([query, user_id]), ttl=SEARCH_TOKEN_TTL)
+        text, kb = await _search_page(token, 0, query, user_id)
+    except Exception as e:
+        log.warning("search failed: %s", e)
+        await m.reply("Поиск недоступен.")
+        return
+    await m.reply(text, parse_mode="HTML", reply_markup=kb)
+
+
+@router.callback_query(F.data.startswith("fts:"))
+async def search_page_cb(cq: CallbackQuery):
+    try:
+        _, token, offset = cq.data.split(":", 2)
+        saved = await _search_query(token)
+        if saved is None:
+            await cq.answer("Поиск устарел, повторите /search", show_alert=True)
+            return
+        text, kb = await _search_page(token, int(offset), *saved)
+        await cq.message.edit_text(text, parse_mode="HTML", reply_markup=kb)
+    except Exception as e:
+        log.warning("search paging failed: %s", e)
+    await cq.answer()
+# END REGION AI
 
 # REGION AI: link command
 ADMIN_IDS: set[int] = set()
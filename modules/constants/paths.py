@@ -7,3 +7,12 @@ DATA_DIR = BASE_DIR / "data"
 START_PHOTO = (DATA_DIR / "start.jpg").resolve()
 VIP_PHOTO = (DATA_DIR / "vip_banner.jpg").resolve()
 # END REGION AI
+
+# REGION AI: local assets registry
+# Все локальные медиа, которые бот отправляет пользователям.
+# shared.utils.media кеширует их Telegram file_id (загрузка — один раз).
+LOCAL_ASSETS = {
+    "start": START_PHOTO,
+    "vip": VIP_PHOTO,
+}
+# END REGION AI
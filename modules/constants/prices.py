@@ -1,12 +1,26 @@
 import os
+from typing import Dict
+
+from shared.config.env import setting
 
 # Default prices in USD for various plans
 VIP_PRICE_USD = float(os.getenv("VIP_30D_USD", "25"))
 
-CHAT_PRICES_USD = {
-    "chat_7": float(os.getenv("CHAT_7D_USD", "5")),
-    "chat_15": float(os.getenv("CHAT_15D_USD", "9")),
-    "chat_30": float(os.getenv("CHAT_30D_USD", "15")),
-}
 
-__all__ = ("VIP_PRICE_USD", "CHAT_PRICES_USD")
+# REGION AI: hot reload
+# Живые цены чат-планов (после hot reload) — через chat_prices_usd(), по тем же
+# кодам планов, что в callback'ах.  Переменные CHAT_PLAN_<N>D_USD — новые:
+# старая CHAT_30D_USD — это Config.chat_price_usd и на цену плана не влияет.
+# Цена VIP живёт в Config.vip_price_usd (current_config() уже перечитывается).
+CHAT_PLAN_DEFAULTS_USD = {"chat_10d": 9.0, "chat_20d": 17.0, "chat_30d": 25.0}
+
+
+def chat_prices_usd() -> Dict[str, float]:
+    """Live chat plan prices keyed by plan code; ``CHAT_PLAN_10D_USD`` etc. override the defaults."""
+    return {
+        code: setting(f"CHAT_PLAN_{code.split('_', 1)[1].upper()}_USD", default=default, cast=float)
+        for code, default in CHAT_PLAN_DEFAULTS_USD.items()
+    }
+# END REGION AI
+
+__all__ = ("VIP_PRICE_USD", "CHAT_PLAN_DEFAULTS_USD", "chat_prices_usd")
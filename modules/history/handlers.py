@@ -9,6 +9,8 @@ history back to the operator, keeping storage lightweight.
 Usage::
 
     /history <user_id> [N]
+    /history <user_id> replay [N]
+    /history <user_id> export [jsonl|csv]
 
 Where ``user_id`` is the numeric Telegram ID of the user whose
 history you want to inspect, and ``N`` is an optional limit on the
@@ -19,18 +21,38 @@ variables; if none are set, 20 is used).
 The command only responds inside the configured ``HISTORY_GROUP_ID``
 (or ``CHAT_GROUP_ID`` if ``HISTORY_GROUP_ID`` is not set) to avoid
 leaking user data in unintended chats.
+
+``export`` streams the *whole* conversation from SQLite in batches,
+writes it gzip-compressed to a temporary file and sends it as a single
+document, so memory use stays flat even for 100k+ messages.
 """
 
 from __future__ import annotations
 
+import io
 import os
+import csv
+import gzip
+import json
+import time
+import asyncio
 import logging
-from typing import Any, Dict, List, Optional
+import tempfile
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 from aiogram import Router, Bot
 from aiogram.filters import Command, CommandObject
-from aiogram.types import Message
-
+from aiogram.types import (
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    FSInputFile,
+    InputMediaVideo,
+    Message,
+)
+
+from shared.config.env import setting
 from shared.utils.telegram import send_with_retry
 
 logger = logging.getLogger("juicyfox.history")
@@ -44,15 +66,36 @@ router = Router()
 # defined, fall back to CHAT_GROUP_ID (so that history can be requested in
 # the same group as relay messages).  If neither is set or set to zero, the
 # command is effectively disabled.
-HISTORY_GROUP_ID = int(os.getenv("HISTORY_GROUP_ID") or os.getenv("CHAT_GROUP_ID") or "0")
+#
+# These three settings are read on every command, so they follow hot
+# reloads (shared.config.env.setting).
+def _history_group_id() -> int:
+    return setting("HISTORY_GROUP_ID", "CHAT_GROUP_ID", default=0, cast=int)
+
 
 # Default number of messages to return when the limit is not specified.
 # Use HISTORY_DEFAULT_N if defined; otherwise fallback to RELAY_HISTORY_DEFAULT
 # (used by chat_relay), else 20.
-try:
-    HISTORY_DEFAULT_N = int(os.getenv("HISTORY_DEFAULT_N") or os.getenv("RELAY_HISTORY_DEFAULT") or "20")
-except Exception:
-    HISTORY_DEFAULT_N = 20
+def _history_default_n() -> int:
+    return setting("HISTORY_DEFAULT_N", "RELAY_HISTORY_DEFAULT", default=20, cast=int)
+
+
+# Replay pacing.  Telegram allows roughly 20 messages per minute into one
+# group; every album item counts as a message.  Text records are merged
+# into messages up to Telegram's 4096-character limit.
+def _group_rate() -> int:
+    return setting("HISTORY_GROUP_RATE", default=20, cast=int)
+
+
+HISTORY_TEXT_LIMIT = 4096
+HISTORY_CAPTION_LIMIT = 1024
+HISTORY_ALBUM_MAX = 10
+HISTORY_PROGRESS_INTERVAL = 3.0
+
+# Export: rows per read/write batch and Telegram's bot upload limit.
+HISTORY_EXPORT_BATCH = int(os.getenv("HISTORY_EXPORT_BATCH", "1000"))
+HISTORY_EXPORT_MAX_BYTES = 50 * 1024 * 1024
+_EXPORT_FIELDS = ("ts", "direction", "type", "text", "file_id")
 
 # ---------------------------------------------------------------------------
 # Repository interface
@@ -161,11 +204,273 @@ async def _send_record(bot: Bot, chat_id: int, rec: Dict[str, Any]) -> None:
         logger.warning("history: failed to send record (%s): %s", typ, e)
 
 
+# ---------------------------------------------------------------------------
+# Batched replay
+# ---------------------------------------------------------------------------
+# Records are grouped into as few API calls as possible: consecutive text
+# records are merged into chunks of up to 4096 characters, consecutive
+# photos/videos (and, separately, documents or audio files) become
+# ``send_media_group`` albums of up to 10 items.  Everything else (voice,
+# stickers, video notes, animations) is sent one by one.  Sends to one chat
+# must stay ordered, so steps run sequentially, paced by ``_GroupPacer``.
+
+_ALBUM_FAMILY = {"photo": "visual", "video": "visual", "document": "document", "audio": "audio"}
+_INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+
+class _GroupPacer:
+    """Sliding one-minute window limiting messages sent into a group."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.per_minute = max(1, per_minute)
+        self._sent: Deque[float] = deque()
+
+    async def acquire(self, n: int = 1) -> None:
+        n = min(max(1, n), self.per_minute)
+        while True:
+            now = time.monotonic()
+            while self._sent and now - self._sent[0] >= 60.0:
+                self._sent.popleft()
+            if len(self._sent) + n <= self.per_minute:
+                self._sent.extend([now] * n)
+                return
+            # ждём, пока из окна выпадет достаточно старых отправок
+            await asyncio.sleep(60.0 - (now - self._sent[len(self._sent) + n - self.per_minute - 1]) + 0.05)
+
+
+def _fmt_line(rec: Dict[str, Any]) -> str:
+    t = time.strftime("%d.%m %H:%M", time.localtime(int(rec.get("ts") or 0)))
+    return f"{t} {rec.get('direction', '?')}: {rec.get('text') or ''}"
+
+
+def _chunk_text(lines: List[str], limit: int = HISTORY_TEXT_LIMIT) -> List[str]:
+    chunks: List[str] = []
+    buf = ""
+    for line in lines:
+        while len(line) > limit:  # одна запись длиннее лимита
+            if buf:
+                chunks.append(buf)
+                buf = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{buf}\n\n{line}" if buf else line
+        if len(candidate) > limit:
+            chunks.append(buf)
+            buf = line
+        else:
+            buf = candidate
+    if buf:
+        chunks.append(buf)
+    return chunks
+
+
+def _plan_steps(records: List[Dict[str, Any]]) -> List[Tuple[str, Any, int]]:
+    """Turn records into ``(kind, payload, n_records)`` send steps."""
+    steps: List[Tuple[str, Any, int]] = []
+    texts: List[str] = []
+    album: List[Dict[str, Any]] = []
+
+    def flush_texts() -> None:
+        if texts:
+            chunks = _chunk_text(texts)
+            for i, chunk in enumerate(chunks):
+                # записи засчитываем по последнему чанку, чтобы прогресс не врал
+                steps.append(("text", chunk, len(texts) if i == len(chunks) - 1 else 0))
+            texts.clear()
+
+    def flush_album() -> None:
+        if len(album) == 1:
+            steps.append(("single", album[0], 1))
+        elif album:
+            steps.append(("album", list(album), len(album)))
+        album.clear()
+
+    for rec in records:
+        typ = rec.get("type") or "text"
+        file_id = rec.get("file_id")
+        if typ == "text":
+            flush_album()
+            texts.append(_fmt_line(rec))
+            continue
+        family = _ALBUM_FAMILY.get(typ) if file_id else None
+        if family:
+            flush_texts()
+            if album and (
+                _ALBUM_FAMILY.get(album[0].get("type")) != family or len(album) >= HISTORY_ALBUM_MAX
+            ):
+                flush_album()
+            album.append(rec)
+            continue
+        flush_texts()
+        flush_album()
+        steps.append(("single", rec, 1))
+    flush_texts()
+    flush_album()
+    return steps
+
+
+async def _send_step(bot: Bot, chat_id: int, kind: str, payload: Any) -> None:
+    if kind == "text":
+        await send_with_retry(bot.send_message, chat_id, payload, logger=logger)
+    elif kind == "album":
+        media = [
+            _INPUT_MEDIA[rec["type"]](
+                media=rec["file_id"],
+                caption=(rec.get("text") or None) and str(rec["text"])[:HISTORY_CAPTION_LIMIT],
+            )
+            for rec in payload
+        ]
+        await send_with_retry(bot.send_media_group, chat_id, media, logger=logger)
+    else:
+        await _send_record(bot, chat_id, payload)
+
+
+async def _replay(msg: Message, user_id: int, records: List[Dict[str, Any]]) -> None:
+    bot = msg.bot
+    chat_id = msg.chat.id
+    steps = _plan_steps(records)
+    total = len(records)
+    pacer = _GroupPacer(_group_rate())
+
+    await pacer.acquire()
+    status: Optional[Message] = None
+    try:
+        status = await msg.reply(f"⏳ История {user_id}: 0/{total}")
+    except Exception as e:
+        logger.warning("history: cannot send progress message: %s", e)
+
+    done = 0
+    last_progress = time.monotonic()
+    for kind, payload, n_records in steps:
+        await pacer.acquire(len(payload) if kind == "album" else 1)
+        try:
+            await _send_step(bot, chat_id, kind, payload)
+        except Exception as e:
+            logger.warning("history: failed to send %s step: %s", kind, e)
+        done += n_records
+        if status and time.monotonic() - last_progress >= HISTORY_PROGRESS_INTERVAL:
+            last_progress = time.monotonic()
+            try:
+                await status.edit_text(f"⏳ История {user_id}: {done}/{total}")
+            except Exception:
+                pass
+
+    if status:
+        try:
+            await status.edit_text(
+                f"✅ История {user_id}: {total} записей, {len(steps)} сообщений"
+            )
+        except Exception:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Streaming export
+# ---------------------------------------------------------------------------
+
+async def _iter_all_history(user_id: int):
+    """Yield every record for ``user_id`` (oldest→newest) without buffering."""
+    if _shared_repo and hasattr(_shared_repo, "iter_history"):
+        async for rec in _shared_repo.iter_history(user_id, HISTORY_EXPORT_BATCH):  # type: ignore
+            yield rec
+        return
+    for rec in await _get_history(user_id, 10**9):
+        yield rec
+
+
+def _encode_batch(batch: List[Dict[str, Any]], fmt: str) -> str:
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for rec in batch:
+            writer.writerow([rec.get(f) if rec.get(f) is not None else "" for f in _EXPORT_FIELDS])
+        return buf.getvalue()
+    return "".join(
+        json.dumps({f: rec.get(f) for f in _EXPORT_FIELDS}, ensure_ascii=False) + "\n"
+        for rec in batch
+    )
+
+
+async def _export(msg: Message, user_id: int, fmt: str) -> None:
+    fd, path = tempfile.mkstemp(prefix=f"history_{user_id}_", suffix=f".{fmt}.gz")
+    os.close(fd)
+    total = 0
+    try:
+        gz = gzip.open(path, "wt", encoding="utf-8", newline="")
+        try:
+            if fmt == "csv":
+                await asyncio.to_thread(gz.write, ",".join(_EXPORT_FIELDS) + "\r\n")
+            batch: List[Dict[str, Any]] = []
+            async for rec in _iter_all_history(user_id):
+                batch.append(rec)
+                if len(batch) >= HISTORY_EXPORT_BATCH:
+                    # сжатие — CPU, не держим event loop
+                    await asyncio.to_thread(gz.write, _encode_batch(batch, fmt))
+                    total += len(batch)
+                    batch = []
+            if batch:
+                await asyncio.to_thread(gz.write, _encode_batch(batch, fmt))
+                total += len(batch)
+        finally:
+            await asyncio.to_thread(gz.close)
+
+        if not total:
+            await msg.reply("История пуста.")
+            return
+        size = os.path.getsize(path)
+        if size > HISTORY_EXPORT_MAX_BYTES:
+            await msg.reply(f"Экспорт слишком большой для Telegram ({size // (1024 * 1024)} МБ).")
+            return
+        await send_with_retry(
+            msg.bot.send_document,
+            msg.chat.id,
+            FSInputFile(path, filename=f"history_{user_id}.{fmt}.gz"),
+            caption=f"📦 История {user_id}: {total} сообщений ({fmt}, gzip)",
+            logger=logger,
+        )
+    except Exception as e:
+        logger.exception("history: export failed for %s: %s", user_id, e)
+        await msg.reply("Не удалось выгрузить историю.")
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+async def replay_history(msg: Message, user_id: int, limit: int) -> None:
+    """Replay the last ``limit`` records of ``user_id`` into ``msg``'s chat (albums, merged text).
+
+    Also used by ``/history <id> replay [N]`` in modules/chat_relay.
+    """
+    records = await _get_history(user_id, limit)
+    if not records:
+        await msg.reply("История пуста.")
+        return
+    # Replay in chronological order (oldest→newest), batched and paced.
+    await _replay(msg, user_id, records[-limit:])
+
+
+async def export_history(msg: Message, user_id: int, fmt: str = "jsonl") -> None:
+    """Stream the whole history of ``user_id`` as a gzip document in reply to ``msg``.
+
+    Also used by ``/history <id> export`` in modules/chat_relay, whose
+    ``/history`` handler is registered first and shadows this router's.
+    """
+    await _export(msg, user_id, fmt)
+
+
 @router.message(Command("history"))
 async def history_cmd(msg: Message, command: CommandObject) -> None:
     """Handle the /history command.
 
-    Expected syntax: ``/history <user_id> [limit]``.  Only responds
+    Expected syntax: ``/history <user_id> [limit]`` or
+    ``/history <user_id> export [jsonl|csv]``.  Only responds
     inside the configured history group to prevent accidental leaks of
     conversation logs.
     """
@@ -173,26 +478,29 @@ async def history_cmd(msg: Message, command: CommandObject) -> None:
     if msg.chat.type not in {"group", "supergroup"}:
         return
     # Respect the history group limitation
-    if HISTORY_GROUP_ID and msg.chat.id != HISTORY_GROUP_ID:
+    history_group = _history_group_id()
+    if history_group and msg.chat.id != history_group:
         return
 
     args = (command.args or "").split()
     if not args:
         await msg.reply("Использование: /history <user_id> [N]")
         return
-    # Parse user_id and optional limit
+    if len(args) > 1 and args[1].lower() == "export":
+        fmt = args[2].lower() if len(args) > 2 else "jsonl"
+        if not args[0].lstrip("-").isdigit() or fmt not in {"jsonl", "csv"}:
+            await msg.reply("Использование: /history <user_id> export [jsonl|csv]")
+            return
+        await export_history(msg, int(args[0]), fmt)
+        return
+    # Parse user_id and optional limit (``replay`` keyword is accepted too)
+    if len(args) > 1 and args[1].lower() == "replay":
+        args = [args[0], *args[2:]]
     try:
         user_id = int(args[0])
-        limit = int(args[1]) if len(args) > 1 else HISTORY_DEFAULT_N
+        limit = int(args[1]) if len(args) > 1 else _history_default_n()
     except Exception:
         await msg.reply("Использование: /history <user_id> [N]")
         return
 
-    # Retrieve history
-    records = await _get_history(user_id, limit)
-    if not records:
-        await msg.reply("История пуста.")
-        return
-    # Send each record.  We preserve chronological order (oldest→newest).
-    for rec in records[-limit:]:
-        await _send_record(msg.bot, msg.chat.id, rec)
+    await replay_history(msg, user_id, limit)
@@ -4,6 +4,7 @@ Payments package (Plan A).
 
 Стабильный публичный API:
     - create_invoice(...)
+    - get_invoices(invoice_ids)
     - normalize_webhook(payload)
 
 Обычно используем так:
@@ -19,6 +20,7 @@ class InvoiceResponse(TypedDict, total=False):
     url: str
     provider: str
     invoice_id: str
+    expires_at: int  # unix time, если провайдер задал срок счёта
 
 
 class InvoiceRequest(TypedDict, total=False):
@@ -33,10 +35,23 @@ class ProviderError(Exception):
     """Исключение уровня платёжного провайдера/сервиса."""
 
 
+# REGION AI: provider gateway
+class ProviderUnavailable(ProviderError):
+    """Провайдер недоступен: открыт предохранитель, истёк дедлайн, нет слота или сети.
+
+    Хендлеры показывают пользователю «попробуйте позже» (``provider_busy``).
+    """
+
+
+class ProviderRejected(ProviderError):
+    """Провайдер ответил, но отклонил запрос (4xx) — это не сбой сервиса."""
+# END REGION AI
+
+
 # Пытаемся импортировать реальную реализацию из service.py.
 # Если её ещё нет, даём мягкие заглушки с понятной ошибкой.
 try:  # pragma: no cover
-    from .service import create_invoice, normalize_webhook  # type: ignore
+    from .service import create_invoice, get_invoices, normalize_webhook  # type: ignore
 except Exception:  # pragma: no cover
     async def create_invoice(*args, **kwargs) -> InvoiceResponse:  # type: ignore
         raise ProviderError("payments.service.create_invoice is not implemented yet")
@@ -44,11 +59,17 @@ except Exception:  # pragma: no cover
     def normalize_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:  # type: ignore
         raise ProviderError("payments.service.normalize_webhook is not implemented yet")
 
+    async def get_invoices(*args, **kwargs):  # type: ignore
+        raise ProviderError("payments.service.get_invoices is not implemented yet")
+
 
 __all__ = [
     "create_invoice",
+    "get_invoices",
     "normalize_webhook",
     "ProviderError",
+    "ProviderRejected",
+    "ProviderUnavailable",
     "InvoiceRequest",
     "InvoiceResponse",
 ]
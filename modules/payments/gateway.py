@@ -0,0 +1,167 @@
+# modules/payments/gateway.py
+"""Шлюз вызовов платёжных провайдеров.
+
+Каждый HTTP-вызов провайдера идёт через :func:`call`:
+
+* **дедлайн** — ``PROVIDER_DEADLINE`` секунд на вызов (вместо 20 с
+  таймаута aiohttp), ожидание свободного слота входит в дедлайн;
+* **ограничение параллелизма** — не больше ``PROVIDER_CONCURRENCY``
+  одновременных вызовов на провайдера, остальные ждут слот до дедлайна;
+* **предохранитель** — после ``PROVIDER_BREAKER_FAILURES`` сбоев подряд
+  провайдер считается недоступным на ``PROVIDER_BREAKER_COOLDOWN`` секунд:
+  вызовы сразу получают :class:`~modules.payments.ProviderUnavailable`, а
+  хендлер показывает пользователю «попробуйте позже». Затем пропускается
+  один пробный вызов: успех закрывает предохранитель, сбой — снова открывает.
+
+Сбоем считаются таймаут, сетевая ошибка и ответ 5xx/не-JSON; отказ по
+существу запроса (:class:`~modules.payments.ProviderRejected`, 4xx) —
+нет, сервис провайдера при этом работает.
+
+Метрики (по провайдеру и эндпоинту): ``juicyfox_provider_latency_seconds``,
+``juicyfox_provider_errors_total{kind}``, ``juicyfox_provider_circuit_open``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from shared.utils.metrics import Counter, Gauge, Histogram
+
+from . import ProviderRejected, ProviderUnavailable
+
+log = logging.getLogger("juicyfox.payments.gateway")
+
+PROVIDER_DEADLINE = float(os.getenv("PROVIDER_DEADLINE", "5"))
+PROVIDER_CONCURRENCY = int(os.getenv("PROVIDER_CONCURRENCY", "20"))
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "5"))
+PROVIDER_BREAKER_COOLDOWN = float(os.getenv("PROVIDER_BREAKER_COOLDOWN", "30"))
+
+LATENCY = Histogram(
+    "juicyfox_provider_latency_seconds",
+    "Payment provider call latency",
+    ["provider", "endpoint"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10),
+)
+ERRORS = Counter(
+    "juicyfox_provider_errors_total",
+    "Failed payment provider calls by kind (timeout, error, rejected, open, busy)",
+    ["provider", "endpoint", "kind"],
+)
+CIRCUIT_OPEN = Gauge("juicyfox_provider_circuit_open", "1 while the provider circuit breaker is open", ["provider"])
+
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """closed → (N сбоев подряд) → open → (cooldown) → half-open → closed/open."""
+
+    def __init__(self, name: str, failures: int, cooldown: float) -> None:
+        self.name = name
+        self.max_failures = max(1, failures)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probe:
+            self._probe = True  # ровно один пробный вызов
+            return True
+        return False
+
+    def success(self) -> None:
+        if self.opened_at is not None:
+            log.info("provider %s: circuit closed", self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+        CIRCUIT_OPEN.labels(provider=self.name).set(0)
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._probe = False
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            if self.opened_at is None:
+                log.warning("provider %s: circuit open after %s failures", self.name, self.failures)
+            self.opened_at = time.monotonic()
+            CIRCUIT_OPEN.labels(provider=self.name).set(1)
+
+    def release_probe(self) -> None:
+        """Пробный вызов не дошёл до провайдера — разрешить следующий."""
+        self._probe = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+def breaker(provider: str) -> CircuitBreaker:
+    if provider not in _breakers:
+        _breakers[provider] = CircuitBreaker(provider, PROVIDER_BREAKER_FAILURES, PROVIDER_BREAKER_COOLDOWN)
+    return _breakers[provider]
+
+
+def _slot(provider: str) -> asyncio.Semaphore:
+    if provider not in _slots:
+        _slots[provider] = asyncio.Semaphore(PROVIDER_CONCURRENCY)
+    return _slots[provider]
+
+
+async def call(
+    provider: str,
+    endpoint: str,
+    fn: Callable[[], Awaitable[T]],
+    *,
+    deadline: Optional[float] = None,
+) -> T:
+    """Выполнить ``fn()`` с дедлайном, лимитом параллелизма и предохранителем."""
+    deadline = PROVIDER_DEADLINE if deadline is None else deadline
+    cb = breaker(provider)
+    if not cb.allow():
+        ERRORS.labels(provider=provider, endpoint=endpoint, kind="open").inc()
+        raise ProviderUnavailable(f"{provider} is unavailable (circuit open)")
+    started = time.monotonic()
+    slot = _slot(provider)
+    try:
+        await asyncio.wait_for(slot.acquire(), timeout=deadline)
+    except asyncio.TimeoutError:
+        cb.release_probe()
+        ERRORS.labels(provider=provider, endpoint=endpoint, kind="busy").inc()
+        raise ProviderUnavailable(f"{provider} is busy ({PROVIDER_CONCURRENCY} calls in flight)")
+    try:
+        remaining = max(0.1, deadline - (time.monotonic() - started))
+        result = await asyncio.wait_for(fn(), timeout=remaining)
+    except asyncio.TimeoutError:
+        cb.failure()
+        ERRORS.labels(provider=provider, endpoint=endpoint, kind="timeout").inc()
+        raise ProviderUnavailable(f"{provider} {endpoint}: no answer in {deadline:.1f}s")
+    except ProviderRejected:
+        cb.success()  # провайдер ответил — он жив
+        ERRORS.labels(provider=provider, endpoint=endpoint, kind="rejected").inc()
+        raise
+    except asyncio.CancelledError:
+        cb.release_probe()
+        raise
+    except Exception:
+        cb.failure()
+        ERRORS.labels(provider=provider, endpoint=endpoint, kind="error").inc()
+        raise
+    finally:
+        slot.release()
+        LATENCY.labels(provider=provider, endpoint=endpoint).observe(time.monotonic() - started)
+    cb.success()
+    return result
@@ -9,8 +9,8 @@ from aiogram.types import CallbackQuery
 from aiogram.types import Message, LabeledPrice
 from modules.access import grant
 # REGION AI: price constants
-from shared.config.env import config
-from modules.constants.prices import CHAT_PRICES_USD
+from shared.config.env import current_config
+from modules.constants.prices import chat_prices_usd
 # END REGION AI
 # END REGION AI
 from modules.common.i18n import tr
@@ -18,6 +18,7 @@ from modules.ui_membership.chat_keyboards import chat_currency_kb
 from modules.ui_membership.keyboards import vip_currency_kb, donate_currency_keyboard
 from shared.utils.lang import get_lang
 from shared.db.repo import get_active_invoice, delete_pending_invoice
+from shared.utils.outbound import TRANSACTIONAL, in_lane
 from shared.utils.telegram import send_with_retry
 
 
@@ -48,7 +49,7 @@ async def cancel_payment(callback: CallbackQuery, state: FSMContext) -> None:
     )
 
     if plan_callback.startswith("vipay") or plan_code.startswith("vip"):
-        desc = tr(lang, "vip_club_description", amount=int(config.vip_price_usd))
+        desc = tr(lang, "vip_club_description", amount=int(current_config().vip_price_usd))
         kb = vip_currency_kb(lang)
         await state.clear()
         await state.update_data(
@@ -89,7 +90,7 @@ async def cancel_payment(callback: CallbackQuery, state: FSMContext) -> None:
 
 # REGION AI: Telegram Stars payments
 CHAT_STAR_PLANS = {
-    k: (f"Chat {d}", d, CHAT_PRICES_USD.get(k, p))
+    k: (f"Chat {d}", d, p)
     for k, (d, p) in {"chat_10d": (10, 9.0), "chat_20d": (20, 17.0), "chat_30d": (30, 25.0)}.items()
 }
 
@@ -102,6 +103,7 @@ async def pay_stars(callback: CallbackQuery, state: FSMContext) -> None:
     plan_callback = data.get("plan_callback") or ""
     if plan_code in CHAT_STAR_PLANS:
         title, period, price_usd = CHAT_STAR_PLANS[plan_code]
+        price_usd = chat_prices_usd().get(plan_code, price_usd)  # живая цена (hot reload)
         stars = int(price_usd * 100)
         await state.update_data(
             plan_name=title,
@@ -117,8 +119,8 @@ async def pay_stars(callback: CallbackQuery, state: FSMContext) -> None:
             await state.update_data(
                 plan_code="vip_30d",
                 plan_callback="vip",
-                plan_name=f"VIP CLUB - {int(config.vip_price_usd)}$",
-                stars=int(config.vip_price_usd * 100),
+                plan_name=f"VIP CLUB - {int(current_config().vip_price_usd)}$",
+                stars=int(current_config().vip_price_usd * 100),
             )
             data = await state.get_data()
             plan_code = data.get("plan_code") or ""
@@ -129,11 +131,11 @@ async def pay_stars(callback: CallbackQuery, state: FSMContext) -> None:
             else "donate"
         )
         title = data.get("plan_name") or (
-            f"VIP CLUB - {int(config.vip_price_usd)}$"
+            f"VIP CLUB - {int(current_config().vip_price_usd)}$"
             if purchase == "vip"
             else purchase
         )
-        stars = int(data.get("stars") or int(config.vip_price_usd * 100))
+        stars = int(data.get("stars") or int(current_config().vip_price_usd * 100))
     await send_with_retry(
         callback.message.answer_invoice,
         title=title,
@@ -147,12 +149,13 @@ async def pay_stars(callback: CallbackQuery, state: FSMContext) -> None:
 
 
 @router.message(F.successful_payment)
+@in_lane(TRANSACTIONAL)
 async def stars_success(message: Message) -> None:
     lang = get_lang(message.from_user)
     purchase, _, plan_code = message.successful_payment.invoice_payload.partition(":")
     if purchase in {"vip", "chat"}:
         default_code = "vip_30d" if purchase == "vip" else "chat_10d"
-        await grant(message.from_user.id, plan_code or default_code, bot=message.bot)
+        await grant(message.from_user.id, plan_code or default_code, bot=message.bot, lang=lang)
         await send_with_retry(message.answer, tr(lang, "pay_conf"), logger=log)
     else:
         amount = message.successful_payment.total_amount
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, Protocol
+from typing import Any, Callable, Dict, List, Optional, Protocol
 
 from .. import InvoiceResponse, ProviderError
 
@@ -10,18 +10,58 @@ PAYMENT_PROVIDER = os.getenv("PAYMENT_PROVIDER", "cryptobot").lower()
 
 
 class PaymentsProvider(Protocol):
+    name: str
+    page_size: int  # сколько id принимает get_invoices за вызов
+
+    @property
+    def configured(self) -> bool: ...
     async def create_invoice(
         self, amount_usd: float, title: str, meta: Dict[str, Any], asset: str = "USD"
     ) -> InvoiceResponse: ...
+    async def get_invoices(self, invoice_ids: List[str]) -> List[Dict[str, Any]]: ...
     def normalize_webhook(self, payload: Dict[str, Any]) -> Dict[str, Any]: ...
+    async def close(self) -> None: ...
+
+
+# REGION AI: provider registry
+_REGISTRY: Dict[str, Callable[[], PaymentsProvider]] = {}
+_INSTANCES: Dict[str, PaymentsProvider] = {}
+
+
+def register_provider(name: str) -> Callable[[Callable[[], PaymentsProvider]], Callable[[], PaymentsProvider]]:
+    """Декоратор класса/фабрики провайдера: ``@register_provider("cryptobot")``."""
+
+    def deco(factory: Callable[[], PaymentsProvider]) -> Callable[[], PaymentsProvider]:
+        _REGISTRY[name] = factory
+        return factory
 
+    return deco
 
-def get_provider() -> PaymentsProvider:
+
+def _load_builtin() -> None:
+    # встроенные провайдеры регистрируются при импорте модуля
+    from . import cryptobot  # noqa: F401
+
+
+def get_provider(name: Optional[str] = None) -> PaymentsProvider:
     """
-    Возвращает адаптер провайдера по ENV PAYMENT_PROVIDER.
-    Добавление новых провайдеров = новая ветка elif и импорт.
+    Возвращает адаптер провайдера (по умолчанию — ENV PAYMENT_PROVIDER).
+    Один экземпляр на процесс: он держит HTTP-сессию.
+    Новый провайдер = модуль с классом под ``@register_provider(...)``.
     """
-    if PAYMENT_PROVIDER == "cryptobot":
-        from .cryptobot import CryptobotProvider  # локальный импорт
-        return CryptobotProvider()
-    raise ProviderError(f"unknown PAYMENT_PROVIDER={PAYMENT_PROVIDER}")
+    name = (name or PAYMENT_PROVIDER).lower()
+    if name not in _INSTANCES:
+        if name not in _REGISTRY:
+            _load_builtin()
+        factory = _REGISTRY.get(name)
+        if factory is None:
+            raise ProviderError(f"unknown PAYMENT_PROVIDER={name}")
+        _INSTANCES[name] = factory()
+    return _INSTANCES[name]
+
+
+async def close_providers() -> None:
+    """Закрыть HTTP-сессии провайдеров (при остановке приложения)."""
+    for provider in list(_INSTANCES.values()):
+        await provider.close()
+# END REGION AI
@@ -1,20 +1,38 @@
 # modules/payments/providers/cryptobot.py
+"""Клиент CryptoBot (Crypto Pay API) — единственная реализация в проекте.
+
+Все HTTP-вызовы идут через :mod:`modules.payments.gateway` (дедлайн,
+предохранитель, лимит параллелизма, метрики по эндпоинтам) и одну
+переиспользуемую aiohttp-сессию. Курсы ``getExchangeRates`` кэшируются на
+``CRYPTOBOT_RATES_TTL`` секунд — выбор валюты не тратит на них лишний вызов.
+"""
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
-from typing import Any, Dict, Optional
+import time
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
 
 import aiohttp
 
-from .. import InvoiceResponse, ProviderError
+from .. import InvoiceResponse, ProviderError, ProviderRejected, ProviderUnavailable
+from .. import gateway
+from . import register_provider
 
 log = logging.getLogger("juicyfox.payments.providers.cryptobot")
 
 CRYPTOBOT_TOKEN = os.getenv("CRYPTOBOT_TOKEN") or os.getenv("CRYPTO_BOT_TOKEN")
 CRYPTOBOT_API = os.getenv("CRYPTOBOT_API", "https://pay.crypt.bot/api")
+CRYPTOBOT_PAGE = 100  # getInvoices принимает не больше 100 id за вызов
+CRYPTOBOT_RATES_TTL = int(os.getenv("CRYPTOBOT_RATES_TTL", "60"))
+# Срок жизни счёта у провайдера (CryptoBot expires_in: 1…2678400 сек); 0 — бессрочно
+INVOICE_TTL = int(os.getenv("INVOICE_TTL", "3600"))
 
+# Нормализуем статусы к единому виду
 STATUS_MAP = {
     "paid": "paid",
     "expired": "expired",
@@ -23,89 +41,143 @@ STATUS_MAP = {
     "active": "pending",
 }
 
+_QUANTUM = {
+    "BTC": Decimal("0.00000001"),
+    "ETH": Decimal("0.0001"),
+}
+
+
+def _parse_expiration(value: Any) -> Optional[int]:
+    """ISO 8601 ``expiration_date`` CryptoBot → unix time."""
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
 
+@register_provider("cryptobot")
 class CryptobotProvider:
-    async def _convert_amount(self, amount_usd: float, asset: str) -> float:
-        if asset.upper() == "USD":
-            return amount_usd
+    name = "cryptobot"
+    page_size = CRYPTOBOT_PAGE
+
+    def __init__(self) -> None:
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._rates: Tuple[float, Dict[str, Decimal]] = (0.0, {})
+
+    @property
+    def configured(self) -> bool:
+        return bool(CRYPTOBOT_TOKEN)
+
+    def _sess(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(headers={"Crypto-Pay-API-Token": CRYPTOBOT_TOKEN or ""})
+            self._session_loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, method: str, endpoint: str, *, deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        """Вызов Crypto Pay API через шлюз; возвращает ``result`` ответа."""
         if not CRYPTOBOT_TOKEN:
             raise ProviderError("CRYPTOBOT_TOKEN is not set")
-        headers = {"Crypto-Pay-API-Token": CRYPTOBOT_TOKEN}
-        timeout = aiohttp.ClientTimeout(total=20)
-        async with aiohttp.ClientSession(headers=headers, timeout=timeout) as sess:
-            async with sess.get(f"{CRYPTOBOT_API}/getExchangeRates") as resp:
-                text = await resp.text()
+
+        async def _do() -> Any:
+            try:
+                async with self._sess().request(method, f"{CRYPTOBOT_API}/{endpoint}", **kwargs) as resp:
+                    text = await resp.text()
+            except aiohttp.ClientError as e:
+                raise ProviderUnavailable(f"cryptobot {endpoint}: {e}") from e
+            try:
+                data = json.loads(text)
+            except Exception:
+                log.error("cryptobot %s non-JSON response: %s %s", endpoint, resp.status, text[:500])
+                raise ProviderError(f"cryptobot invalid response (status={resp.status})")
+            if resp.status != 200 or not data or not data.get("ok"):
+                log.error("cryptobot %s error resp=%s body=%s", endpoint, resp.status, text[:500])
+                err = ProviderRejected if 400 <= resp.status < 500 and resp.status != 429 else ProviderError
+                raise err(f"cryptobot error: status={resp.status}, body={text[:200]}")
+            return data.get("result")
+
+        return await gateway.call(self.name, endpoint, _do, deadline=deadline)
+
+    async def _rate(self, asset: str) -> Decimal:
+        fetched_at, rates = self._rates
+        if asset not in rates or time.monotonic() - fetched_at > CRYPTOBOT_RATES_TTL:
+            result = await self._request("GET", "getExchangeRates")
+            rates = {}
+            for item in result or []:
+                if item.get("target") != "USD":
+                    continue
                 try:
-                    data = json.loads(text)
+                    rates[str(item.get("source"))] = Decimal(str(item.get("rate") or "0"))
                 except Exception:
-                    log.error(
-                        "cryptobot getExchangeRates non-JSON response: %s %s",
-                        resp.status,
-                        text[:500],
-                    )
-                    raise ProviderError(
-                        f"cryptobot invalid response (status={resp.status})"
-                    )
-                if resp.status != 200 or not data or not data.get("ok"):
-                    log.error(
-                        "cryptobot getExchangeRates error resp=%s body=%s",
-                        resp.status,
-                        text[:500],
-                    )
-                    raise ProviderError(
-                        f"cryptobot error: status={resp.status}, body={text[:200]}"
-                    )
-                rate: Optional[float] = None
-                for item in data.get("result", []):
-                    if item.get("source") == asset.upper() and item.get("target") == "USD":
-                        try:
-                            rate = float(item.get("rate") or 0)
-                        except (TypeError, ValueError):
-                            rate = None
-                        break
-                if not rate:
-                    raise ProviderError(
-                        f"cryptobot exchange rate not found for {asset}"
-                    )
-                return amount_usd / rate
+                    continue
+            self._rates = (time.monotonic(), rates)
+        rate = rates.get(asset)
+        if not rate or rate <= 0:
+            raise ProviderError(f"cryptobot exchange rate not found for {asset}")
+        return rate
+
+    async def _convert_amount(self, amount_usd: float, asset: str) -> Decimal:
+        """Convert amount in USD to selected asset using CryptoBot rates."""
+        asset_upper = asset.upper()
+        # USD не требует запроса курса
+        if asset_upper == "USD":
+            return Decimal(str(amount_usd)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        log.info("cryptobot getExchangeRates: asset=%s amount_usd=%s", asset, amount_usd)
+        amount = Decimal(str(amount_usd)) / await self._rate(asset_upper)
+        amount = amount.quantize(_QUANTUM.get(asset_upper, Decimal("0.01")), rounding=ROUND_HALF_UP)
+        if amount <= 0:
+            raise ProviderError("cryptobot amount is zero after rounding")
+        return amount
 
     async def create_invoice(
         self, amount_usd: float, title: str, meta: Dict[str, Any], asset: str = "USD"
     ) -> InvoiceResponse:
-        if not CRYPTOBOT_TOKEN:
-            raise ProviderError("CRYPTOBOT_TOKEN is not set")
-
         amount = await self._convert_amount(amount_usd, asset)
-        payload = {
-            "amount": f"{amount:.2f}",
+        payload: Dict[str, Any] = {
+            "amount": str(amount),
             "asset": asset.upper(),
             "description": title[:200],
             "payload": json.dumps(meta, ensure_ascii=False),
         }
-        headers = {"Crypto-Pay-API-Token": CRYPTOBOT_TOKEN}
-        timeout = aiohttp.ClientTimeout(total=20)
-
-        async with aiohttp.ClientSession(headers=headers, timeout=timeout) as sess:
-            async with sess.post(f"{CRYPTOBOT_API}/createInvoice", json=payload) as resp:
-                text = await resp.text()
-                try:
-                    data = json.loads(text)
-                except Exception:
-                    log.error("cryptobot non-JSON response: %s %s", resp.status, text[:500])
-                    raise ProviderError(f"cryptobot invalid response (status={resp.status})")
-
-                if resp.status != 200 or not data or not data.get("ok"):
-                    log.error("cryptobot error resp=%s body=%s", resp.status, text[:500])
-                    raise ProviderError(f"cryptobot error: status={resp.status}, body={text[:200]}")
-
-                res = data.get("result") or {}
-                return {
-                    "provider": "cryptobot",
-                    "invoice_id": str(res.get("invoice_id") or res.get("id") or ""),
-                    "pay_url": res.get("pay_url") or res.get("bot_invoice_url") or "",
-                }
+        if INVOICE_TTL > 0:
+            payload["expires_in"] = min(INVOICE_TTL, 2678400)
+        log.info("cryptobot createInvoice: asset=%s amount=%s (usd=%s)", asset, payload["amount"], amount_usd)
+        res = await self._request("POST", "createInvoice", json=payload) or {}
+        inv: InvoiceResponse = {
+            "provider": self.name,
+            "invoice_id": str(res.get("invoice_id") or res.get("id") or ""),
+            "pay_url": res.get("pay_url") or res.get("bot_invoice_url") or "",
+        }
+        expires_at = _parse_expiration(res.get("expiration_date"))
+        if expires_at is None and INVOICE_TTL > 0:
+            expires_at = int(time.time()) + payload["expires_in"]
+        if expires_at is not None:
+            inv["expires_at"] = expires_at
+        return inv
+
+    async def get_invoices(self, invoice_ids: List[str]) -> List[Dict[str, Any]]:
+        """Статусы счетов одним вызовом ``getInvoices`` (до 100 id)."""
+        if not invoice_ids:
+            return []
+        if len(invoice_ids) > CRYPTOBOT_PAGE:
+            raise ProviderError(f"getInvoices accepts at most {CRYPTOBOT_PAGE} ids")
+        params = {"invoice_ids": ",".join(invoice_ids), "count": str(len(invoice_ids))}
+        # фоновая сверка: дедлайн длиннее, чем у кнопок пользователя
+        result = await self._request("GET", "getInvoices", params=params, deadline=gateway.PROVIDER_DEADLINE * 2)
+        items = result.get("items") if isinstance(result, dict) else result
+        return list(items or [])
 
     def normalize_webhook(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # CryptoBot формат: {"update_id":..., "invoice": {...}}
         inv = payload.get("invoice") or {}
         meta: Dict[str, Any] = {}
         raw_meta = inv.get("payload")
@@ -120,7 +192,7 @@ class CryptobotProvider:
         status = STATUS_MAP.get(raw_status, "unknown")
 
         return {
-            "provider": "cryptobot",
+            "provider": self.name,
             "invoice_id": str(inv.get("invoice_id") or inv.get("id") or ""),
             "status": status,
             "amount": float(inv.get("amount") or 0),
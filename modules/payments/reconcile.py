@@ -0,0 +1,116 @@
+# modules/payments/reconcile.py
+"""Сверка незакрытых счетов с CryptoBot.
+
+Если вебхук CryptoBot потерялся, пользователь оплатил, но доступа не
+получил, а строка в ``pending_invoices`` висит вечно. :func:`reconcile_loop`
+периодически берёт открытые счета (не больше ``RECONCILE_LIMIT``), спрашивает
+их статус пачками по 100 id на вызов ``getInvoices`` и прогоняет изменившиеся
+через тот же путь, что и вебхук: ``normalize_webhook`` → ``process_payment_event``.
+
+* ``paid`` — выдать доступ (повтор вебхука отсечёт ключ идемпотентности);
+* ``expired`` / ``cancelled`` — просто закрыть счёт;
+* ``active`` — оставить до следующего прохода.
+
+Строка удаляется ДО обработки, вебхук тоже забирает счёт до выдачи
+(api/payments.py) — сверка не трогает счета, уже пришедшие вебхуком. Если
+выдача упала (и там, и тут), строка возвращается и счёт будет сверен снова.
+
+Интервал адаптивный: ``RECONCILE_INTERVAL`` пока есть открытые счета,
+``RECONCILE_MAX_INTERVAL`` когда их нет, а после ошибок провайдера —
+удвоение до ``RECONCILE_MAX_INTERVAL``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+
+from modules.access import PLAN_MAP, process_payment_event
+from shared.db.repo import delete_pending_invoice, list_pending_invoices, restore_pending_invoice
+from shared.utils.metrics import Counter
+from shared.utils.telegram import Pacer
+
+from .providers import get_provider
+from .service import get_invoices, normalize_webhook
+
+log = logging.getLogger("juicyfox.payments.reconcile")
+
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "60"))
+RECONCILE_MAX_INTERVAL = int(os.getenv("RECONCILE_MAX_INTERVAL", "900"))
+RECONCILE_LIMIT = int(os.getenv("RECONCILE_LIMIT", "1000"))        # счетов за проход
+RECONCILE_RATE = float(os.getenv("RECONCILE_RATE", "2"))           # вызовов getInvoices в секунду
+
+RECONCILED = Counter(
+    "juicyfox_reconciled_invoices_total",
+    "Pending invoices settled by reconciliation, by provider status",
+    ["status"],
+)
+
+
+async def _settle(row: Dict[str, Any], item: Dict[str, Any], bot: Optional[Bot] = None) -> None:
+    invoice_id = row["invoice_id"]
+    event = normalize_webhook({"invoice": item})
+    status = event["status"]
+    if not await delete_pending_invoice(invoice_id):
+        return  # строку уже забрал вебхук или пользователь отменил счёт
+    RECONCILED.labels(status=status).inc()
+    if status != "paid":
+        log.info("reconcile: invoice %s closed as %s", invoice_id, status)
+        return
+    meta = event.get("meta") or {}
+    meta.setdefault("user_id", row["user_id"])
+    meta.setdefault("plan_code", row["plan_code"])
+    meta.setdefault("invoice_id", invoice_id)
+    event["meta"] = meta
+    if meta["plan_code"] not in PLAN_MAP:
+        # донаты и прочее без выдачи доступа
+        log.info("reconcile: invoice %s paid, plan=%s needs no access", invoice_id, meta["plan_code"])
+        return
+    result = await process_payment_event(event, bot=bot)
+    log.warning("reconcile: missed webhook for paid invoice %s: %s", invoice_id, result)
+    if result.get("error"):
+        # вернуть счёт — попробуем на следующем проходе
+        await restore_pending_invoice(row)
+
+
+async def reconcile_once(bot: Optional[Bot] = None) -> int:
+    """Один проход сверки по БД текущего бота; доступ выдаёт ``bot``.
+
+    Возвращает число открытых счетов (для выбора интервала).
+    """
+    rows = await list_pending_invoices(RECONCILE_LIMIT)
+    by_id: Dict[str, Dict[str, Any]] = {str(r["invoice_id"]): r for r in rows}
+    ids: List[str] = [i for i in by_id if i.isdigit()]  # id CryptoBot — числа
+    page = get_provider().page_size
+    pacer = Pacer(RECONCILE_RATE)
+    for start in range(0, len(ids), page):
+        await pacer.wait()
+        for item in await get_invoices(ids[start:start + page]):
+            row = by_id.get(str(item.get("invoice_id") or ""))
+            if row is None or str(item.get("status") or "").lower() == "active":
+                continue
+            try:
+                await _settle(row, item, bot)
+            except Exception as e:
+                log.warning("reconcile: invoice %s failed: %s", row["invoice_id"], e)
+    return len(ids)
+
+
+async def reconcile_loop(bot: Optional[Bot] = None) -> None:
+    """Фоновая задача сверки с адаптивным интервалом (в контексте бота ``bot``, см. tenants.use)."""
+    if not get_provider().configured:
+        return
+    delay = RECONCILE_INTERVAL
+    while True:
+        try:
+            open_count = await reconcile_once(bot)
+            delay = RECONCILE_INTERVAL if open_count else RECONCILE_MAX_INTERVAL
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            delay = min(RECONCILE_MAX_INTERVAL, max(RECONCILE_INTERVAL, delay * 2))
+            log.warning("reconcile: pass failed, retry in %ss: %s", delay, e)
+        await asyncio.sleep(delay)
@@ -1,138 +1,21 @@
 # modules/payments/service.py
+"""Фасад платежей: выбор провайдера и общие операции.
+
+Сетевой код живёт в адаптерах ``modules/payments/providers/*`` (реестр
+``get_provider``), вызовы идут через ``modules/payments/gateway.py``.
+Пока провайдер недоступен, операции сразу бросают
+:class:`~modules.payments.ProviderUnavailable`.
+"""
 from __future__ import annotations
 
-import os
-import json
 import logging
-from decimal import Decimal, ROUND_HALF_UP
-from typing import Any, Dict, Optional
-
-import aiohttp
+from typing import Any, Dict, List, Optional
 
-from . import InvoiceResponse, ProviderError
+from . import InvoiceResponse
+from .providers import PAYMENT_PROVIDER, get_provider
 
 log = logging.getLogger("juicyfox.payments.service")
 
-# --- Провайдеры / ENV ---
-CRYPTOBOT_TOKEN = os.getenv("CRYPTOBOT_TOKEN") or os.getenv("CRYPTO_BOT_TOKEN")
-CRYPTOBOT_API = os.getenv("CRYPTOBOT_API", "https://pay.crypt.bot/api")
-PAYMENT_PROVIDER = os.getenv("PAYMENT_PROVIDER", "cryptobot").lower()
-
-# Нормализуем статусы к единому виду
-STATUS_MAP = {
-    "paid": "paid",
-    "expired": "expired",
-    "cancelled": "cancelled",
-    "canceled": "cancelled",
-    "active": "pending",
-}
-
-
-async def _cryptobot_convert_amount(amount_usd: float, asset: str) -> Decimal:
-    """Convert amount in USD to selected asset using CryptoBot rates."""
-    asset_upper = asset.upper()
-    if not CRYPTOBOT_TOKEN:
-        raise ProviderError("CRYPTOBOT_TOKEN is not set")
-    # USD не требует запроса курса
-    if asset_upper == "USD":
-        return Decimal(str(amount_usd)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    headers = {"Crypto-Pay-API-Token": CRYPTOBOT_TOKEN}
-    timeout = aiohttp.ClientTimeout(total=20)
-    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as sess:
-        log.info(
-            "cryptobot getExchangeRates: asset=%s amount_usd=%s",
-            asset,
-            amount_usd,
-        )
-        async with sess.get(f"{CRYPTOBOT_API}/getExchangeRates") as resp:
-            text = await resp.text()
-            try:
-                data = json.loads(text)
-            except Exception:
-                log.error(
-                    "cryptobot getExchangeRates non-JSON response: %s %s",
-                    resp.status,
-                    text[:500],
-                )
-                raise ProviderError(
-                    f"cryptobot invalid response (status={resp.status})"
-                )
-            if resp.status != 200 or not data or not data.get("ok"):
-                log.error(
-                    "cryptobot getExchangeRates error resp=%s body=%s",
-                    resp.status,
-                    text[:500],
-                )
-                raise ProviderError(
-                    f"cryptobot error: status={resp.status}, body={text[:200]}"
-                )
-            rate: Optional[Decimal] = None
-            for item in data.get("result", []):
-                if item.get("source") == asset_upper and item.get("target") == "USD":
-                    try:
-                        rate = Decimal(str(item.get("rate") or "0"))
-                    except Exception:
-                        rate = None
-                    break
-            if not rate or rate <= 0:
-                raise ProviderError(f"cryptobot exchange rate not found for {asset}")
-            amount = Decimal(str(amount_usd)) / rate
-            quantize_map = {
-                "BTC": Decimal("0.00000001"),
-                "ETH": Decimal("0.0001"),
-            }
-            quantum = quantize_map.get(asset_upper, Decimal("0.01"))
-            amount = amount.quantize(quantum, rounding=ROUND_HALF_UP)
-            if amount <= 0:
-                raise ProviderError("cryptobot amount is zero after rounding")
-            return amount
-
-
-async def _cryptobot_create_invoice(
-    amount_usd: float,
-    title: str,
-    meta: Dict[str, Any],
-    asset: str,
-) -> InvoiceResponse:
-    if not CRYPTOBOT_TOKEN:
-        raise ProviderError("CRYPTOBOT_TOKEN is not set")
-    amount = await _cryptobot_convert_amount(amount_usd, asset)
-    payload = {
-        "amount": str(amount),
-        "asset": asset.upper(),
-        "description": title[:200],
-        "payload": json.dumps(meta, ensure_ascii=False),
-    }
-    headers = {"Crypto-Pay-API-Token": CRYPTOBOT_TOKEN}
-
-    timeout = aiohttp.ClientTimeout(total=20)
-    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as sess:
-        log.info(
-            "cryptobot createInvoice: asset=%s amount=%s (usd=%s)",
-            asset,
-            payload["amount"],
-            amount_usd,
-        )
-        async with sess.post(f"{CRYPTOBOT_API}/createInvoice", json=payload) as resp:
-            # Диагностика на случай неожиданных ответов
-            text = await resp.text()
-            try:
-                data = json.loads(text)
-            except Exception:
-                log.error("cryptobot non-JSON response: %s %s", resp.status, text[:500])
-                raise ProviderError(f"cryptobot invalid response (status={resp.status})")
-
-            if resp.status != 200 or not data or not data.get("ok"):
-                log.error("cryptobot error resp=%s body=%s", resp.status, text[:500])
-                raise ProviderError(f"cryptobot error: status={resp.status}, body={text[:200]}")
-
-            res = data.get("result") or {}
-            return {
-                "provider": "cryptobot",
-                "invoice_id": str(res.get("invoice_id") or res.get("id") or ""),
-                "pay_url": res.get("pay_url") or res.get("bot_invoice_url") or "",
-            }
-
 
 # --- Публичный API сервиса ---
 
@@ -145,28 +28,30 @@ async def create_invoice(
 ) -> InvoiceResponse:
     """
     Создаёт счёт через выбранного провайдера (ENV PAYMENT_PROVIDER, по умолчанию cryptobot).
-    Возвращает dict: {pay_url, provider, invoice_id}.
+    Возвращает dict: {pay_url, provider, invoice_id, expires_at?}.
     Параметр ``asset`` передаётся напрямую провайдеру (например, ``TON``).
     """
     title = f"{plan_code} for user {user_id}"
     merged_meta = {**meta, "user_id": user_id, "plan_code": plan_code}
 
-    if PAYMENT_PROVIDER == "cryptobot":
-        inv = await _cryptobot_create_invoice(
-            amount_usd=amount_usd,
-            title=title,
-            meta=merged_meta,
-            asset=asset,
-        )
-    else:
-        raise ProviderError(f"unknown PAYMENT_PROVIDER={PAYMENT_PROVIDER}")
+    inv = await get_provider().create_invoice(
+        amount_usd=amount_usd,
+        title=title,
+        meta=merged_meta,
+        asset=asset,
+    )
 
     log.info("invoice created: provider=%s id=%s plan=%s user=%s",
              inv.get("provider"), inv.get("invoice_id"), plan_code, user_id)
     return inv
 
 
-def normalize_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
+async def get_invoices(invoice_ids: List[str], provider: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Текущие статусы счетов у провайдера (не больше ``page_size`` id за вызов)."""
+    return await get_provider(provider).get_invoices(invoice_ids)
+
+
+def normalize_webhook(payload: Dict[str, Any], provider: Optional[str] = None) -> Dict[str, Any]:
     """
     Унификация вебхука провайдера.
     Выходной формат:
@@ -179,26 +64,4 @@ def normalize_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
       "meta": {...}
     }
     """
-    # CryptoBot формат: {"update_id":..., "invoice": {...}}
-    inv = payload.get("invoice") or {}
-    meta: Dict[str, Any] = {}
-
-    raw_meta = inv.get("payload")
-    if isinstance(raw_meta, str):
-        try:
-            meta = json.loads(raw_meta)
-        except Exception:
-            log.warning("cryptobot webhook: bad payload JSON: %r", raw_meta)
-            meta = {}
-
-    raw_status = (inv.get("status") or "").lower()
-    status = STATUS_MAP.get(raw_status, "unknown")
-
-    return {
-        "provider": "cryptobot",
-        "invoice_id": str(inv.get("invoice_id") or inv.get("id") or ""),
-        "status": status,
-        "amount": float(inv.get("amount") or 0),
-        "currency": inv.get("asset") or inv.get("currency") or "USD",
-        "meta": meta,
-    }
+    return get_provider(provider or PAYMENT_PROVIDER).normalize_webhook(payload)
@@ -0,0 +1,71 @@
+# modules/payments/sweeper.py
+"""Чистка просроченных ``pending_invoices``.
+
+Счёт, который так и не оплатили, раньше оставался в таблице навсегда
+(строка удалялась только при отмене пользователем). Теперь у строки есть
+``expires_at`` — срок счёта у провайдера (``INVOICE_TTL``, см.
+``modules/payments/providers/cryptobot.py``), и :func:`sweep_loop` удаляет истёкшие
+строки пачками по ``INVOICE_SWEEP_BATCH`` по индексу ``idx_pending_expires``.
+
+Удаляются только счета, истёкшие больше ``INVOICE_SWEEP_GRACE`` секунд
+назад: сверка (modules/payments/reconcile.py) успевает в последний раз
+проверить счёт, оплаченный в последнюю секунду.
+
+Метрики: ``juicyfox_abandoned_checkouts_total{plan}`` — брошенные оплаты,
+``juicyfox_pending_invoices`` — открытые счета.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter as _Tally
+from typing import Optional
+
+from shared.db.repo import count_pending_invoices, sweep_pending_invoices
+from shared.utils.metrics import Counter, Gauge
+
+log = logging.getLogger("juicyfox.payments.sweeper")
+
+INVOICE_SWEEP_INTERVAL = int(os.getenv("INVOICE_SWEEP_INTERVAL", "600"))
+INVOICE_SWEEP_BATCH = int(os.getenv("INVOICE_SWEEP_BATCH", "200"))
+INVOICE_SWEEP_GRACE = int(os.getenv("INVOICE_SWEEP_GRACE", "900"))
+INVOICE_SWEEP_PAUSE = 0.2
+
+ABANDONED = Counter(
+    "juicyfox_abandoned_checkouts_total",
+    "Pending invoices that expired unpaid, by plan",
+    ["plan"],
+)
+PENDING = Gauge("juicyfox_pending_invoices", "Open pending invoices")
+
+
+async def sweep_expired(now: Optional[int] = None) -> int:
+    """Удалить все истёкшие счета. Возвращает число удалённых."""
+    cutoff = int(now if now is not None else time.time()) - INVOICE_SWEEP_GRACE
+    tally: _Tally = _Tally()
+    while True:
+        rows = await sweep_pending_invoices(cutoff, INVOICE_SWEEP_BATCH)
+        for _, plan_code in rows:
+            ABANDONED.labels(plan=plan_code).inc()
+            tally[plan_code] += 1
+        if len(rows) < INVOICE_SWEEP_BATCH:
+            break
+        await asyncio.sleep(INVOICE_SWEEP_PAUSE)  # короткие транзакции, живые записи не ждут
+    if tally:
+        log.info("sweeper: %s abandoned invoice(s) removed: %s", sum(tally.values()), dict(tally))
+    PENDING.set(await count_pending_invoices())
+    return sum(tally.values())
+
+
+async def sweep_loop(interval: int = INVOICE_SWEEP_INTERVAL) -> None:
+    """Фоновая задача: раз в ``interval`` секунд чистит истёкшие счета."""
+    while True:
+        try:
+            await sweep_expired()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("sweeper: pass failed: %s", e)
+        await asyncio.sleep(interval)
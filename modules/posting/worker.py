@@ -7,24 +7,27 @@ import time
 import logging
 from typing import Any, Dict, List, Tuple
 
-import aiosqlite
 from aiogram import Bot
 
-from shared.utils.telegram import send_with_retry
+from shared.config.env import setting
+from shared.config.reload import install_sighup
+from shared.db import repo
+from shared.utils.outbound import BULK
+from shared.utils.telegram import make_bot, send_with_retry
 
 log = logging.getLogger("juicyfox.posting.worker")
 
-DB_PATH = os.getenv("DB_PATH", "/app/data/juicyfox.sqlite")
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-POLL_INTERVAL_SEC = int(os.getenv("POST_WORKER_INTERVAL", "5"))
-BATCH_LIMIT = int(os.getenv("POST_WORKER_BATCH", "20"))
 
-_PRAGMAS = [
-    "PRAGMA journal_mode=WAL;",
-    "PRAGMA synchronous=NORMAL;",
-    "PRAGMA foreign_keys=ON;",
-    "PRAGMA temp_store=MEMORY;",
-]
+# REGION AI: hot reload
+# Интервал и размер пачки читаются на каждой итерации (kill -HUP перечитывает .env)
+def _poll_interval() -> int:
+    return setting("POST_WORKER_INTERVAL", default=5, cast=int)
+
+
+def _batch_limit() -> int:
+    return setting("POST_WORKER_BATCH", default=20, cast=int)
+# END REGION AI
 
 _SCHEMA = """
 CREATE TABLE IF NOT EXISTS post_queue (
@@ -43,10 +46,8 @@ CREATE INDEX IF NOT EXISTS idx_post_queue_run ON post_queue(status, run_at);
 """
 
 async def _ensure_schema():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    async with aiosqlite.connect(DB_PATH) as db:
-        for p in _PRAGMAS:
-            await db.execute(p)
+    # соединение из пула repo (PRAGMA уже применены, путь — через DB-роутер)
+    async with repo._db() as db:
         for stmt in _SCHEMA.split(";"):
             st = stmt.strip()
             if st:
@@ -55,9 +56,7 @@ async def _ensure_schema():
 
 async def _fetch_due(limit: int) -> List[Dict[str, Any]]:
     now = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
-        for p in _PRAGMAS:
-            await db.execute(p)
+    async with repo._db() as db:
         cur = await db.execute(
             "SELECT id, chat_id, type, text, file_id "
             "FROM post_queue WHERE status='pending' AND run_at<=? "
@@ -72,16 +71,12 @@ async def _fetch_due(limit: int) -> List[Dict[str, Any]]:
     return jobs
 
 async def _mark_sent(job_id: int) -> None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        for p in _PRAGMAS:
-            await db.execute(p)
+    async with repo._db() as db:
         await db.execute("UPDATE post_queue SET status='sent' WHERE id=?", (job_id,))
         await db.commit()
 
 async def _mark_failed(job_id: int, err: str) -> None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        for p in _PRAGMAS:
-            await db.execute(p)
+    async with repo._db() as db:
         # простейший backoff: 30 * 2^retries, максимум 15 минут
         cur = await db.execute("SELECT retries FROM post_queue WHERE id=?", (job_id,))
         row = await cur.fetchone()
@@ -118,15 +113,16 @@ async def main() -> None:
         raise RuntimeError("POSTING WORKER: TELEGRAM_TOKEN is required")
 
     await _ensure_schema()
-    bot = Bot(token=TELEGRAM_TOKEN)
+    bot = make_bot(TELEGRAM_TOKEN, lane=BULK)  # посты не обгоняют платежи бота
 
-    log.info("posting worker started; db=%s interval=%ss batch=%s", DB_PATH, POLL_INTERVAL_SEC, BATCH_LIMIT)
+    install_sighup()
+    log.info("posting worker started; db=%s interval=%ss batch=%s", repo.current_db_path(), _poll_interval(), _batch_limit())
 
     while True:
         try:
-            jobs = await _fetch_due(BATCH_LIMIT)
+            jobs = await _fetch_due(_batch_limit())
             if not jobs:
-                await asyncio.sleep(POLL_INTERVAL_SEC)
+                await asyncio.sleep(_poll_interval())
                 continue
 
             for job in jobs:
@@ -141,4 +137,4 @@ async def main() -> None:
 
         except Exception as loop_err:
             log.exception("worker loop error: %s", loop_err)
-            await asyncio.sleep(POLL_INTERVAL_SEC)
+            await asyncio.sleep(_poll_interval())
@@ -6,8 +6,8 @@ from aiogram.types import CallbackQuery
 
 from modules.common.i18n import tr
 from modules.constants.currencies import CURRENCIES
-from modules.constants.prices import CHAT_PRICES_USD
-from modules.payments import create_invoice
+from modules.constants.prices import CHAT_PLAN_DEFAULTS_USD, chat_prices_usd
+from modules.payments import ProviderUnavailable, create_invoice
 from shared.utils.lang import get_lang
 from shared.db.repo import save_pending_invoice
 
@@ -21,7 +21,14 @@ CURRENCY_CODES = {code.upper() for _, code in CURRENCIES}
 
 PLAN_ALIAS = {"10d": "chat_10d", "20d": "chat_20d", "30d": "chat_30d"}
 PLAN_TITLES = {"chat_10d": "Chat 10", "chat_20d": "Chat 20", "chat_30d": "Chat 30"}
-PLAN_PRICES = {k: CHAT_PRICES_USD.get(k, v) for k, v in {"chat_10d": 9.0, "chat_20d": 17.0, "chat_30d": 25.0}.items()}
+PLAN_PRICES = CHAT_PLAN_DEFAULTS_USD
+
+
+def _plan_price(plan_code: str) -> Optional[float]:
+    # цены из ENV читаются на каждый запрос (hot reload)
+    if plan_code not in PLAN_PRICES:
+        return None
+    return chat_prices_usd().get(plan_code, PLAN_PRICES[plan_code])
 
 
 def _invoice_url(inv: Any) -> Optional[str]:
@@ -49,7 +56,7 @@ async def choose_chat_currency(cq: CallbackQuery) -> None:
     if not plan_code:
         await cq.answer("Unknown plan", show_alert=True)
         return
-    amount = PLAN_PRICES.get(plan_code)
+    amount = _plan_price(plan_code)
     if amount is None:
         await cq.answer("Unknown plan", show_alert=True)
         return
@@ -71,7 +78,7 @@ async def paymem_currency(callback: CallbackQuery, state: FSMContext) -> None:
         await callback.answer("Unsupported currency", show_alert=True)
         return
 
-    amount = PLAN_PRICES.get(plan_code)
+    amount = _plan_price(plan_code)
     if amount is None:
         await callback.answer("Unknown plan", show_alert=True)
         return
@@ -85,13 +92,17 @@ async def paymem_currency(callback: CallbackQuery, state: FSMContext) -> None:
         plan_callback=f"paymem:{plan_code}",
     )
 
-    inv = await create_invoice(
-        user_id=callback.from_user.id,
-        plan_code=plan_code,
-        amount_usd=float(amount),
-        meta=_build_meta(callback.from_user.id, plan_code, asset),
-        asset=asset,
-    )
+    try:
+        inv = await create_invoice(
+            user_id=callback.from_user.id,
+            plan_code=plan_code,
+            amount_usd=float(amount),
+            meta=_build_meta(callback.from_user.id, plan_code, asset, lang),
+            asset=asset,
+        )
+    except ProviderUnavailable:
+        await callback.answer(tr(lang, "provider_busy"), show_alert=True)
+        return
     invoice_id = inv.get("invoice_id") if isinstance(inv, dict) else None
     if invoice_id:
         await state.update_data(invoice_id=invoice_id, currency=asset, plan_code=plan_code)
@@ -104,6 +115,7 @@ async def paymem_currency(callback: CallbackQuery, state: FSMContext) -> None:
             PLAN_TITLES.get(plan_code, plan_code),
             float(amount),
             period,
+            expires_at=inv.get("expires_at"),
         )
 
     url = _invoice_url(inv)
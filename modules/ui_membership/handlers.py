@@ -3,32 +3,34 @@ from __future__ import annotations
 import os
 import asyncio
 import logging
-from typing import Any, Optional, Dict, Set
+from typing import Any, Optional, Dict
 
 from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import CallbackQuery, Message, FSInputFile
+from aiogram.types import CallbackQuery, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 # текст/локализация и валюты берём из актуальных модулей
 from modules.common.i18n import tr
 from modules.constants.currencies import CURRENCIES
 # REGION AI: VIP price from config
-from shared.config.env import config
+from shared.config.env import current_config
 from modules.constants.paths import START_PHOTO, VIP_PHOTO
 # END REGION AI
-from modules.payments import create_invoice
+from modules.payments import ProviderUnavailable, create_invoice
 
 from shared.db.repo import (
     save_pending_invoice,
     get_active_invoice,
     delete_pending_invoice,
 )
+from shared.db.state import get_state
 
 from shared.utils.lang import get_lang
 from shared.utils.telegram import send_with_retry
+from shared.utils.media import send_local_media
 # Клавиатуры текущего модуля
 from .keyboards import (
     main_menu_kb,
@@ -41,15 +43,44 @@ from .keyboards import (
 )
 from .chat_keyboards import chat_tariffs_kb
 from .chat_handlers import router as chat_router
-from .utils import BOT_ID, _build_meta
+from .utils import _build_meta, current_bot_id
 
 log = logging.getLogger("juicyfox.ui_membership.handlers")
 
 router = Router()
 router.include_router(chat_router)
 
+# REGION AI: shared donate state
+# Задача создания инвойса живёт в воркере, принявшем выбор валюты, а отмена
+# может прийти в другой воркер.  Поэтому «поколение» доната хранится в общем
+# состоянии: новый выбор валюты и отмена его увеличивают, и задача со
+# старым поколением удаляет свой инвойс вместо показа.  _donate_tasks —
+# лишь локальная оптимизация (отменить задачу, если она в этом же процессе).
 _donate_tasks: Dict[int, asyncio.Task] = {}
-_donate_cancelled: Set[int] = set()
+DONATE_STATE_TTL = 3600
+
+
+def _donate_gen_key(user_id: int) -> str:
+    return f"donate:gen:{user_id}"
+
+
+async def _bump_donate_gen(user_id: int) -> Optional[int]:
+    """Новое поколение доната; ``None`` — общее состояние недоступно."""
+    try:
+        return await get_state().incr(_donate_gen_key(user_id), DONATE_STATE_TTL)
+    except Exception as e:
+        log.warning("donate: shared state unavailable: %s", e)
+        return None
+
+
+async def _donate_superseded(user_id: int, gen: Optional[int]) -> bool:
+    if gen is None:
+        return False  # своё поколение неизвестно — сравнивать не с чем, инвойс показываем
+    try:
+        return int(await get_state().get(_donate_gen_key(user_id)) or 0) != gen
+    except Exception:
+        return False
+# END REGION AI
 
 # --- Конфиг из ENV (позже переедет в shared.config.env) ---
 VIP_URL = os.getenv("VIP_URL")
@@ -71,18 +102,26 @@ class Donate(StatesGroup):
 async def start_handler(message: Message, state: FSMContext) -> None:
     await state.clear()
     lang = get_lang(message.from_user)
+    # REGION AI: show start photo with reply keyboard
+    caption = tr(lang, "menu", name=message.from_user.first_name)
     if START_PHOTO.exists():
-        photo = FSInputFile(START_PHOTO)
+        # file_id кешируется — JPEG грузится в Telegram один раз
+        await send_local_media(
+            message.bot,
+            message.answer_photo,
+            START_PHOTO,
+            caption=caption,
+            reply_markup=reply_menu(lang),
+            logger=log,
+        )
     else:
-        photo = "https://files.catbox.moe/cqckle.jpg"
-    # REGION AI: show start photo with reply keyboard
-    await send_with_retry(
-        message.answer_photo,
-        photo,
-        caption=tr(lang, "menu", name=message.from_user.first_name),
-        reply_markup=reply_menu(lang),
-        logger=log,
-    )
+        await send_with_retry(
+            message.answer_photo,
+            "https://files.catbox.moe/cqckle.jpg",
+            caption=caption,
+            reply_markup=reply_menu(lang),
+            logger=log,
+        )
     # END REGION AI
     if LIFE_URL:
         # REGION AI: life promo link without preview
@@ -129,11 +168,11 @@ async def show_vip(cq: CallbackQuery) -> None:
     await cq.answer()
     await cq.message.delete()
     if VIP_PHOTO.exists():
-        photo = FSInputFile(VIP_PHOTO)
-        await send_with_retry(
+        await send_local_media(
+            cq.bot,
             cq.message.answer_photo,
-            photo,
-            caption=tr(lang, "vip_club_description", amount=int(config.vip_price_usd)),
+            VIP_PHOTO,
+            caption=tr(lang, "vip_club_description", amount=int(current_config().vip_price_usd)),
             reply_markup=vip_currency_kb(lang),
             parse_mode="HTML",
             logger=log,
@@ -141,7 +180,7 @@ async def show_vip(cq: CallbackQuery) -> None:
     else:
         await send_with_retry(
             cq.message.answer,
-            tr(lang, "vip_club_description", amount=int(config.vip_price_usd)),
+            tr(lang, "vip_club_description", amount=int(current_config().vip_price_usd)),
             reply_markup=vip_currency_kb(lang),
             parse_mode="HTML",
             logger=log,
@@ -155,7 +194,7 @@ async def cmd_currency(message: Message) -> None:
     lang = get_lang(message.from_user)
     await send_with_retry(
         message.answer,
-        tr(lang, "choose_cur", amount=config.vip_price_usd),
+        tr(lang, "choose_cur", amount=current_config().vip_price_usd),
         reply_markup=vip_currency_kb(lang),
         logger=log,
     )
@@ -176,7 +215,7 @@ def _invoice_url(inv: Any) -> Optional[str]:
 async def pay_vip(callback: CallbackQuery, state: FSMContext) -> None:
     lang = get_lang(callback.from_user)
     currency = "USDT"
-    amount = config.vip_price_usd
+    amount = current_config().vip_price_usd
     await state.update_data(
         plan_name="VIP CLUB",
         price=float(amount),
@@ -191,13 +230,17 @@ async def pay_vip(callback: CallbackQuery, state: FSMContext) -> None:
         currency,
         amount,
     )
-    inv = await create_invoice(
-        user_id=callback.from_user.id,
-        plan_code="vip_30d",
-        amount_usd=float(amount),
-        meta=_build_meta(callback.from_user.id, "vip_30d", currency),
-        asset=currency,
-    )
+    try:
+        inv = await create_invoice(
+            user_id=callback.from_user.id,
+            plan_code="vip_30d",
+            amount_usd=float(amount),
+            meta=_build_meta(callback.from_user.id, "vip_30d", currency, lang),
+            asset=currency,
+        )
+    except ProviderUnavailable:
+        await callback.answer(tr(lang, "provider_busy"), show_alert=True)
+        return
     invoice_id = inv.get("invoice_id") if isinstance(inv, dict) else None
     if invoice_id:
         await state.update_data(invoice_id=invoice_id, currency=currency, plan_code="vip_30d")
@@ -210,6 +253,7 @@ async def pay_vip(callback: CallbackQuery, state: FSMContext) -> None:
             "VIP CLUB",
             float(amount),
             30,
+            expires_at=inv.get("expires_at"),
         )
     url = _invoice_url(inv)
     if url:
@@ -235,23 +279,27 @@ async def vipay_currency(callback: CallbackQuery, state: FSMContext) -> None:
         "vipay_currency: user=%s currency=%s amount=%s",
         callback.from_user.id,
         cur,
-        config.vip_price_usd,
+        current_config().vip_price_usd,
     )
     await state.update_data(
         plan_name="VIP CLUB",
-        price=float(config.vip_price_usd),
+        price=float(current_config().vip_price_usd),
         period=30,
         plan_callback="vipay",
     )
     data = await state.get_data()
     log.debug("Saved plan_name: %s", data.get("plan_name"))
-    inv = await create_invoice(
-        user_id=callback.from_user.id,
-        plan_code="vip_30d",
-        amount_usd=float(config.vip_price_usd),
-        meta=_build_meta(callback.from_user.id, "vip_30d", cur),
-        asset=cur,
-    )
+    try:
+        inv = await create_invoice(
+            user_id=callback.from_user.id,
+            plan_code="vip_30d",
+            amount_usd=float(current_config().vip_price_usd),
+            meta=_build_meta(callback.from_user.id, "vip_30d", cur, lang),
+            asset=cur,
+        )
+    except ProviderUnavailable:
+        await callback.answer(tr(lang, "provider_busy"), show_alert=True)
+        return
     invoice_id = inv.get("invoice_id") if isinstance(inv, dict) else None
     if invoice_id:
         await state.update_data(invoice_id=invoice_id, currency=cur, plan_code="vip_30d")
@@ -262,8 +310,9 @@ async def vipay_currency(callback: CallbackQuery, state: FSMContext) -> None:
             cur,
             "vipay",
             "VIP CLUB",
-            float(config.vip_price_usd),
+            float(current_config().vip_price_usd),
             30,
+            expires_at=inv.get("expires_at"),
         )
     url = _invoice_url(inv)
     if url:
@@ -341,9 +390,13 @@ async def donate_set_currency(cq: CallbackQuery, state: FSMContext) -> None:
             user_id=cq.from_user.id,
             plan_code="donation",
             amount_usd=amount,
-            meta={"user_id": cq.from_user.id, "currency": cur, "kind": "donate", "bot_id": BOT_ID},
+            meta={"user_id": cq.from_user.id, "currency": cur, "kind": "donate", "bot_id": current_bot_id()},
             asset=cur,
         )
+    except ProviderUnavailable as e:
+        log.warning("donate_set_currency: provider unavailable: %s", e)
+        await cq.answer(tr(lang, "provider_busy"), show_alert=True)
+        return
     except Exception:
         log.exception("donate_set_currency: create_invoice failed")
         await send_with_retry(
@@ -368,6 +421,7 @@ async def donate_set_currency(cq: CallbackQuery, state: FSMContext) -> None:
                     "Donate",
                     float(data.get("price", amount)),
                     0,
+                    expires_at=inv.get("expires_at"),
                 )
             except Exception:
                 log.exception("donate_set_currency: save_pending_invoice failed")
@@ -382,14 +436,14 @@ async def donate_set_currency(cq: CallbackQuery, state: FSMContext) -> None:
     await cq.answer()
 
     user_id = cq.from_user.id
-    # cancel previous pending task if any
+    # cancel previous pending task if any (in any worker — via generation)
+    gen = await _bump_donate_gen(user_id)
     prev = _donate_tasks.pop(user_id, None)
     if prev and not prev.done():
         prev.cancel()
-    _donate_cancelled.discard(user_id)
 
     task = asyncio.create_task(
-        _create_donate_invoice(cq, state, user_id, cur, float(amount))
+        _create_donate_invoice(cq, state, user_id, cur, float(amount), gen)
     )
     _donate_tasks[user_id] = task
 
@@ -400,6 +454,7 @@ async def _create_donate_invoice(
     user_id: int,
     currency: str,
     amount: float,
+    gen: Optional[int] = None,
 ) -> None:
     """Background task: create invoice and notify user."""
     invoice_id: Optional[str] = None
@@ -413,7 +468,7 @@ async def _create_donate_invoice(
                 "user_id": user_id,
                 "currency": currency,
                 "kind": "donate",
-                "bot_id": BOT_ID,
+                "bot_id": current_bot_id(),
             },
             asset=currency,
         )
@@ -436,9 +491,10 @@ async def _create_donate_invoice(
             "Donate",
             float(amount),
             0,
+            expires_at=inv.get("expires_at"),
         )
 
-        if user_id in _donate_cancelled:
+        if await _donate_superseded(user_id, gen):
             await delete_pending_invoice(invoice_id)
             return
 
@@ -452,6 +508,16 @@ async def _create_donate_invoice(
         if invoice_id:
             await delete_pending_invoice(invoice_id)
         log.info("donation task cancelled: user_id=%s", user_id)
+    except ProviderUnavailable as e:
+        log.warning("donation invoice: provider unavailable: user_id=%s: %s", user_id, e)
+        try:
+            await send_with_retry(
+                cq.message.answer,
+                tr(lang, "provider_busy"),
+                logger=log,
+            )
+        except Exception:
+            log.exception("failed to send provider_busy message: user_id=%s", user_id)
     except Exception:
         log.exception("donation invoice failed: user_id=%s", user_id)
         try:
@@ -463,8 +529,8 @@ async def _create_donate_invoice(
         except Exception:
             log.exception("failed to send donate_error message: user_id=%s", user_id)
     finally:
-        _donate_tasks.pop(user_id, None)
-        _donate_cancelled.discard(user_id)
+        if _donate_tasks.get(user_id) is asyncio.current_task():
+            _donate_tasks.pop(user_id, None)
 
 @router.callback_query(F.data == "donate_cancel_invoice")
 async def cancel_donate_invoice(callback: CallbackQuery, state: FSMContext):
@@ -472,7 +538,7 @@ async def cancel_donate_invoice(callback: CallbackQuery, state: FSMContext):
     lang = get_lang(callback.from_user)
     user_id = callback.from_user.id
 
-    _donate_cancelled.add(user_id)
+    await _bump_donate_gen(user_id)
     task = _donate_tasks.pop(user_id, None)
     if task and not task.done():
         task.cancel()
@@ -510,7 +576,7 @@ async def cancel_donate(callback: CallbackQuery, state: FSMContext) -> None:
     lang = get_lang(callback.from_user)
     user_id = callback.from_user.id
 
-    _donate_cancelled.add(user_id)
+    await _bump_donate_gen(user_id)
     task = _donate_tasks.pop(user_id, None)
     if task and not task.done():
         task.cancel()
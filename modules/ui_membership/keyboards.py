@@ -7,7 +7,7 @@ from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardBut
 from modules.common.i18n import tr
 from modules.constants.currencies import CURRENCIES
 # REGION: imports
-from shared.config.env import config
+from shared.config.env import current_config
 # END REGION
 
 # ---------- INLINE КНОПКИ (стабильные callback'и) ----------
@@ -19,7 +19,7 @@ def main_menu_kb(lang: str) -> InlineKeyboardMarkup:
     b.add(
         InlineKeyboardButton(
             text="JUICY LIFE 👀",
-            url=config.life_url or "https://t.me/JuicyFoxOfficialLife",
+            url=current_config().life_url or "https://t.me/JuicyFoxOfficialLife",
         )
     )
     # END REGION AI
@@ -169,3 +169,12 @@ def reply_menu(lang: str) -> ReplyKeyboardMarkup:
     )
 
 
+
+
+# REGION AI: renewal reminder keyboard
+def renewal_kb(lang: str, scope: str) -> InlineKeyboardMarkup:
+    """Одна кнопка «Продлить» — сразу в меню оплаты VIP или Chat."""
+    b = InlineKeyboardBuilder()
+    b.button(text=tr(lang, "btn_renew"), callback_data="ui:chat" if scope == "chat" else "ui:vip")
+    return b.as_markup()
+# END REGION AI
@@ -1,14 +1,27 @@
 import os
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+from shared.config.env import current_config
 
 BOT_ID = os.getenv("BOT_ID", "sample")
 
 
-def _build_meta(user_id: int, plan_code: str, currency: str) -> Dict[str, Any]:
-    """Compose invoice metadata shared across membership flows."""
-    return {
+def current_bot_id() -> str:
+    """bot_id бота, обрабатывающего апдейт: по нему вебхук оплаты найдёт бота и его БД."""
+    return getattr(current_config(), "bot_id", None) or BOT_ID
+
+
+def _build_meta(user_id: int, plan_code: str, currency: str, lang: Optional[str] = None) -> Dict[str, Any]:
+    """Compose invoice metadata shared across membership flows.
+
+    ``lang`` travels with the payment so renewal reminders use the buyer's language.
+    """
+    meta = {
         "user_id": user_id,
         "plan_code": plan_code,
         "currency": currency,
-        "bot_id": BOT_ID,
+        "bot_id": current_bot_id(),
     }
+    if lang:
+        meta["lang"] = lang
+    return meta
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Benchmark Telegram send throughput against a local Bot API stand-in.
+
+The script starts a tiny aiohttp server in a separate process that answers
+``sendMessage`` like the Bot API (with an optional artificial latency), then
+sends ``--count``
+messages with ``--concurrency`` parallel senders through:
+
+* ``default`` — ``Bot`` on a plain ``AiohttpSession`` (what the bot and the
+  workers used before ``shared.utils.telegram.make_bot``);
+* ``tuned`` — ``make_bot`` with the shared :class:`TunedSession`
+  (``TELEGRAM_POOL_LIMIT``, ``TELEGRAM_KEEPALIVE``, method timeouts).
+
+For each mode it prints the best of ``--rounds`` runs: messages per second,
+p50/p95 latency and how many TCP connections the stand-in saw.  The outbound token budget is disabled
+(``OUTBOUND_RATE=0``) unless ``--with-budget`` is given, so the numbers show
+the HTTP layer, not the rate limit.
+
+Usage (run from the repository root)::
+
+    python scripts/bench_telegram_send.py --count 2000 --concurrency 50 --latency 20
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def _stand_in(port: int, latency: float) -> None:
+    """Bot API stand-in (runs in a child process)."""
+    from aiohttp import web
+
+    counter = {"id": 0}
+    peers = set()
+
+    async def handle(request: "web.Request") -> "web.Response":
+        peers.add(str(request.transport.get_extra_info("peername")))
+        data = await request.post()
+        if latency:
+            await asyncio.sleep(latency)
+        counter["id"] += 1
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": counter["id"],
+                    "date": int(time.time()),
+                    "chat": {"id": int(data.get("chat_id") or 0), "type": "private"},
+                    "text": data.get("text") or "",
+                },
+            }
+        )
+
+    async def stats(request: "web.Request") -> "web.Response":
+        result = {"connections": len(peers)}
+        peers.clear()
+        return web.json_response(result)
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    app.router.add_get("/stats", stats)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, handle_signals=False)
+
+
+async def _connections(base: str) -> int:
+    import aiohttp
+
+    async with aiohttp.ClientSession() as http:
+        async with http.get(f"{base}/stats") as resp:
+            return int((await resp.json())["connections"])
+
+
+async def _wait_ready(base: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await _connections(base)
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def _run(bot, count: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(count):
+        queue.put_nowait(i)
+
+    async def sender() -> None:
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            await bot.send_message(1000 + i % 500, f"bench {i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": count / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Telegram send throughput benchmark")
+    parser.add_argument("--count", type=int, default=2000, help="Messages per mode")
+    parser.add_argument("--concurrency", type=int, default=50, help="Parallel senders")
+    parser.add_argument("--latency", type=float, default=20.0, help="Stand-in response latency, ms")
+    parser.add_argument("--port", type=int, default=18081, help="Port of the local stand-in")
+    parser.add_argument("--modes", default="default,tuned", help="Comma-separated: default, tuned")
+    parser.add_argument("--rounds", type=int, default=3, help="Runs per mode; the best one is printed")
+    parser.add_argument("--with-budget", action="store_true", help="Keep the outbound token budget on")
+    args = parser.parse_args()
+
+    base = f"http://127.0.0.1:{args.port}"
+    # всегда на заглушку: TELEGRAM_API_SERVER из окружения не должен увести отправку на живой сервер
+    os.environ["TELEGRAM_API_SERVER"] = base
+    if not args.with_budget:
+        os.environ["OUTBOUND_RATE"] = "0"
+
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from shared.utils.telegram import close_sessions, make_bot
+
+    server = multiprocessing.Process(target=_stand_in, args=(args.port, args.latency / 1000), daemon=True)
+    server.start()
+    token = "123456:BENCH"
+    try:
+        await _wait_ready(base)
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            if mode == "default":
+                bot = Bot(token=token, session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+            elif mode == "tuned":
+                bot = make_bot(token)
+            else:
+                raise SystemExit(f"unknown mode: {mode}")
+            await bot.send_message(1, "warm-up")
+            best = None
+            for _ in range(max(1, args.rounds)):
+                await _connections(base)  # сброс счётчика соединений
+                res = await _run(bot, args.count, args.concurrency)
+                res["connections"] = await _connections(base)
+                if best is None or res["rps"] > best["rps"]:
+                    best = res
+            print(
+                f"{mode:>8}: {best['rps']:8.1f} msg/s  p50 {best['p50']:6.1f} ms  "
+                f"p95 {best['p95']:6.1f} ms  connections {best['connections']}"
+            )
+            if mode == "default":
+                await bot.session.close()
+        await close_sessions()
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
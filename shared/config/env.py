@@ -18,6 +18,9 @@ Usage::
     # environment variables), call reload_config():
     config = reload_config()
 
+    # Live values that may change on hot reload (SIGHUP / admin endpoint):
+    limit = setting("RELAY_STREAK_LIMIT", default=3, cast=int)
+
 The ``Config`` dataclass exposes typed attributes for all supported
 settings.  Most attributes are strings or integers; booleans are used
 for feature flags.  Values missing from both environment and YAML are
@@ -28,10 +31,14 @@ assigned sensible defaults, but critical fields like
 
 from __future__ import annotations
 
+import asyncio
+import inspect
 import os
 import logging
+from contextvars import ContextVar
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional
 
 try:
     import yaml  # type: ignore
@@ -174,14 +181,17 @@ def _get_alias(env: Dict[str, str], *names: str, default: Optional[str] = None)
     return default
 
 
-def load_config(bot_id: Optional[str] = None) -> Config:
+def load_config(bot_id: Optional[str] = None, *, env: Optional[Mapping[str, str]] = None) -> Config:
     """Load configuration from environment and optional YAML.
 
     If ``bot_id`` is not provided, it is taken from the ``BOT_ID``
     environment variable (defaulting to ``sample`` if missing).  The
     loaded configuration is returned as a ``Config`` object.
+
+    ``env`` replaces ``os.environ`` as the source of variables; the
+    multi-bot runtime uses it to give each bot its own token and DB path.
     """
-    env = os.environ
+    env = os.environ if env is None else env
     resolved_bot_id = (bot_id or env.get("BOT_ID") or "sample").strip()
     yaml_data = _load_yaml_config(resolved_bot_id)
 
@@ -298,3 +308,116 @@ def reload_config(bot_id: Optional[str] = None) -> Config:
     global config
     config = load_config(bot_id)
     return config
+
+
+# REGION AI: per-bot config context
+# In multi-bot mode (apps/bot_core/tenants.py) every update is handled with
+# the config of the bot that received it.  Handlers that need per-bot
+# values read them through current_config(); outside an update (or in
+# single-bot mode) it returns the global ``config``.
+_current_config: ContextVar[Optional[Config]] = ContextVar("juicyfox_config", default=None)
+
+
+def current_config() -> Config:
+    """Return the config of the bot handling the current update."""
+    return _current_config.get() or config
+
+
+def set_current_config(cfg: Optional[Config]):
+    """Bind ``cfg`` to the current context; returns a token for ``reset_current_config``."""
+    return _current_config.set(cfg)
+
+
+def reset_current_config(token) -> None:
+    _current_config.reset(token)
+# END REGION AI
+
+
+# REGION AI: hot reload
+# Reloadable snapshot of the environment.  ``hot_reload()`` re-reads
+# ``ENV_FILE`` (``.env``) and the bot's YAML, builds a new ``Config`` and
+# swaps both the env snapshot and the global ``config`` in one step, so a
+# handler never sees half-updated values.  Code that must follow changes
+# without a restart reads values through ``setting()`` /
+# ``current_config()`` at use time instead of caching them in module
+# constants; caches and rate limiters subscribe with ``on_reload()``.
+ENV_FILE = os.getenv("ENV_FILE", ".env")
+
+_env_snapshot: Mapping[str, str] = MappingProxyType(dict(os.environ))
+_reload_hooks: List[Callable[[FrozenSet[str]], Any]] = []
+_reload_lock: Optional[asyncio.Lock] = None
+
+
+def setting(*names: str, default: Any = None, cast: Callable[[str], Any] = str) -> Any:
+    """Return the live value of the first non-empty variable in ``names``.
+
+    ``default`` is returned when none is set or ``cast`` fails.
+    """
+    env = _env_snapshot
+    for name in names:
+        val = env.get(name)
+        if val is None or not str(val).strip():
+            continue
+        try:
+            return cast(str(val).strip())
+        except Exception:
+            logger.warning("env: bad value %s=%r, using default %r", name, val, default)
+            return default
+    return default
+
+
+def on_reload(hook: Callable[[FrozenSet[str]], Any]) -> Callable[[FrozenSet[str]], Any]:
+    """Register ``hook(changed_keys)`` (sync or async) to run after each reload.
+
+    Usable as a decorator.  ``changed_keys`` holds the environment
+    variables whose values changed; YAML-only changes give an empty set.
+    """
+    _reload_hooks.append(hook)
+    return hook
+
+
+def _read_env_file(path: str) -> Dict[str, str]:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        from dotenv import dotenv_values
+    except ImportError:  # pragma: no cover
+        return {}
+    return {k: v for k, v in dotenv_values(path).items() if v is not None}
+
+
+async def hot_reload() -> FrozenSet[str]:
+    """Re-read ``ENV_FILE`` and YAML, swap the config snapshot, run hooks.
+
+    Values from ``ENV_FILE`` override the process environment (they are
+    written back to ``os.environ`` for code that still calls
+    ``os.getenv``).  If the new config is invalid the old one stays in
+    place and ``RuntimeError`` is raised.  Returns the changed keys.
+    """
+    global config, _env_snapshot, _reload_lock
+    if _reload_lock is None:
+        _reload_lock = asyncio.Lock()
+    async with _reload_lock:
+        new_env = dict(os.environ)
+        new_env.update(await asyncio.to_thread(_read_env_file, ENV_FILE))
+        new_config = await asyncio.to_thread(load_config, config.bot_id, env=new_env)
+        old_env = _env_snapshot
+        changed = frozenset(
+            k for k in set(old_env) | set(new_env) if old_env.get(k) != new_env.get(k)
+        )
+        for k in changed:
+            if k in new_env:
+                os.environ[k] = new_env[k]
+        # атомарная замена: обе ссылки меняются без await между ними
+        _env_snapshot = MappingProxyType(new_env)
+        config = new_config
+        logger.info("env: config reloaded, %s key(s) changed: %s", len(changed), ", ".join(sorted(changed)))
+        for hook in list(_reload_hooks):
+            try:
+                res = hook(changed)
+                if inspect.isawaitable(res):
+                    await res
+            except Exception as e:
+                logger.warning("env: reload hook %r failed: %s", hook, e)
+        return changed
+# END REGION AI
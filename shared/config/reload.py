@@ -0,0 +1,89 @@
+# shared/config/reload.py
+"""Hot configuration reload triggers.
+
+* ``SIGHUP`` — :func:`install_sighup` reloads the process that got the
+  signal (``kill -HUP <pid>``).
+* ``POST /admin/config/reload`` (api/admin.py) — :func:`request_reload`
+  reloads the current worker and bumps the ``config:gen`` counter in the
+  shared state (shared/db/state.py); :func:`watch_loop` in every other
+  worker notices the new generation within ``CONFIG_WATCH_INTERVAL``
+  seconds and reloads too.
+
+The reload itself is :func:`shared.config.env.hot_reload`.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import signal
+from contextlib import suppress
+from typing import FrozenSet, Optional, Set
+
+from shared.config.env import hot_reload
+
+log = logging.getLogger("juicyfox.config.reload")
+
+CONFIG_WATCH_INTERVAL = float(os.getenv("CONFIG_WATCH_INTERVAL", "10"))
+_GEN_KEY = "config:gen"
+
+_seen_gen: Optional[str] = None
+_tasks: Set[asyncio.Task] = set()
+
+
+async def _reload(reason: str) -> Optional[FrozenSet[str]]:
+    try:
+        return await hot_reload()
+    except Exception as e:
+        log.error("config reload (%s) failed, keeping previous config: %s", reason, e)
+        return None
+
+
+async def request_reload() -> FrozenSet[str]:
+    """Reload here and signal the other workers. Raises if the new config is invalid."""
+    global _seen_gen
+    changed = await hot_reload()
+    with suppress(Exception):
+        from shared.db.state import get_state
+
+        _seen_gen = str(await get_state().incr(_GEN_KEY))
+    return changed
+
+
+async def watch_loop(interval: float = CONFIG_WATCH_INTERVAL) -> None:
+    """Фоновая задача: перечитать конфиг, если другой воркер поднял ``config:gen``."""
+    global _seen_gen
+    from shared.db.state import get_state
+
+    if interval <= 0:
+        return
+    with suppress(Exception):
+        _seen_gen = await get_state().get(_GEN_KEY)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            gen = await get_state().get(_GEN_KEY)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.debug("config watch: state unavailable: %s", e)
+            continue
+        if gen != _seen_gen:
+            _seen_gen = gen
+            await _reload(f"generation {gen}")
+
+
+def install_sighup(loop: Optional[asyncio.AbstractEventLoop] = None) -> bool:
+    """Reload on SIGHUP. Returns False where signals are unsupported (Windows, non-main thread)."""
+    loop = loop or asyncio.get_running_loop()
+
+    def _on_hup() -> None:
+        task = loop.create_task(_reload("SIGHUP"))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    try:
+        loop.add_signal_handler(signal.SIGHUP, _on_hup)
+    except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+        return False
+    return True
@@ -0,0 +1,404 @@
+# shared/db/archive.py
+"""Tiered retention for the ``messages`` table.
+
+Messages older than ``RETENTION_DAYS`` are moved from the hot database into
+a separate archive file (``ARCHIVE_DB_PATH``) where the text is stored
+zlib-compressed.  The hot ``messages`` table and its ``idx_messages_user_ts``
+index stay small, and so do WAL and backups of the main database.
+
+* The move runs in small batches (``ARCHIVE_BATCH`` rows) of short
+  transactions, with ``ARCHIVE_PAUSE`` seconds between batches so live
+  writes never wait long for the lock.
+* Archive rows keep the original ``messages.id`` as primary key and are
+  inserted with ``INSERT OR IGNORE``: an interrupted batch is simply redone
+  on the next run (resumable, idempotent).
+* Each batch is two transactions: the archive copy is committed first, then
+  only rows whose ids are present in the archive are deleted from the hot
+  table (a commit spanning two WAL files is not atomic).
+* ``repo.get_history`` / ``repo.iter_history`` read across both tiers via
+  :func:`get_archived` and :func:`iter_archived`.
+* The archive has its own FTS5 index (``messages_archive_fts``, filled in
+  the same transaction as the copy): moving a row out of ``messages`` drops
+  it from ``messages_fts``, and ``repo.search_messages`` merges hits from
+  :func:`search_archived`, so ``/search`` still covers archived history.
+
+``RETENTION_DAYS=0`` (default) disables the mover; reads still work.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from . import repo, router
+
+log = logging.getLogger("juicyfox.db.archive")
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH") or os.path.join(
+    os.path.dirname(repo.DB_PATH), "juicyfox_archive.sqlite"
+)
+
+
+def archive_path(db_path: Optional[str] = None) -> str:
+    """Archive file for ``db_path`` (default: the current bot's DB).
+
+    ``ARCHIVE_DB_PATH`` for the primary DB, ``<db>_archive.sqlite`` for
+    per-bot DBs and shards.
+    """
+    db_path = db_path or repo.current_db_path()
+    if db_path == repo.DB_PATH:
+        return ARCHIVE_DB_PATH
+    return os.path.splitext(db_path)[0] + "_archive.sqlite"
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))
+ARCHIVE_PAUSE = float(os.getenv("ARCHIVE_PAUSE", "0.2"))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+_ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS archive.messages_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        direction TEXT NOT NULL,
+        type TEXT NOT NULL,
+        text_z BLOB,
+        file_id TEXT,
+        ts INTEGER NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_user_ts ON messages_archive(user_id, ts);",
+]
+# REGION AI: archive full-text index
+# текст в messages_archive сжат, поэтому индекс хранит свою (несжатую) копию
+_ARCHIVE_FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS archive.messages_archive_fts USING fts5("
+    "text, tokenize='unicode61 remove_diacritics 2')"
+)
+# END REGION AI
+
+
+def _pack(text: Optional[str]) -> Optional[bytes]:
+    return zlib.compress(text.encode("utf-8"), 6) if text is not None else None
+
+
+def _unpack(blob: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+
+def _row(direction: str, typ: str, text_z: Optional[bytes], file_id: Optional[str], ts: int) -> Dict[str, Any]:
+    return {
+        "direction": direction,
+        "type": typ,
+        "text": _unpack(text_z),
+        "file_id": file_id,
+        "ts": int(ts),
+    }
+
+
+def _user_archive(user_id: int) -> str:
+    return archive_path(router.shard_path(repo.current_db_path(), user_id))
+
+
+async def _attach(db: aiosqlite.Connection, path: str) -> bool:
+    """ATTACH архива со схемой; ``True`` — FTS5-индекс архива доступен."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    await db.execute("ATTACH DATABASE ? AS archive", (path,))
+    await db.execute("PRAGMA archive.journal_mode=WAL;")
+    for stmt in _ARCHIVE_SCHEMA:
+        await db.execute(stmt)
+    # REGION AI: archive full-text index
+    try:
+        cur = await db.execute("SELECT 1 FROM archive.sqlite_master WHERE name='messages_archive_fts'")
+        fresh = await cur.fetchone() is None
+        await db.execute(_ARCHIVE_FTS_SCHEMA)
+        await db.commit()
+    except Exception as e:
+        log.warning("archive: FTS5 unavailable, archived messages are not searchable: %s", e)
+        return False
+    if fresh:
+        await _build_fts(db)
+    return True
+    # END REGION AI
+
+
+# REGION AI: archive full-text index
+async def _build_fts(db: aiosqlite.Connection, batch_size: int = 1000) -> None:
+    """Проиндексировать строки, попавшие в архив до появления индекса (один раз)."""
+    cur = await db.execute("SELECT id, text_z FROM archive.messages_archive WHERE text_z IS NOT NULL")
+    total = 0
+    while True:
+        rows = await cur.fetchmany(batch_size)
+        if not rows:
+            break
+        texts = await asyncio.to_thread(lambda: [(r[0], _unpack(r[1])) for r in rows])
+        await db.executemany("INSERT INTO archive.messages_archive_fts(rowid, text) VALUES (?, ?)", texts)
+        total += len(texts)
+    await cur.close()
+    await db.commit()
+    if total:
+        log.info("archive: indexed %s archived messages for search", total)
+# END REGION AI
+
+
+# ============== Перенос (hot → archive) ==============
+
+async def archive_batch(cutoff_ts: int, batch_size: int = ARCHIVE_BATCH, db_path: Optional[str] = None) -> int:
+    """Перенести до ``batch_size`` сообщений старше ``cutoff_ts``. Возвращает число строк."""
+    db_path = db_path or repo.current_db_path()
+    async with repo._db(db_path) as db:
+        fts = await _attach(db, archive_path(db_path))
+        try:
+            return await _move(db, cutoff_ts, batch_size, fts)
+        finally:
+            # соединение вернётся в пул — ATTACH не должен пережить перенос
+            await db.execute("DETACH DATABASE archive")
+
+
+async def _move(db: aiosqlite.Connection, cutoff_ts: int, batch_size: int, fts: bool = False) -> int:
+    cur = await db.execute(
+        "SELECT id, user_id, direction, type, text, file_id, ts FROM main.messages "
+        "WHERE ts < ? ORDER BY ts, id LIMIT ?",
+        (int(cutoff_ts), int(batch_size)),
+    )
+    rows = await cur.fetchall()
+    if not rows:
+        return 0
+    # сжатие — CPU; делаем его до открытия пишущей транзакции
+    packed = await asyncio.to_thread(
+        lambda: [(r[0], r[1], r[2], r[3], _pack(r[4]), r[5], r[6]) for r in rows]
+    )
+    # В WAL транзакция над ATTACH-базами не атомарна между файлами: при сбое
+    # посреди COMMIT удаление из main могло бы закрепиться без вставки в архив.
+    # Поэтому сначала фиксируем копию в архиве, а удаляем отдельной транзакцией
+    # только те строки, что там действительно есть.
+    marks = ",".join("?" * len(rows))
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        # строки прерванного прохода уже в архиве (и в его индексе) — повторно не вставляем
+        cur = await db.execute(
+            f"SELECT id FROM archive.messages_archive WHERE id IN ({marks})", [r[0] for r in rows]
+        )
+        done = {r[0] for r in await cur.fetchall()}
+        await db.executemany(
+            "INSERT OR IGNORE INTO archive.messages_archive "
+            "(id, user_id, direction, type, text_z, file_id, ts) VALUES (?,?,?,?,?,?,?)",
+            [p for p in packed if p[0] not in done],
+        )
+        if fts:
+            await db.executemany(
+                "INSERT INTO archive.messages_archive_fts(rowid, text) VALUES (?, ?)",
+                [(r[0], r[4]) for r in rows if r[0] not in done and r[4] is not None],
+            )
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cur = await db.execute(
+            f"DELETE FROM main.messages WHERE id IN (SELECT id FROM archive.messages_archive "
+            f"WHERE id IN ({marks}))",
+            [r[0] for r in rows],
+        )
+        moved = cur.rowcount
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    if moved != len(rows):
+        log.warning("archive: %s of %s rows not confirmed in archive, kept in main", len(rows) - moved, len(rows))
+    return moved
+
+
+async def run_retention(days: int = RETENTION_DAYS, *, pause: float = ARCHIVE_PAUSE) -> int:
+    """Один проход: переносит всё старше ``days`` дней пачками (по всем шардам). Возвращает итог."""
+    if days <= 0:
+        return 0
+    cutoff = int(time.time()) - days * 86400
+    total = 0
+    for db_path in router.shard_paths(repo.current_db_path()):
+        moved = 0
+        while True:
+            n = await archive_batch(cutoff, db_path=db_path)
+            moved += n
+            if n < ARCHIVE_BATCH:
+                break
+            await asyncio.sleep(pause)  # даём дорогу живым записям
+        if moved:
+            log.info("archive: moved %s messages older than %s days to %s", moved, days, archive_path(db_path))
+            async with repo._db(db_path) as db:
+                await db.execute("PRAGMA wal_checkpoint(PASSIVE);")
+        total += moved
+    return total
+
+
+async def retention_loop(interval: int = ARCHIVE_INTERVAL) -> None:
+    """Фоновая задача: периодически запускает :func:`run_retention`."""
+    if RETENTION_DAYS <= 0:
+        return
+    while True:
+        try:
+            await run_retention()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("archive: retention pass failed: %s", e)
+        await asyncio.sleep(max(60, interval))
+
+
+# REGION AI: relay message map
+# relay_map (строка на каждое пересланное сообщение) чистится своим циклом —
+# независимо от переноса истории, который по умолчанию выключен.
+RELAY_MAP_KEEP_DAYS = int(os.getenv("RELAY_MAP_KEEP_DAYS", "90"))
+RELAY_MAP_PURGE_INTERVAL = int(os.getenv("RELAY_MAP_PURGE_INTERVAL", "86400"))
+
+
+async def purge_relay_map(days: int = RELAY_MAP_KEEP_DAYS) -> int:
+    """Удалить связи старше ``days`` дней: на такие сообщения уже не отвечают."""
+    if days <= 0:
+        return 0
+    purged = await repo.purge_relay_map(int(time.time()) - days * 86400)
+    if purged:
+        log.info("archive: purged %s relay_map rows older than %s days", purged, days)
+    return purged
+
+
+async def relay_map_loop(interval: int = RELAY_MAP_PURGE_INTERVAL) -> None:
+    """Фоновая задача: периодически запускает :func:`purge_relay_map`."""
+    if RELAY_MAP_KEEP_DAYS <= 0:
+        return
+    while True:
+        try:
+            await purge_relay_map()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("archive: relay_map purge failed: %s", e)
+        await asyncio.sleep(max(60, interval))
+# END REGION AI
+
+
+# ============== Чтение архива ==============
+
+async def get_archived(user_id: int, limit: int) -> List[Dict[str, Any]]:
+    """Последние ``limit`` архивных сообщений пользователя (старые → новые)."""
+    path = _user_archive(user_id)
+    if limit <= 0 or not os.path.exists(path):
+        return []
+    async with aiosqlite.connect(path) as db:
+        try:
+            cur = await db.execute(
+                "SELECT direction, type, text_z, file_id, ts FROM messages_archive "
+                "WHERE user_id=? ORDER BY ts DESC, id DESC LIMIT ?",
+                (user_id, int(limit)),
+            )
+        except aiosqlite.OperationalError:  # архив ещё не создан
+            return []
+        rows = await cur.fetchall()
+    rows.reverse()
+    return [_row(*r) for r in rows]
+
+
+async def get_archived_page(
+    user_id: int,
+    limit: int,
+    before: Optional[Tuple[int, int]] = None,
+    after: Optional[Tuple[int, int]] = None,
+) -> List[Dict[str, Any]]:
+    """Keyset-страница архива по курсору ``(ts, id)``; порядок — как у ``repo.get_history_page``.
+
+    С ``before`` (или без курсора) строки идут от новых к старым, с ``after`` — от старых к новым.
+    """
+    path = _user_archive(user_id)
+    if limit <= 0 or not os.path.exists(path):
+        return []
+    sql = "SELECT id, direction, type, text_z, file_id, ts FROM messages_archive WHERE user_id=?"
+    params: List[Any] = [user_id]
+    if after is not None:
+        sql += " AND (ts, id) > (?, ?) ORDER BY ts ASC, id ASC"
+        params += list(after)
+    else:
+        if before is not None:
+            sql += " AND (ts, id) < (?, ?)"
+            params += list(before)
+        sql += " ORDER BY ts DESC, id DESC"
+    sql += " LIMIT ?"
+    params.append(int(limit))
+    async with aiosqlite.connect(path) as db:
+        try:
+            cur = await db.execute(sql, params)
+        except aiosqlite.OperationalError:
+            return []
+        rows = await cur.fetchall()
+    return [_row(*r[1:]) | {"id": r[0]} for r in rows]
+
+
+async def iter_archived(user_id: int, batch_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+    """Потоково отдаёт архивные сообщения пользователя (старые → новые)."""
+    path = _user_archive(user_id)
+    if not os.path.exists(path):
+        return
+    async with aiosqlite.connect(path) as db:
+        try:
+            cur = await db.execute(
+                "SELECT direction, type, text_z, file_id, ts FROM messages_archive "
+                "WHERE user_id=? ORDER BY ts ASC, id ASC",
+                (user_id,),
+            )
+        except aiosqlite.OperationalError:
+            return
+        try:
+            while True:
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for r in rows:
+                    yield _row(*r)
+        finally:
+            await cur.close()
+
+
+# REGION AI: archive full-text index
+async def search_archived(
+    match: str,
+    user_id: Optional[int],
+    limit: int,
+    snippet_marks: Tuple[str, str],
+) -> List[Tuple[Any, ...]]:
+    """FTS5-поиск по архивам (всех шардов или шарда ``user_id``).
+
+    ``match`` — готовый запрос (``repo.fts_query``); строки в форме
+    ``repo.search_messages``: (id, user_id, direction, type, ts, snippet, rank).
+    """
+    base = repo.current_db_path()
+    shards = [router.shard_path(base, user_id)] if user_id is not None else router.shard_paths(base)
+    sql = (
+        "SELECT a.id, a.user_id, a.direction, a.type, a.ts, "
+        "snippet(messages_archive_fts, 0, ?, ?, '…', 16), rank "
+        "FROM messages_archive_fts JOIN messages_archive a ON a.id = messages_archive_fts.rowid "
+        "WHERE messages_archive_fts MATCH ?"
+    )
+    params: List[Any] = [*snippet_marks, match]
+    if user_id is not None:
+        sql += " AND a.user_id = ?"
+        params.append(int(user_id))
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(int(limit))
+
+    async def _query(path: str) -> List[Any]:
+        if not os.path.exists(path):
+            return []
+        async with aiosqlite.connect(path) as db:
+            try:
+                cur = await db.execute(sql, params)
+            except aiosqlite.OperationalError:  # архив без индекса (ещё не было переноса)
+                return []
+            return list(await cur.fetchall())
+
+    return await router.fan_out(_query, [archive_path(p) for p in shards])
+# END REGION AI
@@ -0,0 +1,238 @@
+# shared/db/fsm_storage.py
+"""Persistent aiogram FSM storage on top of the bot's SQLite file.
+
+``SQLiteStorage`` keeps FSM state/data in the ``fsm_storage`` table (see
+``shared.db.repo._SCHEMA``) so posting plans, donate flows and invoice
+context survive deploys.
+
+* Single worker (default): reads go through an in-memory cache; clean
+  entries are trusted for ``FSM_CACHE_TTL`` seconds, dirty entries are
+  always served from memory.  Writes are coalesced: ``set_state``/
+  ``set_data``/``update_data`` only mark the key dirty, and a single flush
+  ``FSM_FLUSH_DELAY`` seconds later writes every dirty key in one
+  transaction, so three ``update_data`` calls in one step cost one write.
+* Several uvicorn workers (``FSM_WORKERS`` or ``WEB_CONCURRENCY`` > 1): the
+  cache is bypassed (every read hits the table) and every write goes to the
+  table before the handler continues, so a worker never acts on state
+  another worker has already changed.  Two updates of the same user handled
+  at the same instant by two workers can still race (last write wins); use
+  ``FSM_STORAGE=redis`` if that matters.
+* Every write pushes ``expires_at`` forward by ``FSM_STATE_TTL`` seconds;
+  expired rows are ignored on read and purged periodically.
+
+``close()`` flushes pending writes; call it on shutdown.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Mapping, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+from . import repo
+
+log = logging.getLogger("juicyfox.db.fsm")
+
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(7 * 86400)))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "1.0"))
+FSM_FLUSH_DELAY = float(os.getenv("FSM_FLUSH_DELAY", "0.05"))
+FSM_CACHE_MAX = int(os.getenv("FSM_CACHE_MAX", "10000"))
+FSM_PURGE_INTERVAL = int(os.getenv("FSM_PURGE_INTERVAL", "3600"))
+FSM_RETRY_MAX = 30  # пауза между повторами неудачной записи растёт до этого (сек)
+# сколько воркеров обслуживают бота; uvicorn берёт --workers по умолчанию из WEB_CONCURRENCY
+FSM_WORKERS = int(os.getenv("FSM_WORKERS") or os.getenv("WEB_CONCURRENCY") or "1")
+
+
+class _Entry:
+    __slots__ = ("state", "data", "loaded_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], loaded_at: float) -> None:
+        self.state = state
+        self.data = data
+        self.loaded_at = loaded_at
+
+
+def _storage_key(key: StorageKey) -> str:
+    return ":".join(
+        str(part) if part is not None else ""
+        for part in (
+            key.bot_id,
+            key.chat_id,
+            key.user_id,
+            key.thread_id,
+            getattr(key, "business_connection_id", None),
+            key.destiny,
+        )
+    )
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram ``BaseStorage`` backed by ``fsm_storage`` with write coalescing."""
+
+    def __init__(
+        self,
+        *,
+        state_ttl: int = FSM_STATE_TTL,
+        cache_ttl: float = FSM_CACHE_TTL,
+        flush_delay: float = FSM_FLUSH_DELAY,
+        cache_max: int = FSM_CACHE_MAX,
+        write_through: Optional[bool] = None,
+    ) -> None:
+        self.state_ttl = max(1, int(state_ttl))
+        # несколько воркеров: без доверия кешу и без отложенной записи
+        self.write_through = FSM_WORKERS > 1 if write_through is None else bool(write_through)
+        self.cache_ttl = 0.0 if self.write_through else max(0.0, float(cache_ttl))
+        self.flush_delay = max(0.0, float(flush_delay))
+        self.cache_max = max(1, int(cache_max))
+        self._cache: Dict[str, _Entry] = {}
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flushing = False
+        self._last_purge = 0.0
+        # FSM всех ботов живёт в одной БД, независимо от контекста апдейта
+        self.db_path = repo.current_db_path()
+
+    # --- чтение ---
+    async def _load(self, key: str) -> _Entry:
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry is not None and (key in self._dirty or now - entry.loaded_at < self.cache_ttl):
+            return entry
+
+        state: Optional[str] = None
+        data: Dict[str, Any] = {}
+        async with repo._db(self.db_path) as db:
+            cur = await db.execute(
+                "SELECT state, data, expires_at FROM fsm_storage WHERE key=?",
+                (key,),
+            )
+            row = await cur.fetchone()
+        if row and (row[2] is None or int(row[2]) > int(time.time())):
+            state = row[0]
+            try:
+                data = json.loads(row[1]) if row[1] else {}
+            except Exception:
+                log.warning("fsm: bad JSON for key=%s, resetting data", key)
+                data = {}
+
+        # пока мы ждали SELECT, ключ мог измениться в этом процессе
+        current = self._cache.get(key)
+        if current is not None and key in self._dirty:
+            return current
+        entry = _Entry(state, data, time.monotonic())
+        self._cache[key] = entry
+        return entry
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(_storage_key(key))).state
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._load(_storage_key(key))).data)
+
+    # --- запись (отложенная) ---
+    async def set_state(self, key: StorageKey, state: Any = None) -> None:
+        k = _storage_key(key)
+        entry = await self._load(k)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._mark_dirty(k)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = _storage_key(key)
+        entry = await self._load(k)
+        entry.data = dict(data)
+        await self._mark_dirty(k)
+
+    async def _mark_dirty(self, key: str) -> None:
+        self._dirty.add(key)
+        if self.write_through and await self.flush():
+            return  # записано сразу; при сбое — повтор фоновой задачей
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        # ключи, изменённые во время записи (или возвращённые после сбоя),
+        # уходят следующим проходом этой же задачи
+        failures = 0
+        while self._dirty:
+            delay = min(FSM_RETRY_MAX, 2 ** failures) if failures else self.flush_delay
+            if delay:
+                await asyncio.sleep(delay)
+            self._flushing = True
+            try:
+                failures = 0 if await self.flush() else failures + 1
+            finally:
+                self._flushing = False
+
+    async def flush(self) -> bool:
+        """Записать все «грязные» ключи одной транзакцией; ``False`` — запись не удалась."""
+        if not self._dirty:
+            return True
+        keys = list(self._dirty)
+        self._dirty.clear()
+        now = int(time.time())
+        upserts = []
+        deletes = []
+        for k in keys:
+            entry = self._cache.get(k)
+            if entry is None:
+                continue
+            if entry.state is None and not entry.data:
+                deletes.append((k,))
+            else:
+                upserts.append(
+                    (k, entry.state, json.dumps(entry.data, ensure_ascii=False, default=str), now + self.state_ttl, now)
+                )
+        try:
+            async with repo._db(self.db_path) as db:
+                if upserts:
+                    await db.executemany(
+                        "INSERT INTO fsm_storage(key, state, data, expires_at, updated_at) VALUES (?,?,?,?,?) "
+                        "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, "
+                        "expires_at=excluded.expires_at, updated_at=excluded.updated_at",
+                        upserts,
+                    )
+                if deletes:
+                    await db.executemany("DELETE FROM fsm_storage WHERE key=?", deletes)
+                if time.monotonic() - self._last_purge >= FSM_PURGE_INTERVAL:
+                    cur = await db.execute("DELETE FROM fsm_storage WHERE expires_at <= ?", (now,))
+                    self._last_purge = time.monotonic()
+                    if cur.rowcount:
+                        log.info("fsm: purged %s expired states", cur.rowcount)
+                await db.commit()
+        except Exception as e:
+            # вернём ключи в очередь — _flush_later повторит с паузой
+            self._dirty.update(keys)
+            log.warning("fsm: flush failed for %s keys: %s", len(keys), e)
+            return False
+        finally:
+            for k in keys:
+                entry = self._cache.get(k)
+                if entry is not None:
+                    entry.loaded_at = time.monotonic()
+        self._prune()
+        return True
+
+    def _prune(self) -> None:
+        if len(self._cache) <= self.cache_max:
+            return
+        clean = sorted(
+            (k for k in self._cache if k not in self._dirty),
+            key=lambda k: self._cache[k].loaded_at,
+        )
+        for k in clean[: len(self._cache) - self.cache_max]:
+            del self._cache[k]
+
+    async def close(self) -> None:
+        # идущую запись дожидаемся, чтобы не потерять ключи посреди транзакции;
+        # паузу (задержка склейки, повтор после сбоя) просто прерываем
+        task = self._flush_task
+        if task is not None and not task.done():
+            if not self._flushing:
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
@@ -2,17 +2,40 @@
 from __future__ import annotations
 
 import os
+import re
 import time
 import json
 import logging
 import aiosqlite
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from . import router
 
 log = logging.getLogger("juicyfox.db")
 
 DB_PATH = os.getenv("DB_PATH", "/app/data/juicyfox.sqlite")
 
+# REGION AI: per-bot database path
+# Multi-bot mode binds each update to its bot's DB file (see
+# apps/bot_core/tenants.py); otherwise DB_PATH is used.
+_db_path_var: ContextVar[Optional[str]] = ContextVar("juicyfox_db_path", default=None)
+
+
+def current_db_path() -> str:
+    return _db_path_var.get() or DB_PATH
+
+
+def set_db_path(path: Optional[str]):
+    """Bind ``path`` to the current context; returns a token for ``reset_db_path``."""
+    return _db_path_var.set(path)
+
+
+def reset_db_path(token) -> None:
+    _db_path_var.reset(token)
+# END REGION AI
+
 # Флаг, чтобы сообщение о миграции схемы выводилось только один раз
 _SCHEMA_LOGGED = False
 
@@ -135,13 +158,181 @@ _SCHEMA = [
     );
     """,
     "CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys(expires_at);",
+    # REGION AI: fsm_storage table
+    # Состояния aiogram FSM (см. shared/db/fsm_storage.py)
+    """
+    CREATE TABLE IF NOT EXISTS fsm_storage (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        expires_at INTEGER,
+        updated_at INTEGER
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_fsm_expires ON fsm_storage(expires_at);",
+    # END REGION AI
+    # REGION AI: media_cache table
+    # Telegram file_id локальных ассетов: ключ — бот + sha256 содержимого
+    """
+    CREATE TABLE IF NOT EXISTS media_cache (
+        bot_id TEXT NOT NULL,
+        sha256 TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        path TEXT,
+        file_id TEXT NOT NULL,
+        updated_at INTEGER,
+        PRIMARY KEY (bot_id, sha256, kind)
+    );
+    """,
+    # END REGION AI
+    # REGION AI: shared_state table
+    # Общее состояние воркеров uvicorn (см. shared/db/state.py)
+    """
+    CREATE TABLE IF NOT EXISTS shared_state (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        expires_at INTEGER
+    );
+    """,
+    # END REGION AI
+]
+
+# REGION AI: messages full-text index
+# FTS5 с внешним содержимым: сам текст хранится только в messages,
+# индекс синхронизируется триггерами на пути записи.
+_FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        text, content='messages', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages
+    WHEN new.text IS NOT NULL BEGIN
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages
+    WHEN old.text IS NOT NULL BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text)
+            SELECT 'delete', old.id, old.text WHERE old.text IS NOT NULL;
+        INSERT INTO messages_fts(rowid, text)
+            SELECT new.id, new.text WHERE new.text IS NOT NULL;
+    END;
+    """,
+]
+# END REGION AI
+
+# REGION AI: pending invoice TTL
+# get_active_invoice: WHERE user_id=? ORDER BY created_at DESC — один поиск по индексу;
+# чистильщик просроченных счетов идёт по expires_at.
+_PENDING_INVOICE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_pending_user_created ON pending_invoices(user_id, created_at);",
+    "CREATE INDEX IF NOT EXISTS idx_pending_expires ON pending_invoices(expires_at);",
+]
+PENDING_INVOICE_LEGACY_TTL = 7 * 86400
+# END REGION AI
+
+# REGION AI: access expiry
+# Материализованное «когда истекает доступ»: одна строка на (user_id, scope),
+# частичный индекс по until_ts неотозванных строк — ближайшее истечение
+# находится за O(log n) без GROUP BY по всей access_grants.
+_EXPIRY_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS access_expiry (
+        user_id INTEGER NOT NULL,
+        scope TEXT NOT NULL,                -- vip | chat
+        until_ts INTEGER NOT NULL,
+        revoked_at INTEGER,                 -- NULL — ещё не отозван
+        lang TEXT,                          -- язык покупателя (для напоминаний)
+        PRIMARY KEY (user_id, scope)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_access_expiry_due ON access_expiry(until_ts) WHERE revoked_at IS NULL;",
+    # Отправленные напоминания о продлении: PK = одно напоминание на окно и срок
+    """
+    CREATE TABLE IF NOT EXISTS access_reminders (
+        user_id INTEGER NOT NULL,
+        scope TEXT NOT NULL,
+        until_ts INTEGER NOT NULL,
+        window_sec INTEGER NOT NULL,        -- окно, сек до истечения
+        sent_at INTEGER NOT NULL,
+        PRIMARY KEY (user_id, scope, until_ts, window_sec)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_access_reminders_until ON access_reminders(until_ts);",
 ]
 
 
+def access_scope(plan_code: str) -> str:
+    return "chat" if plan_code.startswith("chat_") else "vip"
+# END REGION AI
+
+# REGION AI: invite-link pool
+# Заранее созданные одноразовые invite-ссылки: выдача доступа забирает
+# свободную ссылку одним UPDATE вместо вызова create_chat_invite_link.
+_INVITE_POOL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS invite_pool (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        invite_link TEXT NOT NULL UNIQUE,
+        expire_at INTEGER NOT NULL,         -- expire_date ссылки в Telegram
+        created_at INTEGER NOT NULL,
+        claimed_by INTEGER,                 -- NULL — свободна
+        claimed_at INTEGER
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_invite_pool_free ON invite_pool(chat_id, expire_at) WHERE claimed_by IS NULL;",
+]
+# END REGION AI
+
+# REGION AI: relay message map
+# Какое сообщение в рабочей группе соответствует какому сообщению в личке:
+# ответы оператора, треды и правки маршрутизируются по ключу, без разбора шапки.
+# direction: 'in' — пользователь → группа, 'out' — группа → пользователь.
+_RELAY_MAP_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS relay_map (
+        group_id INTEGER NOT NULL,
+        group_message_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        user_message_id INTEGER,            -- сообщение в личке с ботом
+        direction TEXT NOT NULL,
+        created_at INTEGER NOT NULL,
+        PRIMARY KEY (group_id, group_message_id)
+    ) WITHOUT ROWID;
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_relay_map_user ON relay_map(user_id, user_message_id);",
+]
+# END REGION AI
+
+
 async def init_db() -> None:
     """Создаёт каталог и таблицы на диске, применяет PRAGMA для первичного соединения."""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    async with aiosqlite.connect(DB_PATH) as db:
+    base = current_db_path()
+    # REGION AI: database shards
+    # схема одинакова для основного файла и шардов (см. shared/db/router.py)
+    for path in dict.fromkeys([base, *router.shard_paths(base)]):
+        await _init_file(path)
+    # END REGION AI
+
+    global _SCHEMA_LOGGED
+    if not _SCHEMA_LOGGED:
+        log.info("DB schema migrated: pending_invoices ready")
+        _SCHEMA_LOGGED = True
+
+
+async def _init_file(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    async with aiosqlite.connect(path) as db:
         for p in _PRAGMAS:
             await db.execute(p)
         for stmt in _SCHEMA:
@@ -156,37 +347,77 @@ async def init_db() -> None:
             await db.execute("ALTER TABLE pending_invoices ADD COLUMN price REAL")
         if "period" not in cols:
             await db.execute("ALTER TABLE pending_invoices ADD COLUMN period INTEGER")
+        # REGION AI: pending invoice TTL
+        if "expires_at" not in cols:
+            await db.execute("ALTER TABLE pending_invoices ADD COLUMN expires_at INTEGER")
+            # старые счета создавались без срока у провайдера — даём им неделю с создания
+            await db.execute(
+                "UPDATE pending_invoices SET expires_at = CAST(strftime('%s', created_at) AS INTEGER) + ? "
+                "WHERE expires_at IS NULL",
+                (PENDING_INVOICE_LEGACY_TTL,),
+            )
+        for stmt in _PENDING_INVOICE_INDEXES:
+            await db.execute(stmt)
+        # END REGION AI
         cur = await db.execute("PRAGMA table_info(users)")
         cols = {r[1] for r in await cur.fetchall()}
         if "chat_number" not in cols:
             await db.execute("ALTER TABLE users ADD COLUMN chat_number INTEGER")
+        # REGION AI: messages full-text index
+        try:
+            cur = await db.execute("SELECT 1 FROM sqlite_master WHERE name='messages_fts'")
+            fresh = await cur.fetchone() is None
+            for stmt in _FTS_SCHEMA:
+                await db.execute(stmt)
+            if fresh:
+                # индекс появился впервые — проиндексировать уже накопленную историю
+                await db.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+                log.info("messages_fts built")
+        except Exception as e:
+            log.warning("FTS5 unavailable, /search disabled: %s", e)
+        # END REGION AI
+        # REGION AI: access expiry
+        cur = await db.execute("SELECT 1 FROM sqlite_master WHERE name='access_expiry'")
+        fresh = await cur.fetchone() is None
+        for stmt in _EXPIRY_SCHEMA:
+            await db.execute(stmt)
+        cur = await db.execute("PRAGMA table_info(access_expiry)")
+        if "lang" not in {r[1] for r in await cur.fetchall()}:
+            await db.execute("ALTER TABLE access_expiry ADD COLUMN lang TEXT")
+        if fresh:
+            # первый запуск: перенести сроки уже выданных доступов
+            await db.execute(
+                "INSERT OR IGNORE INTO access_expiry(user_id, scope, until_ts) "
+                "SELECT user_id, CASE WHEN substr(plan_code, 1, 5)='chat_' THEN 'chat' ELSE 'vip' END, MAX(until_ts) "
+                "FROM access_grants WHERE until_ts IS NOT NULL GROUP BY 1, 2"
+            )
+        # END REGION AI
+        # REGION AI: invite-link pool
+        for stmt in _INVITE_POOL_SCHEMA:
+            await db.execute(stmt)
+        # END REGION AI
+        # REGION AI: relay message map
+        for stmt in _RELAY_MAP_SCHEMA:
+            await db.execute(stmt)
+        # END REGION AI
         await db.commit()
 
-    global _SCHEMA_LOGGED
-    if not _SCHEMA_LOGGED:
-        log.info("DB schema migrated: pending_invoices ready")
-        _SCHEMA_LOGGED = True
-
-    log.info("sqlite ready at %s", DB_PATH)
+    log.info("sqlite ready at %s", path)
 
 
 @asynccontextmanager
-async def _db():
+async def _db(path: Optional[str] = None, user_id: Optional[int] = None):
     """
     Асинхронный контекст подключения к БД:
-    - открывает соединение
-    - применяет PRAGMA ОДИН раз на это соединение
-    - гарантированно закрывает соединение
+    - берёт соединение из пула файла (shared/db/router.py)
+    - PRAGMA применены ОДИН раз при открытии этого соединения
+    - незакоммиченная транзакция откатывается при возврате в пул
+    ``path`` по умолчанию — БД текущего бота (current_db_path());
+    с ``user_id`` — шард пользователя (для messages/streaks).
     """
-    # на всякий случай гарантируем каталог (если init_db забыли)
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    db = await aiosqlite.connect(DB_PATH)
-    try:
-        for p in _PRAGMAS:
-            await db.execute(p)
+    path = path or router.shard_path(current_db_path(), user_id)
+    async with router.connect(path) as db:
         yield db
-    finally:
-        await db.close()
 
 
 # ============== Идемпотентность вебхуков и событий ==============
@@ -245,7 +476,7 @@ async def log_message(user_id: int, direction: str, content: Dict[str, Any]) ->
     typ = str(content.get("type") or "text")
     text = content.get("text")
     file_id = content.get("file_id")
-    async with _db() as db:
+    async with _db(user_id=user_id) as db:
         await db.execute(
             "INSERT INTO messages (user_id, direction, type, text, file_id, ts) VALUES (?,?,?,?,?,?)",
             (user_id, direction, typ, text, file_id, ts),
@@ -257,7 +488,7 @@ async def get_history(user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
     """
     Возвращает ПОСЛЕДНИЕ N сообщений пользователя в хронологическом порядке (старые → новые).
     """
-    async with _db() as db:
+    async with _db(user_id=user_id) as db:
         cur = await db.execute(
             "SELECT direction, type, text, file_id, ts "
             "FROM messages WHERE user_id=? ORDER BY ts DESC LIMIT ?",
@@ -275,13 +506,112 @@ async def get_history(user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
             "file_id": file_id,
             "ts": int(ts),
         })
+    # REGION AI: archive tier
+    # Горячей таблицы не хватило — добираем более старые сообщения из архива
+    if len(out) < int(limit):
+        from .archive import get_archived
+
+        out = await get_archived(user_id, int(limit) - len(out)) + out
+    # END REGION AI
     return out
 
 
+# REGION AI: keyset history pages
+HistoryCursor = Tuple[int, int]  # (ts, id)
+
+
+async def get_history_page(
+    user_id: int,
+    before: Optional[HistoryCursor] = None,
+    limit: int = 20,
+    after: Optional[HistoryCursor] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Keyset-пагинация истории: до ``limit`` сообщений строго старше курсора
+    ``before`` (или самые свежие, если курсора нет), либо строго новее ``after``.
+    Курсор — пара ``(ts, id)``; id разрешает равные ts. Каждая страница —
+    один поиск по idx_messages_user_ts (rowid входит в индекс неявно), без OFFSET.
+    Результат в хронологическом порядке, у каждой записи есть ``id``.
+    Горячая таблица и архив читаются как одна лента.
+    """
+    from .archive import get_archived_page
+
+    limit = int(limit)
+    sql = "SELECT id, direction, type, text, file_id, ts FROM messages WHERE user_id=?"
+    params: List[Any] = [user_id]
+    if after is not None:
+        # архив старше горячей таблицы — сначала дочитываем его
+        out = await get_archived_page(user_id, limit, after=after)
+        sql += " AND (ts, id) > (?, ?) ORDER BY ts ASC, id ASC LIMIT ?"
+        params += [int(after[0]), int(after[1]), limit - len(out)]
+    else:
+        out = []
+        if before is not None:
+            sql += " AND (ts, id) < (?, ?)"
+            params += [int(before[0]), int(before[1])]
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+    if params[-1] > 0:
+        async with _db(user_id=user_id) as db:
+            cur = await db.execute(sql, params)
+            rows = await cur.fetchall()
+        out += [
+            {"id": r[0], "direction": r[1], "type": r[2], "text": r[3], "file_id": r[4], "ts": int(r[5])}
+            for r in rows
+        ]
+    if after is None:
+        if len(out) < limit:
+            out += await get_archived_page(
+                user_id,
+                limit - len(out),
+                before=(out[-1]["ts"], out[-1]["id"]) if out else before,
+            )
+        out.reverse()
+    return out
+# END REGION AI
+
+
+async def iter_history(user_id: int, batch_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Потоково отдаёт ВСЮ историю пользователя (старые → новые).
+    Строки читаются курсором пачками по ``batch_size`` — память не растёт
+    с длиной переписки. Сначала идёт архив (см. shared/db/archive.py),
+    затем горячая таблица.
+    """
+    # REGION AI: archive tier
+    from .archive import iter_archived
+
+    async for rec in iter_archived(user_id, batch_size):
+        yield rec
+    # END REGION AI
+    async with _db(user_id=user_id) as db:
+        cur = await db.execute(
+            "SELECT direction, type, text, file_id, ts "
+            "FROM messages WHERE user_id=? ORDER BY ts ASC, id ASC",
+            (user_id,),
+        )
+        try:
+            while True:
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for direction, typ, text, file_id, ts in rows:
+                    yield {
+                        "direction": direction,
+                        "type": typ,
+                        "text": text,
+                        "file_id": file_id,
+                        "ts": int(ts),
+                    }
+        finally:
+            await cur.close()
+
+
 # ============== Счётчики подряд входящих ==============
 
 async def inc_streak(user_id: int) -> int:
-    async with _db() as db:
+    async with _db(user_id=user_id) as db:
         await db.execute(
             """
             INSERT INTO streaks(user_id, count) VALUES(?, 1)
@@ -296,7 +626,7 @@ async def inc_streak(user_id: int) -> int:
 
 
 async def reset_streak(user_id: int) -> None:
-    async with _db() as db:
+    async with _db(user_id=user_id) as db:
         await db.execute(
             "INSERT INTO streaks(user_id, count) VALUES(?, 0) ON CONFLICT(user_id) DO UPDATE SET count = 0",
             (user_id,),
@@ -305,7 +635,7 @@ async def reset_streak(user_id: int) -> None:
 
 
 async def get_streak(user_id: int) -> int:
-    async with _db() as db:
+    async with _db(user_id=user_id) as db:
         cur = await db.execute("SELECT count FROM streaks WHERE user_id=?", (user_id,))
         row = await cur.fetchone()
         return int(row[0]) if row else 0
@@ -322,13 +652,15 @@ async def save_pending_invoice(
     plan_name: str,
     price: float,
     period: int,
+    expires_at: Optional[int] = None,
 ) -> None:
+    """``expires_at`` — срок счёта у провайдера (unix time); по нему его удалит чистильщик."""
     sql = (
         """
         INSERT OR REPLACE INTO pending_invoices(
             invoice_id, user_id, plan_code, currency,
-            plan_callback, plan_name, price, period
-        ) VALUES (?,?,?,?,?,?,?,?)
+            plan_callback, plan_name, price, period, expires_at
+        ) VALUES (?,?,?,?,?,?,?,?,?)
         """
     )
     params = (
@@ -340,6 +672,7 @@ async def save_pending_invoice(
         plan_name,
         price,
         period,
+        expires_at,
     )
     try:
         log.info(
@@ -403,13 +736,82 @@ async def delete_pending_invoice(invoice_id: str) -> int:
         return 0
 
 
+# REGION AI: invoice reconciliation
+async def list_pending_invoices(limit: int) -> List[Dict[str, Any]]:
+    """Незакрытые счета, новые первыми (для сверки с провайдером)."""
+    async with _db() as db:
+        cur = await db.execute(
+            "SELECT invoice_id, user_id, plan_code, currency, plan_callback, plan_name, price, period, expires_at "
+            "FROM pending_invoices ORDER BY created_at DESC LIMIT ?",
+            (int(limit),),
+        )
+        rows = await cur.fetchall()
+    keys = (
+        "invoice_id", "user_id", "plan_code", "currency",
+        "plan_callback", "plan_name", "price", "period", "expires_at",
+    )
+    return [dict(zip(keys, r)) for r in rows]
+
+
+async def take_pending_invoice(invoice_id: str) -> Optional[Dict[str, Any]]:
+    """Атомарно забрать счёт (DELETE … RETURNING); ``None`` — его уже закрыли."""
+    async with _db() as db:
+        cur = await db.execute(
+            "DELETE FROM pending_invoices WHERE invoice_id=? RETURNING "
+            "invoice_id, user_id, plan_code, currency, plan_callback, plan_name, price, period, expires_at",
+            (invoice_id,),
+        )
+        row = await cur.fetchone()
+        await db.commit()
+    if row is None:
+        return None
+    keys = (
+        "invoice_id", "user_id", "plan_code", "currency",
+        "plan_callback", "plan_name", "price", "period", "expires_at",
+    )
+    return dict(zip(keys, row))
+
+
+async def restore_pending_invoice(row: Dict[str, Any]) -> None:
+    """Вернуть забранный счёт (выдача не удалась — его подберёт следующая сверка)."""
+    await save_pending_invoice(
+        row["user_id"], row["invoice_id"], row["plan_code"], row["currency"],
+        row["plan_callback"], row["plan_name"], row["price"], row["period"],
+        expires_at=row.get("expires_at"),
+    )
+# END REGION AI
+
+
+# REGION AI: pending invoice TTL
+async def sweep_pending_invoices(before_ts: int, limit: int) -> List[Tuple[str, str]]:
+    """Удалить до ``limit`` счетов, истёкших до ``before_ts``; вернуть (invoice_id, plan_code)."""
+    async with _db() as db:
+        cur = await db.execute(
+            "DELETE FROM pending_invoices WHERE invoice_id IN ("
+            "SELECT invoice_id FROM pending_invoices WHERE expires_at <= ? ORDER BY expires_at LIMIT ?) "
+            "RETURNING invoice_id, plan_code",
+            (int(before_ts), int(limit)),
+        )
+        rows = await cur.fetchall()
+        await db.commit()
+    return [(str(r[0]), str(r[1])) for r in rows]
+
+
+async def count_pending_invoices() -> int:
+    async with _db() as db:
+        cur = await db.execute("SELECT COUNT(*) FROM pending_invoices")
+        row = await cur.fetchone()
+    return int(row[0] or 0)
+# END REGION AI
+
+
 async def get_active_invoice(user_id: int) -> Optional[Dict[str, Any]]:
     sql = (
         """
         SELECT invoice_id, plan_code, currency,
                plan_callback, plan_name, price, period
         FROM pending_invoices
-        WHERE user_id=?
+        WHERE user_id=? AND (expires_at IS NULL OR expires_at > ?)
         ORDER BY created_at DESC LIMIT 1
         """
     )
@@ -423,7 +825,8 @@ async def get_active_invoice(user_id: int) -> Optional[Dict[str, Any]]:
             user_id,
         )
         async with _db() as db:
-            cur = await db.execute(sql, (user_id,))
+            # просроченный, но ещё не выметенный счёт активным не считается
+            cur = await db.execute(sql, (user_id, int(time.time())))
             row = await cur.fetchone()
         if row:
             (
@@ -496,20 +899,182 @@ async def log_payment_event(event: Dict[str, Any]) -> None:
         log.warning("log_payment_event failed: %s ; event=%r", e, event)
 
 
-async def log_access_grant(user_id: int, plan_code: str, invite_link: Optional[str], until_ts: Optional[int]) -> None:
+async def log_access_grant(
+    user_id: int,
+    plan_code: str,
+    invite_link: Optional[str],
+    until_ts: Optional[int],
+    lang: Optional[str] = None,
+) -> None:
     async with _db() as db:
         await db.execute(
             "INSERT INTO access_grants(user_id, plan_code, invite_link, until_ts) VALUES (?,?,?,?)",
             (user_id, plan_code, invite_link, until_ts),
         )
+        # REGION AI: access expiry
+        if until_ts is not None:
+            await db.execute(
+                "INSERT INTO access_expiry(user_id, scope, until_ts, lang) VALUES (?,?,?,?) "
+                "ON CONFLICT(user_id, scope) DO UPDATE SET "
+                "until_ts=MAX(access_expiry.until_ts, excluded.until_ts), revoked_at=NULL, "
+                "lang=COALESCE(excluded.lang, access_expiry.lang)",
+                (user_id, access_scope(plan_code), int(until_ts), lang),
+            )
+            # продление снимает отметку об истечении
+            await db.execute("UPDATE users SET status='active' WHERE user_id=? AND status='expired'", (user_id,))
+        # END REGION AI
+        await db.commit()
+
+
+# REGION AI: access expiry
+async def next_access_expiry() -> Optional[int]:
+    """Ближайший ``until_ts`` среди неотозванных доступов (по индексу)."""
+    async with _db() as db:
+        cur = await db.execute("SELECT MIN(until_ts) FROM access_expiry WHERE revoked_at IS NULL")
+        row = await cur.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+async def due_access_expiries(now: int, limit: int) -> List[Tuple[int, str, int]]:
+    """До ``limit`` истёкших и ещё не отозванных доступов: (user_id, scope, until_ts)."""
+    async with _db() as db:
+        cur = await db.execute(
+            "SELECT user_id, scope, until_ts FROM access_expiry "
+            "WHERE revoked_at IS NULL AND until_ts <= ? ORDER BY until_ts LIMIT ?",
+            (int(now), int(limit)),
+        )
+        rows = await cur.fetchall()
+    return [(int(r[0]), str(r[1]), int(r[2])) for r in rows]
+
+
+async def mark_access_revoked(user_id: int, scope: str, until_ts: int, now: int) -> bool:
+    """Отметить отзыв, если срок не продлили тем временем. Помечает ``users.status='expired'``,
+    когда у пользователя не осталось живых доступов. Возвращает ``False``, если строку продлили.
+    """
+    async with _db() as db:
+        cur = await db.execute(
+            "UPDATE access_expiry SET revoked_at=? "
+            "WHERE user_id=? AND scope=? AND until_ts=? AND revoked_at IS NULL",
+            (int(now), user_id, scope, int(until_ts)),
+        )
+        if cur.rowcount == 0:
+            await db.rollback()
+            return False
+        await db.execute(
+            "UPDATE users SET status='expired' WHERE user_id=? AND status='active' AND NOT EXISTS ("
+            "SELECT 1 FROM access_expiry WHERE user_id=? AND revoked_at IS NULL AND until_ts > ?)",
+            (user_id, user_id, int(now)),
+        )
+        await db.commit()
+    return True
+
+
+async def due_access_reminders(
+    now: int, window: int, floor: int, limit: int
+) -> List[Tuple[int, str, int, Optional[str]]]:
+    """Доступы, истекающие в ``(now + floor, now + window]``, без напоминания для ``window``.
+
+    Диапазон по ``idx_access_expiry_due``; возвращает (user_id, scope, until_ts, lang).
+    """
+    async with _db() as db:
+        cur = await db.execute(
+            "SELECT e.user_id, e.scope, e.until_ts, e.lang FROM access_expiry e "
+            "WHERE e.revoked_at IS NULL AND e.until_ts > ? AND e.until_ts <= ? "
+            "AND NOT EXISTS (SELECT 1 FROM access_reminders r WHERE r.user_id=e.user_id "
+            "AND r.scope=e.scope AND r.until_ts=e.until_ts AND r.window_sec=?) "
+            "ORDER BY e.until_ts LIMIT ?",
+            (int(now + floor), int(now + window), int(window), int(limit)),
+        )
+        rows = await cur.fetchall()
+    return [(int(r[0]), str(r[1]), int(r[2]), r[3]) for r in rows]
+
+
+async def claim_access_reminder(user_id: int, scope: str, until_ts: int, window: int, now: int) -> bool:
+    """Записать напоминание ДО отправки; ``False`` — его уже отправил кто-то другой."""
+    async with _db() as db:
+        cur = await db.execute(
+            "INSERT OR IGNORE INTO access_reminders(user_id, scope, until_ts, window_sec, sent_at) VALUES (?,?,?,?,?)",
+            (user_id, scope, int(until_ts), int(window), int(now)),
+        )
+        await db.commit()
+    return cur.rowcount > 0
+
+
+async def release_access_reminder(user_id: int, scope: str, until_ts: int, window: int) -> None:
+    """Снять запись после временной ошибки отправки — напоминание уйдёт на следующем проходе."""
+    async with _db() as db:
+        await db.execute(
+            "DELETE FROM access_reminders WHERE user_id=? AND scope=? AND until_ts=? AND window_sec=?",
+            (user_id, scope, int(until_ts), int(window)),
+        )
+        await db.commit()
+
+
+async def purge_access_reminders(before_ts: int) -> None:
+    async with _db() as db:
+        await db.execute("DELETE FROM access_reminders WHERE until_ts < ?", (int(before_ts),))
+        await db.commit()
+# END REGION AI
+
+
+# REGION AI: invite-link pool
+async def add_pool_invite(chat_id: int, invite_link: str, expire_at: int) -> None:
+    async with _db() as db:
+        await db.execute(
+            "INSERT OR IGNORE INTO invite_pool(chat_id, invite_link, expire_at, created_at) VALUES (?,?,?,?)",
+            (int(chat_id), invite_link, int(expire_at), int(time.time())),
+        )
+        await db.commit()
+
+
+async def claim_pool_invite(chat_id: int, user_id: int, min_expire_at: int) -> Optional[str]:
+    """Атомарно забрать свободную ссылку, действующую не меньше чем до ``min_expire_at``.
+
+    Одна инструкция UPDATE … RETURNING: два одновременных платежа не получат
+    одну и ту же ссылку. Берётся ссылка с самым ранним сроком.
+    """
+    async with _db() as db:
+        cur = await db.execute(
+            "UPDATE invite_pool SET claimed_by=?, claimed_at=? "
+            "WHERE id=(SELECT id FROM invite_pool WHERE chat_id=? AND claimed_by IS NULL "
+            "AND expire_at >= ? ORDER BY expire_at LIMIT 1) AND claimed_by IS NULL "
+            "RETURNING invite_link",
+            (int(user_id), int(time.time()), int(chat_id), int(min_expire_at)),
+        )
+        row = await cur.fetchone()
+        await db.commit()
+    return row[0] if row else None
+
+
+async def count_pool_invites(chat_id: int, min_expire_at: int) -> int:
+    """Свободные ссылки, которые ещё можно выдать."""
+    async with _db() as db:
+        cur = await db.execute(
+            "SELECT COUNT(*) FROM invite_pool WHERE chat_id=? AND claimed_by IS NULL AND expire_at >= ?",
+            (int(chat_id), int(min_expire_at)),
+        )
+        row = await cur.fetchone()
+    return int(row[0] or 0)
+
+
+async def purge_pool_invites(min_expire_at: int, claimed_before: int) -> int:
+    """Удалить свободные ссылки, которые уже не выдать, и давно выданные."""
+    async with _db() as db:
+        cur = await db.execute(
+            "DELETE FROM invite_pool WHERE (claimed_by IS NULL AND expire_at < ?) "
+            "OR (claimed_by IS NOT NULL AND claimed_at < ?)",
+            (int(min_expire_at), int(claimed_before)),
+        )
         await db.commit()
+    return cur.rowcount or 0
+# END REGION AI
 
 
 # REGION AI: user profile
 def get_user_profile(user_id: int) -> tuple[float, Optional[int]]:
     try:
         import sqlite3
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(current_db_path())
         cur = conn.cursor()
         total = cur.execute(
             "SELECT COALESCE(SUM(amount),0) FROM payment_events "
@@ -554,11 +1119,62 @@ async def get_all_relay_users() -> List[Dict[str, Any]]:
     return [{"user_id": r[0], "username": r[1], "full_name": r[2], "last_seen": r[3]} for r in rows]
 # END REGION AI
 
+# REGION AI: relay message map
+async def save_relay_map(
+    group_id: int,
+    group_message_ids: Sequence[int],
+    user_id: int,
+    user_message_id: Optional[int],
+    direction: str,
+) -> None:
+    """Связать сообщения группы с сообщением в личке (шапка стикера и сам стикер — оба)."""
+    now = int(time.time())
+    async with _db() as db:
+        await db.executemany(
+            "INSERT OR REPLACE INTO relay_map(group_id, group_message_id, user_id, user_message_id, direction, created_at) "
+            "VALUES (?,?,?,?,?,?)",
+            [(int(group_id), int(mid), int(user_id), user_message_id, direction, now) for mid in group_message_ids],
+        )
+        await db.commit()
+
+
+async def get_relay_target(group_id: int, group_message_id: int) -> Optional[Dict[str, Any]]:
+    """Пользователь и его сообщение для сообщения группы (поиск по первичному ключу)."""
+    async with _db() as db:
+        row = await (
+            await db.execute(
+                "SELECT user_id, user_message_id, direction FROM relay_map WHERE group_id=? AND group_message_id=?",
+                (int(group_id), int(group_message_id)),
+            )
+        ).fetchone()
+    return {"user_id": int(row[0]), "user_message_id": row[1], "direction": row[2]} if row else None
+
+
+async def get_relay_sources(user_id: int, user_message_id: int) -> List[Dict[str, Any]]:
+    """Сообщения группы, связанные с сообщением в личке пользователя."""
+    async with _db() as db:
+        rows = await (
+            await db.execute(
+                "SELECT group_id, group_message_id, direction FROM relay_map "
+                "WHERE user_id=? AND user_message_id=? ORDER BY group_message_id",
+                (int(user_id), int(user_message_id)),
+            )
+        ).fetchall()
+    return [{"group_id": int(r[0]), "group_message_id": int(r[1]), "direction": r[2]} for r in rows]
+
+
+async def purge_relay_map(before_ts: int) -> int:
+    async with _db() as db:
+        cur = await db.execute("DELETE FROM relay_map WHERE created_at < ?", (int(before_ts),))
+        await db.commit()
+    return cur.rowcount or 0
+# END REGION AI
+
 # REGION AI: user helpers
 def get_chat_number(user_id: int) -> Optional[int]:
     try:
         import sqlite3
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(current_db_path())
         row = conn.execute("SELECT chat_number FROM users WHERE user_id=?", (user_id,)).fetchone()
         conn.close()
         return int(row[0]) if row and row[0] is not None else None
@@ -644,3 +1260,97 @@ async def enqueue_mailing(job: Dict[str, Any]) -> int:
         await db.commit()
         return int(cur.lastrowid)
 # END REGION AI
+
+
+# REGION AI: media_cache helpers
+async def get_media_file_ids(bot_id: str) -> Dict[tuple, str]:
+    """Все сохранённые file_id бота: ``{(sha256, kind): file_id}``."""
+    async with _db() as db:
+        rows = await (
+            await db.execute(
+                "SELECT sha256, kind, file_id FROM media_cache WHERE bot_id=?",
+                (str(bot_id),),
+            )
+        ).fetchall()
+    return {(r[0], r[1]): r[2] for r in rows}
+
+
+async def save_media_file_id(bot_id: str, sha256: str, kind: str, path: str, file_id: str) -> None:
+    async with _db() as db:
+        await db.execute(
+            "INSERT INTO media_cache(bot_id, sha256, kind, path, file_id, updated_at) VALUES (?,?,?,?,?,?) "
+            "ON CONFLICT(bot_id, sha256, kind) DO UPDATE SET "
+            "path=excluded.path, file_id=excluded.file_id, updated_at=excluded.updated_at",
+            (str(bot_id), sha256, kind, path, file_id, int(time.time())),
+        )
+        await db.commit()
+
+
+async def delete_media_file_id(bot_id: str, sha256: str, kind: str) -> None:
+    async with _db() as db:
+        await db.execute(
+            "DELETE FROM media_cache WHERE bot_id=? AND sha256=? AND kind=?",
+            (str(bot_id), sha256, kind),
+        )
+        await db.commit()
+# END REGION AI
+
+
+# REGION AI: full-text search
+_FTS_TOKEN = re.compile(r"\w+", re.UNICODE)
+SNIPPET_OPEN = "\x02"
+SNIPPET_CLOSE = "\x03"
+
+
+def fts_query(text: str) -> str:
+    """Пользовательский ввод → безопасный FTS5-запрос (AND по префиксам слов)."""
+    return " ".join(f'"{tok}"*' for tok in _FTS_TOKEN.findall(text or "")[:16])
+
+
+async def search_messages(
+    query: str,
+    user_id: Optional[int] = None,
+    limit: int = 10,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Ранжированный (bm25) поиск по тексту сообщений — горячих и архивных
+    (shared/db/archive.py). Возвращает до ``limit`` результатов; ``snippet``
+    размечен маркерами SNIPPET_OPEN/SNIPPET_CLOSE вокруг совпадений.
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    sql = (
+        "SELECT m.id, m.user_id, m.direction, m.type, m.ts, "
+        "snippet(messages_fts, 0, ?, ?, '…', 16), rank "
+        "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+        "WHERE messages_fts MATCH ?"
+    )
+    params: List[Any] = [SNIPPET_OPEN, SNIPPET_CLOSE, match]
+    if user_id is not None:
+        sql += " AND m.user_id = ?"
+        params.append(int(user_id))
+    base = current_db_path()
+    paths = [router.shard_path(base, user_id)] if user_id is not None else router.shard_paths(base)
+    # шарды и архивы: с каждого берём первые offset+limit, сливаем по rank
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(int(limit) + int(offset))
+
+    async def _query(path: str) -> List[Any]:
+        async with _db(path) as db:
+            cur = await db.execute(sql, params)
+            return await cur.fetchall()
+
+    rows = await router.fan_out(_query, paths)
+    # REGION AI: archive full-text index
+    from .archive import search_archived
+
+    rows += await search_archived(match, user_id, int(limit) + int(offset), (SNIPPET_OPEN, SNIPPET_CLOSE))
+    # END REGION AI
+    rows = sorted(rows, key=lambda r: r[6])[int(offset):int(offset) + int(limit)]
+    return [
+        {"id": r[0], "user_id": r[1], "direction": r[2], "type": r[3], "ts": int(r[4]), "snippet": r[5]}
+        for r in rows
+    ]
+# END REGION AI
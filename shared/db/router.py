@@ -0,0 +1,176 @@
+# shared/db/router.py
+"""Database routing and connection pooling.
+
+* Каждый бот работает со своим файлом БД (``repo.current_db_path()``, см.
+  apps/bot_core/tenants.py).
+* Пользовательские таблицы с большим потоком записей (``messages``,
+  ``streaks``) можно разнести по ``DB_SHARDS`` файлам-шардам:
+  ``<db>.shard<N>.sqlite``, где ``N = crc32(user_id) % DB_SHARDS``.  У каждого
+  шарда свой writer lock SQLite, поэтому пропускная способность записи растёт
+  с числом шардов.  Остальные таблицы живут в основном файле.
+* На каждый файл — пул из ``DB_POOL_SIZE`` соединений: PRAGMA применяются один
+  раз на соединение, а не на каждый запрос.
+* :func:`fan_out` выполняет запрос на всех шардах параллельно и склеивает
+  результаты (админские выборки, поиск).
+
+``DB_SHARDS=1`` (по умолчанию) — без шардирования.  Число шардов нельзя
+менять на живых данных без переноса.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import aiosqlite
+
+log = logging.getLogger("juicyfox.db.router")
+
+DB_SHARDS = max(1, int(os.getenv("DB_SHARDS", "1")))
+DB_POOL_SIZE = max(1, int(os.getenv("DB_POOL_SIZE", "4")))
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA foreign_keys=ON;",
+    "PRAGMA temp_store=MEMORY;",
+]
+
+
+def shard_index(user_id: int, shards: int = DB_SHARDS) -> int:
+    return zlib.crc32(str(int(user_id)).encode()) % shards if shards > 1 else 0
+
+
+def shard_path(base_path: str, user_id: Optional[int] = None) -> str:
+    """Файл БД для ``user_id`` (или основной файл, если шардирование выключено)."""
+    if DB_SHARDS <= 1 or user_id is None:
+        return base_path
+    return _shard_file(base_path, shard_index(user_id))
+
+
+def _shard_file(base_path: str, n: int) -> str:
+    stem, ext = os.path.splitext(base_path)
+    return f"{stem}.shard{n}{ext or '.sqlite'}"
+
+
+def shard_paths(base_path: str) -> List[str]:
+    """Все файлы, где лежат пользовательские таблицы бота."""
+    if DB_SHARDS <= 1:
+        return [base_path]
+    return [_shard_file(base_path, n) for n in range(DB_SHARDS)]
+
+
+def _daemonize(db: aiosqlite.Connection) -> None:
+    """Поток соединения пула — daemon: скрипт, не закрывший пул, всё равно завершится."""
+    # aiosqlite < 0.20: Connection сам является Thread; новее — держит его в ``_thread``
+    thread = getattr(db, "_thread", db)
+    if hasattr(thread, "daemon") and not thread.is_alive():
+        thread.daemon = True
+
+
+class _Pool:
+    """Пул соединений aiosqlite к одному файлу."""
+
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self.size = size
+        self._idle: List[aiosqlite.Connection] = []
+        self._opened = 0
+        self._cond = asyncio.Condition()
+
+    async def _open(self) -> aiosqlite.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        db = aiosqlite.connect(self.path)
+        _daemonize(db)
+        await db
+        for p in PRAGMAS:
+            await db.execute(p)
+        return db
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        async with self._cond:
+            while not self._idle and self._opened >= self.size:
+                await self._cond.wait()
+            db = self._idle.pop() if self._idle else None
+            if db is None:
+                self._opened += 1
+        if db is None:
+            try:
+                db = await self._open()
+            except BaseException:
+                async with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                raise
+        try:
+            yield db
+        finally:
+            healthy = True
+            try:
+                if db.in_transaction:
+                    # незакоммиченное не должно утечь к следующему владельцу
+                    await db.rollback()
+            except Exception:
+                healthy = False
+            async with self._cond:
+                if healthy:
+                    self._idle.append(db)
+                else:
+                    self._opened -= 1
+                self._cond.notify()
+            if not healthy:
+                try:
+                    await db.close()
+                except Exception:
+                    pass
+
+    async def close(self) -> None:
+        async with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for db in idle:
+            try:
+                await db.close()
+            except Exception:
+                pass
+
+
+_pools: Dict[str, _Pool] = {}
+
+
+def pool(path: str) -> _Pool:
+    p = _pools.get(path)
+    if p is None:
+        p = _pools[path] = _Pool(path, DB_POOL_SIZE)
+    return p
+
+
+def connect(path: str) -> "AsyncIterator[aiosqlite.Connection]":
+    """``async with connect(path) as db`` — соединение из пула файла ``path``."""
+    return pool(path).acquire()
+
+
+async def fan_out(
+    fn: Callable[[str], Awaitable[Sequence[Any]]],
+    paths: Sequence[str],
+) -> List[Any]:
+    """Выполнить ``fn(path)`` на всех ``paths`` параллельно и склеить списки."""
+    results = await asyncio.gather(*(fn(p) for p in paths), return_exceptions=True)
+    out: List[Any] = []
+    for path, res in zip(paths, results):
+        if isinstance(res, BaseException):
+            log.warning("db fan-out failed on %s: %s", path, res)
+            continue
+        out.extend(res)
+    return out
+
+
+async def close_all() -> None:
+    pools = list(_pools.values())
+    _pools.clear()
+    for p in pools:
+        await p.close()
@@ -0,0 +1,189 @@
+# shared/db/state.py
+"""Shared key-value state for running several uvicorn workers.
+
+Small pieces of coordination state (donate cancellation flags, relay
+streak fallback) used to live in process memory, so ``--workers N`` broke
+them.  They now go through :func:`get_state`, which returns one of:
+
+* ``SQLiteState`` (default, ``STATE_BACKEND=sqlite``) — the ``shared_state``
+  table in the bot's DB.  Enough for all workers on one host.
+* ``RedisState`` (``STATE_BACKEND=redis``) — adapter for a local key-value
+  server (Redis/Valkey/KeyDB) at ``STATE_REDIS_URL``; needs the optional
+  ``redis`` package (``pip install redis``).  Keys are prefixed with the
+  bot id.  Use together with ``FSM_STORAGE=redis`` to move FSM state there too.
+* ``MemoryState`` (``STATE_BACKEND=memory``) — process-local, single worker only.
+
+Values are strings; ``ttl`` is in seconds.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from . import repo
+
+log = logging.getLogger("juicyfox.db.state")
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite").strip().lower()
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://127.0.0.1:6379/0")
+STATE_PURGE_INTERVAL = 600
+
+
+class SharedState:
+    """Interface of the shared key-value store."""
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str, ttl: Optional[int] = None) -> int:
+        """Atomically increment an integer value (missing/expired → 0) and return it."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        return None
+
+
+class MemoryState(SharedState):
+    def __init__(self) -> None:
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.time():
+            del self._data[key]
+            return None
+        return item[0]
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self._data[key] = (str(value), time.time() + ttl if ttl else None)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def incr(self, key: str, ttl: Optional[int] = None) -> int:
+        value = int(self._live(key) or 0) + 1
+        await self.set(key, str(value), ttl)
+        return value
+
+
+class SQLiteState(SharedState):
+    """``shared_state`` table; every worker on the host sees the same rows."""
+
+    def __init__(self) -> None:
+        self._last_purge = 0.0
+
+    async def get(self, key: str) -> Optional[str]:
+        async with repo._db() as db:
+            cur = await db.execute(
+                "SELECT value FROM shared_state WHERE key=? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, int(time.time())),
+            )
+            row = await cur.fetchone()
+        return row[0] if row else None
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        now = int(time.time())
+        async with repo._db() as db:
+            await db.execute(
+                "INSERT INTO shared_state(key, value, expires_at) VALUES (?,?,?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at",
+                (key, str(value), now + ttl if ttl else None),
+            )
+            await self._maybe_purge(db, now)
+            await db.commit()
+
+    async def delete(self, key: str) -> None:
+        async with repo._db() as db:
+            await db.execute("DELETE FROM shared_state WHERE key=?", (key,))
+            await db.commit()
+
+    async def incr(self, key: str, ttl: Optional[int] = None) -> int:
+        now = int(time.time())
+        async with repo._db() as db:
+            cur = await db.execute(
+                "INSERT INTO shared_state(key, value, expires_at) VALUES (?, '1', ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "value = CAST(CASE WHEN shared_state.expires_at IS NOT NULL AND shared_state.expires_at <= ? "
+                "THEN 0 ELSE CAST(shared_state.value AS INTEGER) END + 1 AS TEXT), "
+                "expires_at = excluded.expires_at "
+                "RETURNING value",
+                (key, now + ttl if ttl else None, now),
+            )
+            row = await cur.fetchone()
+            await db.commit()
+        return int(row[0])
+
+    async def _maybe_purge(self, db, now: int) -> None:
+        if time.monotonic() - self._last_purge < STATE_PURGE_INTERVAL:
+            return
+        self._last_purge = time.monotonic()
+        await db.execute("DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+
+class RedisState(SharedState):
+    """Adapter for a local Redis-compatible server (optional ``redis`` package)."""
+
+    def __init__(self, url: str = STATE_REDIS_URL) -> None:
+        import redis.asyncio as aioredis  # type: ignore
+
+        self._redis = aioredis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def _key(key: str) -> str:
+        from shared.config.env import current_config
+
+        return f"juicyfox:{current_config().bot_id}:{key}"
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._redis.get(self._key(key))
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        await self._redis.set(self._key(key), str(value), ex=ttl or None)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self._key(key))
+
+    async def incr(self, key: str, ttl: Optional[int] = None) -> int:
+        k = self._key(key)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.incr(k)
+            if ttl:
+                pipe.expire(k, ttl)
+            value, *_ = await pipe.execute()
+        return int(value)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+_state: Optional[SharedState] = None
+
+
+def get_state() -> SharedState:
+    """Process-wide shared state backend selected by ``STATE_BACKEND``."""
+    global _state
+    if _state is None:
+        if STATE_BACKEND == "redis":
+            try:
+                _state = RedisState()
+            except Exception as e:
+                log.error("state: redis backend unavailable (%s), falling back to sqlite", e)
+                _state = SQLiteState()
+        elif STATE_BACKEND == "memory":
+            _state = MemoryState()
+        else:
+            _state = SQLiteState()
+    return _state
@@ -21,7 +21,7 @@ from __future__ import annotations
 
 from contextlib import suppress
 
-__all__ = ["logging", "time", "idempotency", "metrics", "telegram"]
+__all__ = ["logging", "time", "idempotency", "metrics", "telegram", "media"]
 
 # Attempt to import submodules.  Failures are suppressed to allow
 # optional dependencies (e.g. prometheus_client) to be absent.
@@ -35,3 +35,5 @@ with suppress(Exception):
     from . import metrics  # type: ignore  # noqa: F401
 with suppress(Exception):
     from . import telegram  # type: ignore  # noqa: F401
+with suppress(Exception):
+    from . import media  # type: ignore  # noqa: F401
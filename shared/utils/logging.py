@@ -1,4 +1,4 @@
-"""Logging utilities for JuicyFox (Plan A).
+"""Logging utilities for JuicyFox (Plan A).
 
 This module provides helper functions to configure Python's logging
 module with a consistent format and to enrich log records with
@@ -8,6 +8,23 @@ contextual data (bot ID, module name, correlation ID).  Using
 The ``setup_logging()`` function configures the root logger based on the
 ``LOGLEVEL`` environment variable and reconfigures logging on repeated calls.
 
+Records emitted while an update is handled also get ``bot_id`` (from
+``shared.config.env.current_config``) and ``corr_id`` (see
+``bind_corr_id``) automatically, so plain ``logging.getLogger`` loggers
+carry them too.
+
+By default the root logger only enqueues records (``QueueHandler``); a
+listener thread formats and writes them, so file and stream I/O never
+run on the event loop.  Environment knobs:
+
+* ``LOG_FORMAT`` — ``text`` (default) or ``json`` (one JSON object per line).
+* ``LOG_ASYNC`` — ``1`` (default) queue + listener thread, ``0`` write inline.
+* ``LOG_TO_FILE`` / ``LOG_FILE_PATH`` — also write to a file, rotated at
+  ``LOG_ROTATE_BYTES`` bytes and/or ``LOG_ROTATE_WHEN`` (``midnight``,
+  ``H``, ``D`` …), keeping ``LOG_BACKUPS`` old files.
+* ``LOG_SAMPLE`` — per-logger sampling of records below WARNING, e.g.
+  ``juicyfox.db=0.1,juicyfox.app=0.05`` keeps 10% / 5% of their INFO/DEBUG.
+
 Example::
 
     from shared.utils.logging import setup_logging, get_logger
@@ -19,33 +36,242 @@ Example::
 
 from __future__ import annotations
 
+import atexit
+import json
 import os
 import logging
-from typing import Optional
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+TEXT_FORMAT = "%(asctime)s | %(bot_id)s | %(mod_name)s | %(corr_id)s | %(levelname)s | %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_corr_id: ContextVar[Optional[str]] = ContextVar("juicyfox_corr_id", default=None)
+_listener: Optional[QueueListener] = None
+
+
+def bind_corr_id(corr_id: Optional[str]):
+    """Bind a correlation ID to the current context; returns a token for ``reset_corr_id``."""
+    return _corr_id.set(corr_id)
+
+
+def reset_corr_id(token) -> None:
+    _corr_id.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """Fill ``bot_id``/``mod_name``/``corr_id`` from the current context.
+
+    Runs in the emitting thread (context variables are not visible to the
+    listener thread); values set via ``extra`` take precedence.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "bot_id"):
+            bot_id = "-"
+            try:
+                from shared.config.env import current_config
+
+                bot_id = current_config().bot_id or "-"
+            except Exception:
+                pass
+            record.bot_id = bot_id
+        if not hasattr(record, "mod_name"):
+            record.mod_name = record.name
+        if not hasattr(record, "corr_id"):
+            record.corr_id = _corr_id.get() or "-"
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    """Keep only a fraction of records below WARNING for selected loggers."""
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        # длинные префиксы первыми: juicyfox.db.router важнее juicyfox.db
+        self.rates = sorted(rates.items(), key=lambda kv: -len(kv[0]))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return rate >= 1.0 or random.random() < rate
+        return True
+
+
+def parse_sample_rates(raw: Optional[str]) -> Dict[str, float]:
+    """``"juicyfox.db=0.1,juicyfox.app=0.05"`` → ``{"juicyfox.db": 0.1, ...}``."""
+    rates: Dict[str, float] = {}
+    for part in (raw or "").replace(";", ",").split(","):
+        name, sep, value = part.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, bot_id, corr_id, msg (+ exc)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "time": time.strftime(DATE_FORMAT, time.localtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "bot_id": getattr(record, "bot_id", "-"),
+            "mod_name": getattr(record, "mod_name", record.name),
+            "corr_id": getattr(record, "corr_id", "-"),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
 
 
-def setup_logging(level: Optional[str] = None) -> None:
+class SizeTimeRotatingFileHandler(RotatingFileHandler):
+    """``RotatingFileHandler`` that also rolls over on a time schedule.
+
+    Old files are numbered (``bot.log.1`` … ``bot.log.N``) for both
+    triggers, so size and time rollovers never collide.
+    """
+
+    _PERIODS = {"S": 1, "M": 60, "H": 3600, "D": 86400, "MIDNIGHT": 86400}
+
+    def __init__(self, filename: str, *, max_bytes: int = 0, when: str = "", backup_count: int = 5) -> None:
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.when = (when or "").strip().upper()
+        self.rollover_at = self._next_rollover(time.time()) if self.when in self._PERIODS else None
+
+    def _next_rollover(self, now: float) -> float:
+        if self.when == "MIDNIGHT":
+            t = time.localtime(now)
+            return time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+        period = self._PERIODS[self.when]
+        return (now // period + 1) * period
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rollover_at is not None and record.created >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        if self.rollover_at is not None:
+            self.rollover_at = self._next_rollover(time.time())
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock ``prepare()`` formats the message in the caller (the event
+    loop).  Here only records whose arguments could change after the call
+    (dicts, objects…) are rendered eagerly; the rest travel as is.
+    """
+
+    _SAFE = (str, int, float, bool, type(None), bytes)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(a, self._SAFE) for a in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+@atexit.register
+def _stop_listener() -> None:
+    """Stop the listener thread after it has written everything queued."""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() not in {"0", "false", "no", "off", ""}
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    *,
+    fmt: Optional[str] = None,
+    use_queue: Optional[bool] = None,
+    file_path: Optional[str] = None,
+    sample: Optional[Dict[str, float]] = None,
+) -> None:
     """Configure the root logger with a standard format.
 
     If ``level`` is not provided, it is taken from the ``LOGLEVEL``
     environment variable, defaulting to ``INFO``.  The log format
     includes placeholders for ``asctime`` (timestamp), ``bot_id``,
     ``mod_name``, ``corr_id``, ``levelname`` and ``message``.  If a log
-    record does not have one of these attributes, a hyphen ``-`` is
-    substituted.  The ``force=True`` parameter reinitializes logging
-    configuration if called multiple times.
+    record does not have one of these attributes, the context filter
+    fills it in (``-`` when unknown).  Repeated calls replace the
+    previous configuration (and stop the previous listener thread).
+
+    ``fmt`` (``text``/``json``), ``use_queue``, ``file_path`` and
+    ``sample`` override ``LOG_FORMAT``, ``LOG_ASYNC``, ``LOG_TO_FILE`` +
+    ``LOG_FILE_PATH`` and ``LOG_SAMPLE`` respectively.
     """
-    lvl = level or os.getenv("LOGLEVEL", "INFO").upper()
-    logging.basicConfig(
-        level=lvl,
-        format=(
-            "%(asctime)s | %(bot_id)s | %(mod_name)s | %(corr_id)s | "
-            "%(levelname)s | %(message)s"
-        ),
-        datefmt="%Y-%m-%d %H:%M:%S",
-        # Force reconfiguration on repeated calls (Python 3.8+)
-        force=True,
+    global _listener
+    lvl = (level or os.getenv("LOGLEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "text")).strip().lower()
+    use_queue = _env_flag("LOG_ASYNC", "1") if use_queue is None else use_queue
+    if file_path is None and _env_flag("LOG_TO_FILE", "0"):
+        file_path = os.getenv("LOG_FILE_PATH", "/app/logs/bot.log")
+    sample = parse_sample_rates(os.getenv("LOG_SAMPLE")) if sample is None else sample
+
+    formatter: logging.Formatter = (
+        JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
     )
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if file_path:
+        handlers.append(
+            SizeTimeRotatingFileHandler(
+                file_path,
+                max_bytes=int(os.getenv("LOG_ROTATE_BYTES", str(50 * 1024 * 1024))),
+                when=os.getenv("LOG_ROTATE_WHEN", ""),
+                backup_count=int(os.getenv("LOG_BACKUPS", "5")),
+            )
+        )
+    for h in handlers:
+        h.setFormatter(formatter)
+
+    _stop_listener()
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+        h.close()
+    root.setLevel(lvl)
+
+    if use_queue:
+        q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        front: logging.Handler = _DeferredQueueHandler(q)
+        _listener = QueueListener(q, *handlers, respect_handler_level=True)
+        _listener.start()
+        roots = [front]
+    else:
+        roots = handlers
+    for h in roots:
+        # фильтры — в потоке вызова: там видны contextvars, а отброшенное не попадает в очередь
+        if sample:
+            h.addFilter(_SamplingFilter(sample))
+        h.addFilter(_ContextFilter())
+        root.addHandler(h)
 
 
 class _ContextAdapter(logging.LoggerAdapter):
@@ -0,0 +1,154 @@
+"""Telegram ``file_id`` registry for local media assets.
+
+Sending ``FSInputFile(path)`` re-uploads the file on every call.  This
+module uploads each local asset once per bot, remembers the ``file_id``
+returned by Telegram (keyed by bot and SHA-256 of the file content, stored
+in the ``media_cache`` table) and sends by ``file_id`` afterwards.  The
+asset is re-uploaded only when its content changes (new hash) or Telegram
+rejects the stored id.
+
+Example::
+
+    from shared.utils.media import send_local_media
+
+    await send_local_media(message.bot, message.answer_photo, START_PHOTO,
+                           caption="hi", logger=log)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Set, Tuple, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+from shared.db import repo
+from shared.utils.telegram import send_with_retry
+
+log = logging.getLogger("juicyfox.media")
+
+PathLike = Union[str, Path]
+
+# path -> (mtime_ns, size, sha256): повторно хешируем только изменённые файлы
+_digests: Dict[str, Tuple[int, int, str]] = {}
+# (bot_id, sha256, kind) -> file_id
+_file_ids: Dict[Tuple[str, str, str], str] = {}
+_loaded_bots: Set[str] = set()
+
+
+def file_digest(path: PathLike) -> str:
+    """Return SHA-256 of ``path``; cached until the file's mtime/size change."""
+    p = str(path)
+    st = os.stat(p)
+    cached = _digests.get(p)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    _digests[p] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+async def _digest(path: PathLike) -> str:
+    p = str(path)
+    cached = _digests.get(p)
+    if cached:
+        try:
+            st = os.stat(p)
+            if cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                return cached[2]
+        except OSError:
+            pass
+    return await asyncio.to_thread(file_digest, p)
+
+
+async def preload(bot_id: Any, paths: Optional[Iterable[PathLike]] = None) -> None:
+    """Warm the caches: load stored ids for ``bot_id`` and hash ``paths``.
+
+    ``paths`` defaults to every asset in ``modules.constants.paths.LOCAL_ASSETS``.
+    """
+    await _ensure_loaded(str(bot_id))
+    if paths is None:
+        from modules.constants.paths import LOCAL_ASSETS
+
+        paths = LOCAL_ASSETS.values()
+    for p in paths:
+        if Path(p).exists():
+            await _digest(p)
+
+
+async def _ensure_loaded(bot_id: str) -> None:
+    if bot_id in _loaded_bots:
+        return
+    try:
+        stored = await repo.get_media_file_ids(bot_id)
+    except Exception as e:
+        log.warning("media: cannot load file_id cache for bot %s: %s", bot_id, e)
+        return
+    for (sha, kind), file_id in stored.items():
+        _file_ids[(bot_id, sha, kind)] = file_id
+    _loaded_bots.add(bot_id)
+
+
+def _extract_file_id(result: Any, kind: str) -> Optional[str]:
+    media = getattr(result, kind, None)
+    if isinstance(media, list):  # photo: список размеров
+        media = media[-1] if media else None
+    return getattr(media, "file_id", None)
+
+
+async def send_local_media(
+    bot: Any,
+    method: Any,
+    path: PathLike,
+    *args: Any,
+    kind: str = "photo",
+    logger: Optional[logging.Logger] = None,
+    **kwargs: Any,
+) -> Any:
+    """Send local ``path`` through ``method`` using a cached ``file_id``.
+
+    :param bot: Bot that performs the upload (``file_id`` is per bot).
+    :param method: Bound sender whose first argument is the media, e.g.
+        ``message.answer_photo`` or ``bot.send_photo`` (pass ``chat_id`` as
+        keyword in that case).
+    :param kind: Attribute of the resulting ``Message`` carrying the media
+        (``photo``, ``animation``, ``video``, ``document``).
+    """
+    bot_id = str(getattr(bot, "id", bot))
+    await _ensure_loaded(bot_id)
+    sha = await _digest(path)
+    key = (bot_id, sha, kind)
+
+    file_id = _file_ids.get(key)
+    if file_id:
+        try:
+            return await send_with_retry(method, file_id, *args, logger=logger, **kwargs)
+        except TelegramBadRequest as e:
+            if "file" not in str(e).lower():
+                raise
+            log.warning("media: file_id rejected for %s (%s), re-uploading", path, e)
+            _file_ids.pop(key, None)
+            try:
+                await repo.delete_media_file_id(bot_id, sha, kind)
+            except Exception:
+                pass
+
+    result = await send_with_retry(method, FSInputFile(path), *args, logger=logger, **kwargs)
+    new_id = _extract_file_id(result, kind)
+    if new_id:
+        _file_ids[key] = new_id
+        try:
+            await repo.save_media_file_id(bot_id, sha, kind, str(path), new_id)
+        except Exception as e:
+            log.warning("media: cannot persist file_id for %s: %s", path, e)
+        log.info("media: uploaded %s for bot %s", path, bot_id)
+    return result
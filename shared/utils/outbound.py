@@ -0,0 +1,250 @@
+# shared/utils/outbound.py
+"""Outbound Telegram gateway shared by the bot and the workers.
+
+The bot process, ``modules/posting/worker`` and ``worker/mailing_worker``
+all send with the same bot token, but used to know nothing about each
+other: a big broadcast could push the token into 429s and delay payment
+confirmations.  :class:`OutboundMiddleware` (installed on each process'
+bot session via :func:`install_outbound`) takes a token from one bucket
+per bot before every chat-bound API call.  The bucket lives in a small
+SQLite file (``OUTBOUND_DB_PATH``) that all processes on the host share,
+so the budget (``OUTBOUND_RATE`` calls/s, burst ``OUTBOUND_BURST``) is
+global per bot token.
+
+Priority lanes, set with :func:`outbound_lane` / :func:`in_lane` (otherwise
+the session default: ``interactive`` in the bot, ``bulk`` in the workers):
+
+* ``transactional`` — payment confirmations, invite links: may take the
+  last token;
+* ``interactive`` — replies to users: leaves ``OUTBOUND_RESERVE_INTERACTIVE``
+  tokens for transactional;
+* ``bulk`` — broadcasts, scheduled posts, reminders: leaves
+  ``OUTBOUND_RESERVE_BULK`` tokens.
+
+Bulk never drains the bucket below its reserve, so a transactional send
+finds a token at once instead of queueing behind a broadcast.  A bot-wide
+429 empties the shared bucket for ``retry_after`` seconds, pausing every
+process.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+try:
+    from aiogram.exceptions import TelegramRetryAfter
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+except Exception:  # pragma: no cover - fallback when aiogram is unavailable
+    class TelegramRetryAfter(Exception):  # type: ignore[no-redef]
+        retry_after = 0
+
+    BaseRequestMiddleware = object  # type: ignore[assignment,misc]
+
+from shared.utils.metrics import Counter, Histogram
+
+log = logging.getLogger("juicyfox.outbound")
+
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "25"))  # вызовов в секунду на бота; 0 — без лимита
+OUTBOUND_BURST = float(os.getenv("OUTBOUND_BURST", "30"))
+# 429 с retry_after не меньше этого — лимит всего бота, а не одного чата
+OUTBOUND_GLOBAL_FLOOD = float(os.getenv("OUTBOUND_GLOBAL_FLOOD", "10"))
+OUTBOUND_DB_PATH = os.getenv("OUTBOUND_DB_PATH") or os.path.join(
+    os.path.dirname(os.getenv("DB_PATH", "/app/data/juicyfox.sqlite")), "outbound.sqlite"
+)
+
+TRANSACTIONAL = "transactional"
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+LANE_RESERVE: Dict[str, float] = {
+    TRANSACTIONAL: 0.0,
+    INTERACTIVE: float(os.getenv("OUTBOUND_RESERVE_INTERACTIVE", "5")),
+    BULK: float(os.getenv("OUTBOUND_RESERVE_BULK", "15")),
+}
+
+OUTBOUND_WAIT = Histogram(
+    "juicyfox_outbound_wait_seconds",
+    "Time spent waiting for the shared outbound token budget, by lane",
+    ["lane"],
+    buckets=(0.005, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 15),
+)
+OUTBOUND_CALLS = Counter("juicyfox_outbound_calls_total", "Chat-bound Telegram calls by lane", ["lane"])
+
+_lane: ContextVar[Optional[str]] = ContextVar("juicyfox_outbound_lane", default=None)
+
+T = TypeVar("T")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbound_budget (
+    bot_key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    ts REAL NOT NULL
+);
+"""
+
+
+@contextmanager
+def outbound_lane(lane: str) -> Iterator[None]:
+    """``with outbound_lane(BULK): ...`` — calls inside use the given lane."""
+    if lane not in LANE_RESERVE:
+        raise ValueError(f"unknown outbound lane {lane!r}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def in_lane(lane: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Декоратор корутины: все её вызовы Telegram идут в ``lane``."""
+
+    def deco(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            with outbound_lane(lane):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+def current_lane(default: str = INTERACTIVE) -> str:
+    return _lane.get() or default
+
+
+class SQLiteTokenBucket:
+    """Token bucket per bot stored in one row; every take is one atomic UPDATE."""
+
+    def __init__(self, path: str, rate: float, burst: float) -> None:
+        self.path = path
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._ready = False
+
+    async def _ensure(self, db) -> None:
+        if not self._ready:
+            await db.execute(_SCHEMA)
+            await db.commit()
+            self._ready = True
+
+    async def take(self, key: str, reserve: float) -> float:
+        """Take one token if ``reserve`` more would remain; else seconds to wait."""
+        from shared.db import router
+
+        now = time.time()
+        need = 1.0 + reserve
+        async with router.connect(self.path) as db:
+            await self._ensure(db)
+            await db.execute(
+                "INSERT OR IGNORE INTO outbound_budget(bot_key, tokens, ts) VALUES (?,?,?)",
+                (key, self.burst, now),
+            )
+            # refill = MIN(burst, tokens + (now - ts) * rate), считается в том же UPDATE
+            cur = await db.execute(
+                "UPDATE outbound_budget SET tokens = MIN(?, tokens + MAX(0, ? - ts) * ?) - 1, ts = MAX(ts, ?) "
+                "WHERE bot_key=? AND MIN(?, tokens + MAX(0, ? - ts) * ?) >= ? RETURNING tokens",
+                (self.burst, now, self.rate, now, key, self.burst, now, self.rate, need),
+            )
+            row = await cur.fetchone()
+            if row is None:
+                cur = await db.execute(
+                    "SELECT MIN(?, tokens + MAX(0, ? - ts) * ?) FROM outbound_budget WHERE bot_key=?",
+                    (self.burst, now, self.rate, key),
+                )
+                have = (await cur.fetchone())[0]
+            await db.commit()
+        if row is not None:
+            return 0.0
+        return max(0.001, (need - float(have)) / self.rate)
+
+    async def drain(self, key: str, seconds: float) -> None:
+        """Bot-wide flood wait: nothing for ``seconds`` in any process."""
+        from shared.db import router
+
+        async with router.connect(self.path) as db:
+            await self._ensure(db)
+            await db.execute(
+                "UPDATE outbound_budget SET tokens = MIN(tokens, ?), ts = ? WHERE bot_key=?",
+                (-seconds * self.rate, time.time(), key),
+            )
+            await db.commit()
+
+
+_bucket: Optional[SQLiteTokenBucket] = None
+
+
+def get_bucket() -> Optional[SQLiteTokenBucket]:
+    global _bucket
+    if OUTBOUND_RATE <= 0:
+        return None
+    if _bucket is None:
+        _bucket = SQLiteTokenBucket(OUTBOUND_DB_PATH, OUTBOUND_RATE, OUTBOUND_BURST)
+    return _bucket
+
+
+async def acquire(bot_key: Any, lane: Optional[str] = None) -> float:
+    """Wait for a token of ``bot_key``'s budget in ``lane``; returns the time waited."""
+    bucket = get_bucket()
+    lane = lane or current_lane()
+    OUTBOUND_CALLS.labels(lane=lane).inc()
+    if bucket is None:
+        return 0.0
+    started = time.monotonic()
+    reserve = LANE_RESERVE.get(lane, LANE_RESERVE[INTERACTIVE])
+    while True:
+        try:
+            wait = await bucket.take(str(bot_key), reserve)
+        except Exception as e:
+            # недоступный файл бюджета не должен останавливать отправку
+            log.warning("outbound: budget unavailable, sending unthrottled: %s", e)
+            wait = 0.0
+        if wait <= 0:
+            break
+        # джиттер: процессы не просыпаются одновременно
+        await asyncio.sleep(wait * (1 + random.random() * 0.2))
+    waited = time.monotonic() - started
+    OUTBOUND_WAIT.labels(lane=lane).observe(waited)
+    return waited
+
+
+class OutboundMiddleware(BaseRequestMiddleware):  # type: ignore[misc,valid-type]
+    """Bot session middleware: take a shared token before chat-bound calls."""
+
+    def __init__(self, lane: str = INTERACTIVE) -> None:
+        self.lane = lane
+
+    async def __call__(self, make_request, bot, method):  # type: ignore[override]
+        if getattr(method, "chat_id", None) is None:
+            return await make_request(bot, method)  # getMe, answerCallbackQuery… — вне бюджета
+        key = bot.id
+        await acquire(key, current_lane(self.lane))
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as err:
+            # Telegram не говорит, чей это лимит; долгий flood wait считаем общим для бота
+            if float(err.retry_after or 0) >= OUTBOUND_GLOBAL_FLOOD:
+                bucket = get_bucket()
+                if bucket is not None:
+                    await bucket.drain(str(key), float(err.retry_after))
+            raise
+
+
+def install_outbound(session: Any, lane: str = INTERACTIVE) -> None:
+    """Register :class:`OutboundMiddleware` on an aiogram session (idempotent).
+
+    ``lane`` — lane for calls made outside :func:`outbound_lane`.
+    """
+    middlewares = getattr(session, "middleware", None)
+    if middlewares is None:
+        return
+    if any(isinstance(m, OutboundMiddleware) for m in getattr(middlewares, "_middlewares", [])):
+        return
+    session.middleware(OutboundMiddleware(lane))
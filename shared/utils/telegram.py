@@ -1,18 +1,54 @@
-"""Telegram helper utilities for JuicyFox bots."""
+"""Telegram helper utilities for JuicyFox bots.
+
+Flood-wait handling (``RetryAfter`` / HTTP 429):
+
+* :data:`cooldowns` — process-wide registry of per-chat and per-bot
+  (global) cooldowns.  :class:`CooldownMiddleware`, installed on every bot
+  session via :func:`install_cooldowns`, checks it before *each* API call
+  and records every 429, so one flood wait pauses all coroutines talking to
+  that chat instead of letting them hammer it.
+* :func:`send_with_retry` retries network errors and 429s (sleeping
+  ``retry_after``), but only while the shared :data:`retry_budget` allows:
+  retries may not exceed ``TELEGRAM_RETRY_BUDGET`` of the call volume.
+
+Bots are built with :func:`make_bot`: one tuned :class:`TunedSession` per
+process (connection pool, keep-alive, optional local Bot API server,
+per-method timeouts) with the cooldown and outbound middlewares installed.
+"""
 from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Any, Awaitable, Callable, Optional, TypeVar
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
 
 try:
-    from aiogram.exceptions import TelegramNetworkError
+    from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
 except Exception:  # pragma: no cover - fallback when aiogram is unavailable
     class TelegramNetworkError(Exception):
         """Fallback Telegram network error used when aiogram is missing."""
 
         pass
 
+    class TelegramRetryAfter(Exception):  # type: ignore[no-redef]
+        """Fallback flood-wait error used when aiogram is missing."""
+
+        retry_after = 0
+
+try:
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+except Exception:  # pragma: no cover - fallback when aiogram is unavailable
+    BaseRequestMiddleware = object  # type: ignore[assignment,misc]
+
+try:
+    from aiogram.client.session.aiohttp import AiohttpSession
+except Exception:  # pragma: no cover - fallback when aiogram is unavailable
+    AiohttpSession = object  # type: ignore[assignment,misc]
+
+from shared.utils.metrics import Counter
+
 try:
     from shared.config import config
 except Exception:  # pragma: no cover - configuration may be unavailable during import
@@ -28,6 +64,141 @@ def _qualname(func: Callable[..., Any]) -> str:
     return getattr(func, "__qualname__", repr(func))
 
 
+# REGION AI: flood-wait cooldowns and retry budget
+TELEGRAM_MAX_RETRY_AFTER = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "30"))
+TELEGRAM_COOLDOWN_MAX_WAIT = float(os.getenv("TELEGRAM_COOLDOWN_MAX_WAIT", "10"))
+TELEGRAM_RETRY_BUDGET = float(os.getenv("TELEGRAM_RETRY_BUDGET", "0.1"))
+TELEGRAM_RETRY_MIN_RATE = float(os.getenv("TELEGRAM_RETRY_MIN_RATE", "1"))
+
+TELEGRAM_RETRIES = Counter(
+    "juicyfox_telegram_retries_total",
+    "send_with_retry retries by reason (network, retry_after) and result (retried, denied)",
+    ["reason", "result"],
+)
+TELEGRAM_FLOOD_WAITS = Counter(
+    "juicyfox_telegram_flood_waits_total",
+    "RetryAfter responses recorded in the cooldown registry, by scope",
+    ["scope"],
+)
+
+_Key = Tuple[Any, Any]
+
+
+class CooldownRegistry:
+    """Per-chat and global (per-bot) "do not call before" deadlines.
+
+    Keys are ``(bot_id, chat_id)``; ``chat_id=None`` is the bot-wide
+    cooldown that applies to every chat.  Deadlines use ``time.monotonic``.
+    """
+
+    _PURGE_AT = 10_000
+
+    def __init__(self) -> None:
+        self._until: Dict[_Key, float] = {}
+
+    def remaining(self, bot_id: Any, chat_id: Any = None) -> float:
+        now = time.monotonic()
+        until = self._until.get((bot_id, None), 0.0)
+        if chat_id is not None:
+            until = max(until, self._until.get((bot_id, chat_id), 0.0))
+        return max(0.0, until - now)
+
+    def set(self, bot_id: Any, chat_id: Any, seconds: float) -> None:
+        key = (bot_id, chat_id)
+        until = time.monotonic() + max(0.0, float(seconds))
+        if until > self._until.get(key, 0.0):
+            self._until[key] = until
+        if len(self._until) > self._PURGE_AT:
+            now = time.monotonic()
+            self._until = {k: v for k, v in self._until.items() if v > now}
+
+    async def wait(self, bot_id: Any, chat_id: Any = None, max_wait: Optional[float] = None) -> float:
+        """Sleep out the cooldown; returns what is left if it exceeds ``max_wait``."""
+        left = self.remaining(bot_id, chat_id)
+        if left <= 0:
+            return 0.0
+        if max_wait is not None and left > max_wait:
+            return left
+        await asyncio.sleep(left)
+        return 0.0
+
+
+class RetryBudget:
+    """Retries may spend at most ``ratio`` of the call volume.
+
+    Each first attempt deposits ``ratio`` tokens, each retry costs one; a
+    floor of ``min_per_sec`` tokens per second keeps low-traffic bots able
+    to retry at all.  Tokens are capped so a quiet hour cannot fund a storm.
+    """
+
+    def __init__(self, ratio: float, min_per_sec: float, cap: float = 10.0) -> None:
+        self.ratio = max(0.0, ratio)
+        self.min_per_sec = max(0.0, min_per_sec)
+        self.cap = cap
+        self.tokens = cap
+        self._stamp = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.cap, self.tokens + (now - self._stamp) * self.min_per_sec)
+        self._stamp = now
+
+    def on_call(self) -> None:
+        self._refill()
+        self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def try_retry(self) -> bool:
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+cooldowns = CooldownRegistry()
+retry_budget = RetryBudget(TELEGRAM_RETRY_BUDGET, TELEGRAM_RETRY_MIN_RATE)
+
+
+def _bot_key(bot: Any) -> Any:
+    try:
+        return bot.id
+    except Exception:
+        return id(bot)
+
+
+class CooldownMiddleware(BaseRequestMiddleware):  # type: ignore[misc,valid-type]
+    """Bot session middleware: honour and record flood waits for every API call.
+
+    A call to a chat under cooldown waits it out (up to
+    ``TELEGRAM_COOLDOWN_MAX_WAIT``); a longer cooldown fails immediately with
+    ``TelegramRetryAfter`` without reaching Telegram.
+    """
+
+    async def __call__(self, make_request, bot, method):  # type: ignore[override]
+        key = _bot_key(bot)
+        chat_id = getattr(method, "chat_id", None)
+        left = await cooldowns.wait(key, chat_id, TELEGRAM_COOLDOWN_MAX_WAIT)
+        if left:
+            raise TelegramRetryAfter(method=method, message="local flood-wait cooldown", retry_after=math.ceil(left))
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as err:
+            cooldowns.set(key, chat_id, err.retry_after)
+            TELEGRAM_FLOOD_WAITS.labels(scope="global" if chat_id is None else "chat").inc()
+            raise
+
+
+def install_cooldowns(session: Any) -> None:
+    """Register :class:`CooldownMiddleware` on an aiogram session (idempotent)."""
+    middlewares = getattr(session, "middleware", None)
+    if middlewares is None:
+        return
+    if any(isinstance(m, CooldownMiddleware) for m in getattr(middlewares, "_middlewares", [])):
+        return
+    session.middleware(CooldownMiddleware())
+# END REGION AI
+
+
 async def send_with_retry(
     func: AsyncCall[T],
     *args: Any,
@@ -36,7 +207,12 @@ async def send_with_retry(
     logger: Optional[logging.Logger] = None,
     **kwargs: Any,
 ) -> T:
-    """Execute ``func`` with retries on :class:`TelegramNetworkError`.
+    """Execute ``func`` with retries on network errors and flood waits.
+
+    ``TelegramNetworkError`` is retried with exponential backoff;
+    ``TelegramRetryAfter`` sleeps the ``retry_after`` Telegram asked for
+    (up to ``TELEGRAM_MAX_RETRY_AFTER`` seconds, longer waits re-raise).
+    Both kinds of retry draw from the shared :data:`retry_budget`.
 
     Parameters
     ----------
@@ -56,9 +232,10 @@ async def send_with_retry(
 
     Returns
     -------
-    The result of ``func`` on success.  If all retries fail with a
-    ``TelegramNetworkError`` the exception is re-raised, preserving previous
-    behaviour of direct Telegram API calls.
+    The result of ``func`` on success.  If all retries fail (or the retry
+    budget is exhausted) the last ``TelegramNetworkError`` /
+    ``TelegramRetryAfter`` is re-raised, preserving previous behaviour of
+    direct Telegram API calls.
     """
 
     log = logger or logging.getLogger("juicyfox.telegram")
@@ -80,11 +257,38 @@ async def send_with_retry(
     if delay_val < 0:
         delay_val = 0.0
 
-    last_error: Optional[TelegramNetworkError] = None
+    last_error: Optional[Exception] = None
 
+    retry_budget.on_call()
     for attempt_num in range(1, attempts_val + 1):
         try:
             return await func(*args, **kwargs)
+        except TelegramRetryAfter as err:
+            # REGION AI: flood-wait aware retries
+            last_error = err
+            wait = float(err.retry_after)
+            if attempt_num >= attempts_val or wait > TELEGRAM_MAX_RETRY_AFTER:
+                log.warning(
+                    "send_with_retry: %s flood wait %ss, giving up after %s attempts",
+                    _qualname(func),
+                    err.retry_after,
+                    attempt_num,
+                )
+                raise
+            if not retry_budget.try_retry():
+                TELEGRAM_RETRIES.labels(reason="retry_after", result="denied").inc()
+                log.warning("send_with_retry: %s flood wait, retry budget exhausted", _qualname(func))
+                raise
+            TELEGRAM_RETRIES.labels(reason="retry_after", result="retried").inc()
+            log.warning(
+                "send_with_retry: %s flood wait on attempt %s/%s; retrying in %ss",
+                _qualname(func),
+                attempt_num,
+                attempts_val,
+                err.retry_after,
+            )
+            await asyncio.sleep(wait)
+            # END REGION AI
         except TelegramNetworkError as err:
             last_error = err
             if attempt_num >= attempts_val:
@@ -94,6 +298,11 @@ async def send_with_retry(
                     attempts_val,
                 )
                 raise
+            if not retry_budget.try_retry():
+                TELEGRAM_RETRIES.labels(reason="network", result="denied").inc()
+                log.warning("send_with_retry: %s network error, retry budget exhausted", _qualname(func))
+                raise
+            TELEGRAM_RETRIES.labels(reason="network", result="retried").inc()
             sleep_for = delay_val * (2 ** (attempt_num - 1))
             log.warning(
                 "send_with_retry: %s network error on attempt %s/%s; retrying in %.2fs",
@@ -113,3 +322,119 @@ async def send_with_retry(
     if last_error:
         raise last_error
     raise RuntimeError("send_with_retry: execution finished without result")
+
+
+# REGION AI: outbound pacing
+class Pacer:
+    """Space calls so that at most ``rate`` happen per second.
+
+    Shared by background senders (access expiry, renewal reminders) so a
+    large batch is spread out instead of hitting Telegram's flood limits.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        now = time.monotonic()
+        if self._next > now:
+            await asyncio.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+# END REGION AI
+
+
+# REGION AI: bot/session factory
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "").strip()  # напр. http://telegram-bot-api:8081
+TELEGRAM_API_LOCAL = os.getenv("TELEGRAM_API_LOCAL", "0").lower() in {"1", "true", "yes"}
+TELEGRAM_POOL_LIMIT = int(os.getenv("TELEGRAM_POOL_LIMIT", "100"))
+TELEGRAM_KEEPALIVE = float(os.getenv("TELEGRAM_KEEPALIVE", "60"))
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "60"))
+TELEGRAM_METHOD_TIMEOUTS = os.getenv("TELEGRAM_METHOD_TIMEOUTS", "")
+
+
+def parse_method_timeouts(raw: Optional[str]) -> Dict[str, float]:
+    """``"sendMessage=10,sendVideo=120"`` → ``{"sendmessage": 10.0, "sendvideo": 120.0}``."""
+    result: Dict[str, float] = {}
+    for part in (raw or "").split(","):
+        name, sep, value = part.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            result[name.strip().lower()] = float(value)
+        except ValueError:
+            logging.getLogger("juicyfox.telegram").warning("bad TELEGRAM_METHOD_TIMEOUTS entry: %r", part)
+    return result
+
+
+class TunedSession(AiohttpSession):  # type: ignore[misc,valid-type]
+    """``AiohttpSession`` with keep-alive and per-method timeouts.
+
+    A timeout passed to the call (``request_timeout=``) still wins over
+    ``method_timeouts``; methods not listed use the session ``timeout``.
+    """
+
+    def __init__(
+        self,
+        *,
+        limit: int = TELEGRAM_POOL_LIMIT,
+        keepalive: float = TELEGRAM_KEEPALIVE,
+        method_timeouts: Optional[Dict[str, float]] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init["keepalive_timeout"] = keepalive
+        self.method_timeouts = {k.lower(): v for k, v in (method_timeouts or {}).items()}
+
+    async def make_request(self, bot: Any, method: Any, timeout: Optional[int] = None) -> Any:
+        if timeout is None:
+            timeout = self.method_timeouts.get(method.__api_method__.lower())
+        return await super().make_request(bot, method, timeout)
+
+
+def build_session(lane: Optional[str] = None, **overrides: Any) -> TunedSession:
+    """New tuned session with cooldown and outbound middlewares installed.
+
+    ``lane`` — default outbound lane (see :mod:`shared.utils.outbound`);
+    ``overrides`` go to :class:`TunedSession` (``limit``, ``timeout``, ``api``…).
+    """
+    from shared.utils.outbound import INTERACTIVE, install_outbound
+
+    kwargs: Dict[str, Any] = {
+        "timeout": TELEGRAM_TIMEOUT,
+        "method_timeouts": parse_method_timeouts(TELEGRAM_METHOD_TIMEOUTS),
+    }
+    if TELEGRAM_API_SERVER:
+        from aiogram.client.telegram import TelegramAPIServer
+
+        kwargs["api"] = TelegramAPIServer.from_base(TELEGRAM_API_SERVER, is_local=TELEGRAM_API_LOCAL)
+    kwargs.update(overrides)
+    session = TunedSession(**kwargs)
+    install_cooldowns(session)  # до outbound: чат в кулдауне не тратит токен бюджета
+    install_outbound(session, lane or INTERACTIVE)
+    return session
+
+
+_sessions: Dict[Optional[str], TunedSession] = {}
+
+
+def shared_session(lane: Optional[str] = None) -> TunedSession:
+    """Process-wide session per default lane: all bots of the process share its pool."""
+    if lane not in _sessions:
+        _sessions[lane] = build_session(lane)
+    return _sessions[lane]
+
+
+def make_bot(token: str, *, session: Optional[Any] = None, lane: Optional[str] = None, **kwargs: Any) -> Any:
+    """``Bot`` on the shared tuned session (or on ``session``, if given)."""
+    from aiogram import Bot
+
+    return Bot(token=token, session=session or shared_session(lane), **kwargs)
+
+
+async def close_sessions() -> None:
+    """Close the shared sessions (on shutdown)."""
+    for session in list(_sessions.values()):
+        await session.close()
+    _sessions.clear()
+# END REGION AI
@@ -0,0 +1,24 @@
+# tests/conftest.py
+"""Общие фикстуры: временная БД бота и закрытие пулов соединений."""
+import os
+import tempfile
+
+# до импорта модулей бота: конфиг читает TELEGRAM_TOKEN, repo — DB_PATH
+os.environ.setdefault("TELEGRAM_TOKEN", "1:test")
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "juicyfox.sqlite"))
+
+import pytest_asyncio
+
+from shared.db import repo, router
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch):
+    """Пустая БД основного бота в ``tmp_path``; пулы закрываются после теста."""
+    path = str(tmp_path / "juicyfox.sqlite")
+    monkeypatch.setattr(repo, "DB_PATH", path)
+    await repo.init_db()
+    try:
+        yield path
+    finally:
+        await router.close_all()
@@ -0,0 +1,56 @@
+# tests/test_archive_search.py
+"""/search по горячей и архивной истории (shared/db/archive.py)."""
+import time
+
+import pytest
+
+from shared.db import archive, repo
+
+OLD = 1_000_000  # заведомо старше любого RETENTION_DAYS
+
+
+@pytest.fixture
+def archive_file(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DB_PATH", str(tmp_path / "juicyfox_archive.sqlite"))
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH", 2)  # несколько пачек за проход
+
+
+async def _log(user_id: int, text: str, ts: int) -> None:
+    await repo.log_message(user_id, "in", {"type": "text", "text": text, "ts": ts})
+
+
+async def _found(query: str, user_id=None) -> list:
+    return sorted(r["snippet"] for r in await repo.search_messages(query, user_id, limit=50))
+
+
+@pytest.mark.asyncio
+async def test_archived_messages_stay_searchable(archive_file):
+    for i in range(5):
+        await _log(7, f"old invoice {i}", OLD + i)
+    await _log(7, "fresh invoice", int(time.time()))
+    await _log(8, "other invoice", OLD)
+
+    assert await archive.run_retention(1, pause=0) == 6
+    assert len(await _found("invoice")) == 7
+    assert len(await _found("invoice", 7)) == 6
+
+    # повторный проход ничего не дублирует ни в архиве, ни в индексе
+    assert await archive.run_retention(1, pause=0) == 0
+    assert len(await _found("invoice")) == 7
+
+
+@pytest.mark.asyncio
+async def test_archive_written_before_the_index_is_backfilled(archive_file):
+    await _log(9, "legacy receipt", OLD)
+    assert await archive.run_retention(1, pause=0) == 1
+    # архив из версии без индекса: таблицы FTS нет
+    async with repo._db() as conn:
+        await conn.execute("ATTACH DATABASE ? AS archive", (archive.ARCHIVE_DB_PATH,))
+        await conn.execute("DROP TABLE archive.messages_archive_fts")
+        await conn.commit()
+        await conn.execute("DETACH DATABASE archive")
+    assert await _found("receipt") == []
+
+    await _log(9, "newer receipt", OLD + 1)
+    await archive.run_retention(1, pause=0)  # пересоздаёт и заполняет индекс
+    assert len(await _found("receipt")) == 2
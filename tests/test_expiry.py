@@ -0,0 +1,80 @@
+# tests/test_expiry.py
+"""Отзыв истёкших доступов (modules/access/expiry.py): ошибки Telegram разбираются по строкам."""
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import BanChatMember
+
+from modules.access import expiry
+from shared.db import repo
+
+VIP_CHAT = -100500
+
+
+class FakeBot:
+    """ban/unban с заранее заданными ответами: ``errors[user_id]`` — текст TelegramBadRequest."""
+
+    def __init__(self, errors=None) -> None:
+        self.errors = errors or {}
+        self.banned: list = []
+
+    async def ban_chat_member(self, chat_id, user_id, **kwargs):
+        if user_id in self.errors:
+            raise TelegramBadRequest(BanChatMember(chat_id=chat_id, user_id=user_id), self.errors[user_id])
+        self.banned.append(user_id)
+        return True
+
+    async def unban_chat_member(self, chat_id, user_id, **kwargs):
+        return True
+
+
+@pytest.fixture
+def vip_channel(monkeypatch):
+    monkeypatch.setattr(expiry, "current_config", lambda: SimpleNamespace(vip_channel_id=VIP_CHAT))
+    monkeypatch.setattr(expiry, "EXPIRY_RATE", 1000.0)
+
+
+async def _expired(user_id: int, until_ts: int) -> None:
+    async with repo._db() as conn:
+        await conn.execute(
+            "INSERT INTO access_expiry(user_id, scope, until_ts) VALUES (?, 'vip', ?)", (user_id, until_ts)
+        )
+        await conn.commit()
+
+
+async def _pending() -> list:
+    return [r[0] for r in await repo.due_access_expiries(10**10, 100)]
+
+
+@pytest.mark.asyncio
+async def test_user_level_error_does_not_block_other_rows(db, vip_channel):
+    await _expired(1, 100)  # самый старый — первым в очереди
+    await _expired(2, 200)
+    bot = FakeBot({1: "Bad Request: user is an administrator of the chat"})
+
+    assert await expiry.run_expiry(bot, now=1000) == 2
+
+    assert bot.banned == [2]
+    assert await _pending() == []
+
+
+@pytest.mark.asyncio
+async def test_chat_level_error_aborts_pass_and_keeps_rows(db, vip_channel):
+    await _expired(1, 100)
+    await _expired(2, 200)
+    bot = FakeBot({1: "Bad Request: not enough rights to restrict/unrestrict chat member"})
+
+    with pytest.raises(TelegramBadRequest):
+        await expiry.run_expiry(bot, now=1000)
+
+    assert await _pending() == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_user_already_gone_counts_as_revoked(db, vip_channel):
+    await _expired(3, 100)
+    bot = FakeBot({3: "Bad Request: USER_NOT_PARTICIPANT"})
+
+    assert await expiry.run_expiry(bot, now=1000) == 1
+    assert await _pending() == []
@@ -0,0 +1,41 @@
+# tests/test_fsm_storage.py
+"""SQLiteStorage: несколько воркеров на одной БД видят изменения друг друга сразу."""
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from shared.db.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+@pytest.mark.asyncio
+async def test_write_through_workers_see_each_other(db):
+    a, b = SQLiteStorage(write_through=True), SQLiteStorage(write_through=True)
+    try:
+        await a.get_data(KEY)  # кеш A прогрет
+        await b.set_data(KEY, {"step": 1})
+        assert await a.get_data(KEY) == {"step": 1}
+
+        await a.update_data(KEY, {"step": 2})
+        await a.set_state(KEY, "Plan:text")
+        assert await b.get_data(KEY) == {"step": 2}
+        assert await b.get_state(KEY) == "Plan:text"
+    finally:
+        await a.close()
+        await b.close()
+
+
+@pytest.mark.asyncio
+async def test_single_worker_coalesces_writes(db):
+    storage = SQLiteStorage(write_through=False, flush_delay=60)
+    other = SQLiteStorage(write_through=True)
+    try:
+        for i in range(3):
+            await storage.update_data(KEY, {f"k{i}": i})
+        assert await storage.get_data(KEY) == {"k0": 0, "k1": 1, "k2": 2}
+        assert await other.get_data(KEY) == {}  # ещё не записано — ждёт окна склейки
+
+        await storage.close()  # close() сбрасывает отложенное
+        assert await other.get_data(KEY) == {"k0": 0, "k1": 1, "k2": 2}
+    finally:
+        await other.close()
@@ -0,0 +1,239 @@
+# tests/test_reconcile.py
+"""Сверка счетов (modules/payments/reconcile.py) против заглушки Crypto Pay API.
+
+getInvoices отдаёт aiohttp-сервер в том же цикле событий; БД — временный файл,
+выдача доступа подменена счётчиком (Telegram в тестах не нужен), реестр ботов —
+заглушками Tenant с отдельными файлами БД.
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+import modules.access as access
+from api import payments as payments_api
+from modules.payments import gateway, reconcile
+from modules.payments.providers import cryptobot
+from modules.payments.providers import close_providers
+from apps.bot_core.tenants import Tenant, TenantRegistry
+from shared.db import repo
+
+PLAN = "chat_10d"
+
+
+class CryptoPayStandIn:
+    """``GET /getInvoices`` по словарю ``invoices``; запоминает id каждого вызова."""
+
+    def __init__(self) -> None:
+        self.invoices: dict = {}
+        self.calls: list = []
+
+    def set(self, invoice_id: int, status: str, user_id: int) -> dict:
+        item = {
+            "invoice_id": invoice_id,
+            "status": status,
+            "asset": "USDT",
+            "amount": "9",
+            "payload": json.dumps({"user_id": user_id, "plan_code": PLAN}),
+        }
+        self.invoices[str(invoice_id)] = item
+        return item
+
+    async def get_invoices(self, request: web.Request) -> web.Response:
+        ids = request.query.get("invoice_ids", "").split(",")
+        self.calls.append(ids)
+        items = [self.invoices[i] for i in ids if i in self.invoices]
+        return web.json_response({"ok": True, "result": {"items": items}})
+
+
+class Grants:
+    """Подмена ``modules.access.grant``: считает выдачи (и боты, через которых они шли),
+    ``fail`` — следующая выдача падает."""
+
+    def __init__(self) -> None:
+        self.calls: list = []
+        self.bots: list = []
+        self.fail = False
+
+    async def __call__(self, user_id, plan_code, *, bot=None, lang=None):
+        if self.fail:
+            self.fail = False
+            raise RuntimeError("telegram is down")
+        self.calls.append((user_id, plan_code))
+        self.bots.append(bot)
+        return {"plan_code": plan_code, "days": 10}
+
+
+class _Request:
+    def __init__(self, payload: dict) -> None:
+        self._payload = payload
+
+    async def json(self) -> dict:
+        return self._payload
+
+
+def _tenant(bot_id: str, db_path: str) -> Tenant:
+    return Tenant(bot_id, SimpleNamespace(id=None, session=None), SimpleNamespace(bot_id=bot_id), db_path)
+
+
+@pytest_asyncio.fixture
+async def env(db, monkeypatch):
+    stand_in = CryptoPayStandIn()
+    app = web.Application()
+    app.router.add_get("/getInvoices", stand_in.get_invoices)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    monkeypatch.setattr(cryptobot, "CRYPTOBOT_API", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(cryptobot, "CRYPTOBOT_TOKEN", "test-token")
+    monkeypatch.setattr(reconcile, "RECONCILE_RATE", 1000.0)
+    monkeypatch.setattr(gateway, "_breakers", {})
+    monkeypatch.setattr(gateway, "_slots", {})
+    grants = Grants()
+    monkeypatch.setattr(access, "grant", grants)
+    registry = TenantRegistry(_tenant("main", db))
+    monkeypatch.setattr(payments_api, "_registry", lambda: registry)
+    try:
+        yield stand_in, grants, registry
+    finally:
+        await close_providers()
+        await runner.cleanup()
+
+
+async def _pending(invoice_id: int, user_id: int) -> None:
+    await repo.save_pending_invoice(user_id, str(invoice_id), PLAN, "USDT", f"paymem:{PLAN}", "Chat 10", 9.0, 10)
+
+
+async def _pending_ids() -> set:
+    return {r["invoice_id"] for r in await repo.list_pending_invoices(10_000)}
+
+
+@pytest.mark.asyncio
+async def test_get_invoices_is_called_with_at_most_100_ids(env):
+    stand_in, grants, _ = env
+    for i in range(1, 251):
+        await _pending(i, 1000 + i)
+        stand_in.set(i, "active", 1000 + i)
+
+    assert await reconcile.reconcile_once() == 250
+
+    assert sorted(len(ids) for ids in stand_in.calls) == [50, 100, 100]
+    assert sorted(int(i) for ids in stand_in.calls for i in ids) == list(range(1, 251))
+    assert len(await _pending_ids()) == 250  # active счета остаются открытыми
+    assert grants.calls == []
+
+
+@pytest.mark.asyncio
+async def test_paid_invoice_is_granted_exactly_once(env):
+    stand_in, grants, _ = env
+    await _pending(7, 42)
+    stand_in.set(7, "paid", 42)
+
+    await reconcile.reconcile_once()
+    await reconcile.reconcile_once()
+
+    assert grants.calls == [(42, PLAN)]
+    assert await _pending_ids() == set()
+
+
+@pytest.mark.asyncio
+async def test_failed_grant_restores_pending_row(env):
+    stand_in, grants, _ = env
+    await _pending(8, 43)
+    stand_in.set(8, "paid", 43)
+    grants.fail = True
+
+    await reconcile.reconcile_once()
+    assert grants.calls == []
+    assert await _pending_ids() == {"8"}
+
+    await reconcile.reconcile_once()  # следующий проход выдаёт доступ
+    assert grants.calls == [(43, PLAN)]
+    assert await _pending_ids() == set()
+
+
+@pytest.mark.asyncio
+async def test_late_webhook_after_reconciliation_is_deduplicated(env):
+    stand_in, grants, _ = env
+    await _pending(9, 44)
+    item = stand_in.set(9, "paid", 44)
+
+    await reconcile.reconcile_once()
+    result = await payments_api.cryptobot_webhook(_Request({"update_id": 1, "invoice": item}))
+
+    assert result["duplicate"] is True
+    assert grants.calls == [(44, PLAN)]
+    assert await _pending_ids() == set()
+
+
+@pytest.mark.asyncio
+async def test_webhook_failed_grant_restores_pending_row(env):
+    stand_in, grants, _ = env
+    await _pending(10, 45)
+    item = stand_in.set(10, "paid", 45)
+    grants.fail = True
+
+    result = await payments_api.cryptobot_webhook(_Request({"update_id": 2, "invoice": item}))
+    assert result.get("error")
+    assert await _pending_ids() == {"10"}
+
+    await reconcile.reconcile_once()  # сверка подбирает возвращённый счёт
+    assert grants.calls == [(45, PLAN)]
+    assert await _pending_ids() == set()
+
+
+@pytest.mark.asyncio
+async def test_payments_settle_in_the_paying_bots_tenant(env, tmp_path):
+    stand_in, grants, registry = env
+    main = registry.primary
+    other = _tenant("b", str(tmp_path / "b.sqlite"))
+    registry._by_id[other.bot_id] = other
+    with registry.use(other):
+        await repo.init_db()
+        await _pending(11, 46)
+        await _pending(12, 47)
+    await _pending(13, 48)  # счёт основного бота
+
+    def paid_by_b(invoice_id: int, user_id: int) -> dict:
+        item = stand_in.set(invoice_id, "paid", user_id)
+        item["payload"] = json.dumps({"user_id": user_id, "plan_code": PLAN, "bot_id": "b"})
+        return item
+
+    # вебхук: счёт и выдача — в контексте бота "b"
+    result = await payments_api.cryptobot_webhook(_Request({"update_id": 3, "invoice": paid_by_b(11, 46)}))
+    assert result["handled"] is True
+    assert grants.calls == [(46, PLAN)] and grants.bots == [other.bot]
+
+    # сверка бота "b" выдаёт через его Bot, поздний вебхук — дубликат в его БД
+    item = paid_by_b(12, 47)
+    with registry.use(other):
+        await reconcile.reconcile_once(other.bot)
+        assert await _pending_ids() == set()
+    result = await payments_api.cryptobot_webhook(_Request({"update_id": 4, "invoice": item}))
+    assert result["duplicate"] is True
+    assert grants.calls == [(46, PLAN), (47, PLAN)]
+    assert grants.bots == [other.bot, other.bot]
+
+    # БД основного бота не тронута
+    assert await _pending_ids() == {"13"}
+    assert main.db_path == repo.current_db_path()
+
+
+@pytest.mark.asyncio
+async def test_webhook_for_unknown_bot_is_ignored(env, tmp_path):
+    stand_in, grants, registry = env
+    registry._by_id["b"] = _tenant("b", str(tmp_path / "b.sqlite"))  # multi-режим
+    await _pending(14, 49)
+    item = stand_in.set(14, "paid", 49)
+    item["payload"] = json.dumps({"user_id": 49, "plan_code": PLAN, "bot_id": "gone"})
+
+    result = await payments_api.cryptobot_webhook(_Request({"update_id": 5, "invoice": item}))
+
+    assert result["handled"] is False
+    assert grants.calls == []
+    assert await _pending_ids() == {"14"}
@@ -10,6 +10,8 @@ from typing import Any, Dict, List
 from aiogram import Bot
 from shared.db import repo
 from shared.db.repo import _db
+from shared.utils.outbound import BULK
+from shared.utils.telegram import make_bot
 # END REGION AI
 
 # REGION AI: mailing worker
@@ -45,7 +47,7 @@ async def _select_users(segment: str) -> List[int]:
 async def main() -> None:
     if not TOKEN:
         raise RuntimeError("TELEGRAM_TOKEN required")
-    bot = Bot(TOKEN)
+    bot = make_bot(TOKEN, lane=BULK)  # рассылка уступает платежам бота
     try:
         while True:
             try: